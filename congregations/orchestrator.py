@@ -48,21 +48,20 @@ def ask(tank_id: str, prompt: str, context: str = "") -> str:
     name, traits = info['name'], info['traits']
     
     full_prompt = f"You are {name}, an AI. Traits: {traits}. Context: {context}. Question: {prompt}. Respond in 2-3 sentences as {name}:"
-    escaped = full_prompt.replace('"', '\\"').replace('\n', ' ')
-    
+    # Runs inside the tank, where /tank is src/explorer; the prompt goes in on stdin
     code = f'''
-import urllib.request, json
-data = json.dumps({{"model": "llama3.2:latest", "prompt": "{escaped}", "stream": False, "options": {{"num_predict": 100}}}}).encode()
-req = urllib.request.Request("http://digiquarium-ollama:11434/api/generate", data=data, headers={{"Content-Type": "application/json"}})
-try:
-    with urllib.request.urlopen(req, timeout=120) as r:
-        print(json.loads(r.read()).get("response", ""))
-except Exception as e:
-    print(f"[Error: {{e}}]")
+import sys
+sys.path.insert(0, "/tank")
+from inference import InferenceClient
+client = InferenceClient(caller={tank_id!r}, priority="congregation", route="ollama",
+                         ollama_url="http://digiquarium-ollama:11434", model="llama3.2:latest",
+                         timeout=120, options={{"num_predict": 100}}, profile="congregation-turn")
+timings = {{}}
+print(client.generate("", sys.stdin.read(), timings=timings) or f"[Error: {{timings.get('error', 'no response')}}]")
 '''
     
     try:
-        result = subprocess.run(['docker', 'exec', tank_id, 'python3', '-c', code],
+        result = subprocess.run(['docker', 'exec', '-i', tank_id, 'python3', '-c', code], input=full_prompt,
                               capture_output=True, text=True, timeout=150)
         return result.stdout.strip() or "[No response]"
     except:
@@ -39,6 +39,7 @@ import sys
 import json
 import subprocess
 import time
+import urllib.request
 from pathlib import Path
 from datetime import datetime
 
@@ -48,6 +49,7 @@ LOG_FILE = DAEMONS_DIR / 'supervisor.log'
 OLLAMA_HEALTH_FILE = Path(DIGIQUARIUM_HOME) / 'shared' / '.ollama_health'
 OLLAMA_FAILURE_TRACKER = Path(DIGIQUARIUM_HOME) / 'shared' / '.ollama_failure_count'
 OLLAMA_CRASH_LOG = Path(DIGIQUARIUM_HOME) / 'logs' / 'ollama' / 'ollama_crashes.log'
+INFERENCE_PROXY_URL = os.environ.get('INFERENCE_PROXY_URL', 'http://127.0.0.1:8100')
 
 # All 21 continuous daemons that MUST be running
 CONTINUOUS_DAEMONS = [
@@ -82,11 +84,13 @@ CONTINUOUS_DAEMONS = [
 # All 17 tank containers
 TANK_CONTAINERS = [f'tank-{i:02d}' for i in range(1, 18)]
 
-# Python one-liner for inference test (runs inside tank container which has python but no curl)
+# Python one-liner for inference test (runs inside tank container which has python but no curl).
+# "idempotent" and "profile" are for the inference proxy's Ollama API (one generation
+# for concurrent probes, health-probe settings); Ollama itself ignores them.
 INFERENCE_TEST_SCRIPT = """
 import urllib.request, json, sys
 try:
-    data = json.dumps({"model":"llama3.2:latest","prompt":"Say OK","stream":False,"options":{"num_predict":3}}).encode()
+    data = json.dumps({"model":"llama3.2:latest","prompt":"Say OK","stream":False,"options":{"num_predict":3},"idempotent":True,"profile":"health-probe"}).encode()
     req = urllib.request.Request("http://digiquarium-ollama:11434/api/generate", data=data, headers={"Content-Type":"application/json"})
     with urllib.request.urlopen(req, timeout=30) as r:
         resp = json.loads(r.read())
@@ -360,6 +364,17 @@ def check_ollama_api():
         return False
 
 
+def check_ollama_traffic():
+    """Ollama's state judged from the inference proxy's newest real traffic
+    (GET /v1/stats): 'ok' (answered lately), 'failing' (its last few calls
+    failed), 'idle', or None if the proxy can't be asked."""
+    try:
+        with urllib.request.urlopen(f'{INFERENCE_PROXY_URL}/v1/stats', timeout=5) as r:
+            return json.loads(r.read())['health']['backends']['ollama']['state']
+    except Exception:
+        return None
+
+
 def check_ollama_inference():
     """Do a real inference test via a temporary tank container (has python, no curl)."""
     try:
@@ -381,7 +396,9 @@ def check_ollama():
     Three-layer check:
     1. Docker container running?
     2. Ollama process responding? (via docker exec)
-    3. Can it actually generate text? (every 5th check to reduce load)
+    3. Can it actually generate text? Judged from the inference proxy's
+       real traffic; a test generation (every 5th check) only when there
+       was none to judge by
     
     Tracks consecutive failures. After 5 consecutive failures (5 minutes),
     logs a CRITICAL alert and attempts restart via docker compose.
@@ -402,10 +419,12 @@ def check_ollama():
         if failure_reason is None and not check_ollama_api():
             failure_reason = "Ollama not responding (container running)"
         
-        # Layer 3: Inference test (every 5th minute to reduce load)
+        # Layer 3: Real traffic, else an inference test (every 5th minute to reduce load)
         if failure_reason is None:
-            minute = datetime.now().minute
-            if minute % 5 == 0:
+            traffic = check_ollama_traffic()
+            if traffic == 'failing':
+                failure_reason = "Inference failing (the last few Ollama calls through the proxy failed in a row)"
+            elif traffic != 'ok' and datetime.now().minute % 5 == 0:
                 if not check_ollama_inference():
                     failure_reason = "Inference test failed (ollama responds but can't generate)"
 
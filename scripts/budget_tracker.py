@@ -1,111 +1,98 @@
 #!/usr/bin/env python3
 """
 Budget Tracker — Tracks inference API usage per tank per provider.
-Reads inference proxy logs to calculate usage. Outputs JSON report.
+Reads the daily usage files the inference proxy writes (its accounting,
+see src/inference-proxy/accounting.py). Outputs JSON report.
 
 Usage:
     python3 scripts/budget_tracker.py              # Full report
     python3 scripts/budget_tracker.py --summary    # Summary only
+    python3 scripts/budget_tracker.py --days 7     # Last 7 days (default: today)
 """
-import os, sys, json, re
+import os, sys, json
 from datetime import datetime, timedelta
 from pathlib import Path
 from collections import defaultdict
 
 DIGIQUARIUM = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
 PROXY_LOG = DIGIQUARIUM / 'logs' / 'inference-proxy'
+ACCOUNTING = Path(os.environ.get('PROXY_ACCOUNTING_DIR', PROXY_LOG / 'accounting'))
 OUTPUT = DIGIQUARIUM / 'logs' / 'budget'
 OUTPUT.mkdir(parents=True, exist_ok=True)
 
-# Approximate token costs (free tier, but tracking for when we scale)
+# Approximate cost per million tokens (free tier, but tracking for when we scale)
 COSTS = {
     'cerebras': 0.0,  # Free tier
     'groq': 0.0,      # Free tier
     'ollama': 0.0,    # Local
 }
 
+COUNTERS = ('requests', 'errors', 'prompt_tokens', 'completion_tokens', 'latency_seconds')
 
-def scan_proxy_logs():
-    """Scan inference proxy container logs for usage data."""
-    import subprocess
-    result = subprocess.run(
-        ['docker', 'logs', 'digiquarium-inference-proxy', '--since', '24h'],
-        capture_output=True, text=True, timeout=30
-    )
-    
-    usage = defaultdict(lambda: defaultdict(int))
-    provider_totals = defaultdict(int)
-    
-    for line in result.stdout.splitlines() + result.stderr.splitlines():
-        # Look for provider usage patterns
-        # Typical log: "2026-04-05 22:00:00 [cerebras-key3] tank-01-adam 200 OK"
-        m = re.search(r'\[(\w+?)(?:-key\d+)?\].*?(tank-\d+-\w+)', line)
-        if m:
-            provider = m.group(1).lower()
-            tank = m.group(2)
-            usage[tank][provider] += 1
-            provider_totals[provider] += 1
-        
-        # Also match simpler patterns
-        for provider in ['cerebras', 'groq', 'ollama']:
-            if provider in line.lower():
-                provider_totals[provider] += 1
-                break
-    
-    return dict(usage), dict(provider_totals)
 
-
-def scan_tank_activity():
-    """Count brain entries per tank in last 24h as a proxy for inference usage."""
-    activity = {}
-    cutoff = datetime.now() - timedelta(hours=24)
-    cutoff_str = cutoff.strftime('%Y-%m-%d')
-    
-    logs_dir = DIGIQUARIUM / 'logs'
-    for d in sorted(logs_dir.iterdir()):
-        if not d.name.startswith('tank-'):
+def read_usage(days=1):
+    """The proxy's usage files for the last `days` days, oldest first."""
+    since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    files = []
+    for path in sorted(ACCOUNTING.glob('usage-*.json')):
+        if path.stem[len('usage-'):] < since:
             continue
-        brain = d / 'brain.md'
-        if not brain.exists():
-            continue
-        
-        today_entries = 0
-        total_entries = 0
-        for line in brain.read_text(encoding='utf-8', errors='replace').splitlines():
-            if line.startswith('['):
-                total_entries += 1
-                if cutoff_str in line:
-                    today_entries += 1
-        
-        if total_entries > 0:
-            activity[d.name] = {
-                'entries_24h': today_entries,
-                'entries_total': total_entries,
-            }
-    
-    return activity
+        try:
+            files.append(json.loads(path.read_text()))
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path.name}: {e}")
+    return files
 
 
-def generate_report():
+def add_counters(total, counters):
+    for name in COUNTERS:
+        total[name] += counters.get(name, 0)
+
+
+def tally(files):
+    """Sum the files: per tank per provider, per provider, per provider key."""
+    usage = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+    providers = defaultdict(lambda: defaultdict(float))
+    keys = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+    for data in files:
+        for tank, by_provider in data.get('callers', {}).items():
+            for provider, counters in by_provider.items():
+                add_counters(usage[tank][provider], counters)
+                add_counters(providers[provider], counters)
+        for provider, by_key in data.get('providers', {}).items():
+            for key, counters in by_key.items():
+                add_counters(keys[provider][key], counters)
+    plain = lambda d: json.loads(json.dumps(d))
+    return plain(usage), plain(providers), plain(keys)
+
+
+def tokens(counters):
+    return int(counters.get('prompt_tokens', 0) + counters.get('completion_tokens', 0))
+
+
+def generate_report(days=1):
     """Generate a comprehensive budget/usage report."""
-    print("Scanning proxy logs...")
-    proxy_usage, provider_totals = scan_proxy_logs()
-    
-    print("Scanning tank activity...")
-    tank_activity = scan_tank_activity()
+    print(f"Reading proxy usage from {ACCOUNTING}...")
+    files = read_usage(days)
+    proxy_usage, provider_totals, key_totals = tally(files)
+    # Budgets as of the latest file (today's, if the proxy has written one)
+    budgets = files[-1].get('budgets', {}) if files else {}
     
     report = {
         'timestamp': datetime.now().isoformat(),
-        'period': 'last_24h',
+        'period': 'today' if days == 1 else f'last_{days}_days',
+        'days': [f.get('day') for f in files],
         'provider_totals': provider_totals,
-        'tank_activity': tank_activity,
+        'key_totals': key_totals,
         'proxy_usage_by_tank': proxy_usage,
+        'budgets': budgets,
         'costs': COSTS,
         'summary': {
-            'total_tanks_active': len([t for t in tank_activity.values() if t['entries_24h'] > 0]),
-            'total_entries_24h': sum(t['entries_24h'] for t in tank_activity.values()),
-            'total_entries_all_time': sum(t['entries_total'] for t in tank_activity.values()),
-            'total_inference_calls': sum(provider_totals.values()),
+            'total_tanks_active': len([t for t in proxy_usage if t.startswith('tank-')]),
+            'total_callers': len(proxy_usage),
+            'total_inference_calls': int(sum(p['requests'] for p in provider_totals.values())),
+            'total_errors': int(sum(p['errors'] for p in provider_totals.values())),
+            'total_tokens': sum(tokens(p) for p in provider_totals.values()),
         }
     }
     
@@ -121,28 +108,41 @@ def print_summary(report):
     """Print a human-readable summary."""
     s = report['summary']
     print(f"\n{'='*50}")
-    print(f"BUDGET REPORT — {report['timestamp'][:19]}")
+    print(f"BUDGET REPORT — {report['timestamp'][:19]} ({report['period']})")
     print(f"{'='*50}")
-    print(f"Active tanks (24h):     {s['total_tanks_active']}")
-    print(f"Brain entries (24h):    {s['total_entries_24h']}")
-    print(f"Brain entries (total):  {s['total_entries_all_time']}")
-    print(f"Inference calls (24h):  {s['total_inference_calls']}")
+    if not report['days']:
+        print(f"No usage files under {ACCOUNTING}")
+    print(f"Active tanks:           {s['total_tanks_active']}")
+    print(f"Callers:                {s['total_callers']}")
+    print(f"Inference calls:        {s['total_inference_calls']} ({s['total_errors']} failed)")
+    print(f"Tokens:                 {s['total_tokens']}")
     print(f"\nProvider breakdown:")
-    for provider, count in sorted(report['provider_totals'].items()):
-        cost = COSTS.get(provider, 0) * count
-        print(f"  {provider}: {count} calls (${cost:.2f})")
-    print(f"\nTop tanks by 24h activity:")
+    for provider, counters in sorted(report['provider_totals'].items()):
+        cost = COSTS.get(provider, 0) * tokens(counters) / 1e6
+        latency = counters['latency_seconds'] / counters['requests'] if counters['requests'] else 0
+        print(f"  {provider}: {int(counters['requests'])} calls, {tokens(counters)} tokens, "
+              f"{latency:.1f}s avg (${cost:.2f})")
+    print("\nTop callers by tokens:")
     sorted_tanks = sorted(
-        report['tank_activity'].items(),
-        key=lambda x: -x[1]['entries_24h']
+        report['proxy_usage_by_tank'].items(),
+        key=lambda x: -sum(tokens(c) for c in x[1].values())
     )
-    for tank, data in sorted_tanks[:10]:
-        if data['entries_24h'] > 0:
-            print(f"  {tank}: {data['entries_24h']} entries today / {data['entries_total']} total")
+    for tank, by_provider in sorted_tanks[:10]:
+        split = ', '.join(f"{p} {tokens(c)}" for p, c in sorted(by_provider.items()))
+        print(f"  {tank}: {sum(tokens(c) for c in by_provider.values())} tokens ({split})")
+    over = [(name, b) for name, b in report['budgets'].get('callers', {}).items()
+            if b['used'] >= b['budget']]
+    over += [(name, b) for name, b in report['budgets'].get('providers', {}).items()
+             if b['used'] >= b['budget']]
+    if over:
+        print("\nOver daily budget:")
+        for name, b in over:
+            print(f"  {name}: {b['used']} / {b['budget']:.0f} tokens")
     print(f"{'='*50}")
 
 
 if __name__ == '__main__':
-    report = generate_report()
+    days = int(sys.argv[sys.argv.index('--days') + 1]) if '--days' in sys.argv else 1
+    report = generate_report(days)
     if '--summary' in sys.argv or True:  # Always show summary
         print_summary(report)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+EXPLORE MODE REPORT
+===================
+Articles per hour and random-fallback rate per tank and EXPLORE_MODE, from
+the thinking traces tanks/*/explore.py write. A fallback is an article
+whose next link was picked at random because the model's answer named none
+of the offered links (or there was no answer).
+
+Articles per hour counts only active time: gaps between traces longer than
+--gap minutes (tank stopped, Ollama down) are left out.
+
+Usage:
+    python3 scripts/explore_mode_report.py
+    python3 scripts/explore_mode_report.py tank-01-adam tank-02-eve --days 3
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+DIGIQUARIUM_DIR = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
+LOGS_DIR = DIGIQUARIUM_DIR / 'logs'
+
+
+def read_traces(tank_dir, since):
+    """(time, mode, fallback, calls) per trace that records its mode."""
+    traces = []
+    for path in sorted((tank_dir / 'thinking_traces').glob('*.jsonl')):
+        if path.stem < since:
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    trace = json.loads(line)
+                    when = datetime.fromisoformat(trace.get('timestamp') or trace['ts'])
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    continue
+                if 'mode' in trace:
+                    traces.append((when, trace['mode'], trace.get('fallback', False),
+                                   len(trace.get('timings') or [])))
+    return sorted(traces)
+
+
+def mode_totals(traces, gap):
+    """Per mode: articles, fallbacks, LLM calls and active seconds."""
+    totals = {}
+    previous = None
+    for when, mode, fallback, calls in traces:
+        t = totals.setdefault(mode, {'articles': 0, 'fallbacks': 0, 'calls': 0, 'seconds': 0.0})
+        t['articles'] += 1
+        t['fallbacks'] += bool(fallback)
+        t['calls'] += calls
+        if previous and previous[1] == mode and (when - previous[0]).total_seconds() <= gap:
+            t['seconds'] += (when - previous[0]).total_seconds()
+        previous = (when, mode)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tanks', nargs='*', help='tank log directories (default: all)')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--gap', type=float, default=10, help='minutes between traces that count as a pause')
+    args = parser.parse_args()
+
+    since = (datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+    tanks = args.tanks or sorted(p.name for p in LOGS_DIR.iterdir() if (p / 'thinking_traces').is_dir())
+    if not tanks:
+        print(f"No thinking traces under {LOGS_DIR}")
+        sys.exit(1)
+
+    print(f"{'tank':<28} {'mode':<9} {'articles':>8} {'per hour':>9} {'fallback':>9} {'calls/art':>10}")
+    for tank in tanks:
+        for mode, t in sorted(mode_totals(read_traces(LOGS_DIR / tank, since), args.gap * 60).items()):
+            per_hour = t['articles'] * 3600 / t['seconds'] if t['seconds'] else 0
+            print(f"{tank:<28} {mode:<9} {t['articles']:>8} {per_hour:>9.1f} "
+                  f"{t['fallbacks'] / t['articles']:>8.1%} {t['calls'] / t['articles']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
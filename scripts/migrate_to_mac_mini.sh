@@ -59,6 +59,10 @@ rsync -avz --progress \
 echo "[6/7] Building Docker images on Mac Mini..."
 ssh "$MAC_MINI" "cd $REMOTE_DIR && docker build -t digiquarium-tank:latest -f Dockerfile.tank ." || echo "WARN: Tank image build failed — check Dockerfile exists"
 ssh "$MAC_MINI" "cd $REMOTE_DIR/src/inference-proxy && docker build -t digiquarium-inference-proxy:latest ." || echo "WARN: Proxy image build failed"
+# The Ollama queue runs from the proxy image; tanks fall back to the flock without it
+ssh "$MAC_MINI" "cd $REMOTE_DIR && docker compose up -d ollama-queue" || echo "WARN: Ollama queue failed to start"
+# The article cache runs from the tank image; tanks read kiwix themselves without it
+ssh "$MAC_MINI" "cd $REMOTE_DIR && docker compose up -d article-cache" || echo "WARN: Article cache failed to start"
 
 # Step 7: Verify
 echo "[7/7] Verification..."
@@ -70,7 +74,7 @@ echo ""
 echo "=== MIGRATION COMPLETE ==="
 echo "Next steps on Mac Mini:"
 echo "  1. cd $REMOTE_DIR"
-echo "  2. docker compose up -d  (start infra + tanks)"
+echo "  2. docker compose up -d  (start infra, the Ollama queue, the article cache and tanks)"
 echo "  3. bash scripts/start_rust_services.sh  (after compiling Rust)"
 echo "  4. source ~/.cargo/env && cd src/openfang && cargo build"
 echo "  5. Verify: docker ps | grep tank"
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+PROMPT EVAL REPORT
+==================
+Ollama's prompt evaluation per tank and day, from the `timings` the
+explorers write into their thinking traces (prompt_eval_count counts only
+the tokens that missed Ollama's prompt cache).
+
+To compare prompt layouts, run a tank for a day with MEMORY_REFRESH_TURNS=1
+(memory re-read every turn, so the prefix changes every call) and compare
+against the default.
+
+Usage:
+    python3 scripts/prompt_eval_report.py
+    python3 scripts/prompt_eval_report.py tank-01-adam --days 7
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+DIGIQUARIUM_DIR = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
+LOGS_DIR = DIGIQUARIUM_DIR / 'logs'
+
+
+def call_timings(trace):
+    """Per-call timings from a trace: a list in tanks/*/explore.py, one dict
+    per article in src/explorer."""
+    timings = trace.get('timings') or []
+    return timings if isinstance(timings, list) else [timings]
+
+
+def day_totals(tank_dir, since):
+    days = {}
+    for path in sorted((tank_dir / 'thinking_traces').glob('*.jsonl')):
+        if path.stem < since:
+            continue
+        totals = days.setdefault(path.stem, {'calls': 0, 'tokens': 0, 'ms': 0.0})
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    trace = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for t in call_timings(trace):
+                    totals['calls'] += 1
+                    totals['tokens'] += t.get('prompt_eval_count', 0)
+                    totals['ms'] += t.get('prompt_eval_ms', 0)
+    return {day: t for day, t in days.items() if t['calls']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tanks', nargs='*', help='tank log directories (default: all)')
+    parser.add_argument('--days', type=int, default=14)
+    args = parser.parse_args()
+
+    since = (datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+    tanks = args.tanks or sorted(p.name for p in LOGS_DIR.iterdir() if (p / 'thinking_traces').is_dir())
+    if not tanks:
+        print(f"No thinking traces under {LOGS_DIR}")
+        sys.exit(1)
+
+    print(f"{'tank':<28} {'day':<11} {'calls':>6} {'tokens/call':>12} {'ms/call':>9}")
+    for tank in tanks:
+        for day, t in day_totals(LOGS_DIR / tank, since).items():
+            print(f"{tank:<28} {day:<11} {t['calls']:>6} {t['tokens'] / t['calls']:>12.0f} {t['ms'] / t['calls']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
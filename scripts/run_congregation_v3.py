@@ -23,18 +23,19 @@ Usage:
 import os
 import sys
 import json
-import time
-import urllib.request
 from datetime import datetime, timedelta
 from pathlib import Path
 from collections import Counter
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src' / 'explorer'))
+from inference import InferenceClient
+
 DIGIQUARIUM_DIR = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
 LOGS_DIR = DIGIQUARIUM_DIR / 'logs'
 CONGREGATION_DIR = LOGS_DIR / 'congregations'
 CONGREGATION_DIR.mkdir(parents=True, exist_ok=True)
 
-PROXY_URL = "http://127.0.0.1:8100/v1/generate"
+PROXY_URL = "http://127.0.0.1:8100"
 MAX_DURATION_MINUTES = 90
 SUMMARY_GATE_INTERVAL = 5
 MAX_RETRIES = 3
@@ -84,27 +85,18 @@ def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}", flush=True)
 
 
-def call_inference(system_prompt, user_prompt, timeout=60):
-    """Call inference proxy with retry."""
-    for attempt in range(MAX_RETRIES):
-        try:
-            data = json.dumps({
-                'system': system_prompt,
-                'prompt': user_prompt,
-                'timeout': timeout
-            }).encode()
-            req = urllib.request.Request(PROXY_URL, data=data,
-                                        headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req, timeout=90) as r:
-                result = json.loads(r.read().decode())
-            response = result.get('response', '').strip()
-            if response:
-                return response
-        except Exception as e:
-            log(f"      Inference attempt {attempt+1}/{MAX_RETRIES}: {e}")
-        if attempt < MAX_RETRIES - 1:
-            time.sleep(RETRY_BACKOFF * (attempt + 1))
-    return "[Inference unavailable after retries]"
+def call_inference(system_prompt, user_prompt, timeout=60, caller='congregation'):
+    """Call inference proxy with retry. One deadline covers every attempt."""
+    client = InferenceClient(caller=caller, priority='congregation', route='proxy-only',
+                             proxy_url=PROXY_URL, retries=MAX_RETRIES - 1, backoff=RETRY_BACKOFF,
+                             hedge=True,  # Turns are sequential; one slow reply stalls the debate
+                             profile='congregation-turn')
+    timings = {}
+    response = client.generate(system_prompt, user_prompt, timeout=timeout * MAX_RETRIES,
+                               timings=timings).strip()
+    if not response:
+        log(f"      Inference failed after {timings.get('attempts', 0)} attempts: {timings.get('error', 'empty response')}")
+    return response or "[Inference unavailable after retries]"
 
 
 def load_personality(tank_id):
@@ -286,7 +278,7 @@ def run_congregation(topic, participants, rounds=10):
                 )
             
             log(f"   {name} thinking...")
-            response = call_inference(system_prompt, user_prompt)
+            response = call_inference(system_prompt, user_prompt, caller=tank_id)
             log(f"   {name}: {response[:80]}...")
             
             entry = {
@@ -347,7 +339,7 @@ def run_congregation(topic, participants, rounds=10):
         )
         
         log(f"   {name} closing...")
-        response = call_inference(system_prompt, user_prompt)
+        response = call_inference(system_prompt, user_prompt, caller=tank_id)
         log(f"   {name}: {response[:80]}...")
         
         transcript.append({
@@ -30,6 +30,9 @@ from pathlib import Path
 import urllib.request
 import urllib.error
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from shared.utils import inference_health
+
 # ============================================================================
 # ENVIRONMENT CONFIGURATION
 # ============================================================================
@@ -383,11 +386,24 @@ class OllamaWatcher:
             return False
 
     def check_end_to_end(self) -> bool:
-        """Check if a tank can reach Ollama through the proxy."""
+        """Check if a tank can reach Ollama through the proxy. Passive first:
+        the inference proxy's Ollama calls go the tanks' way, so its verdict
+        on the newest real traffic stands; only when there was none lately
+        (or the proxy can't be asked) is a tank made to probe."""
         if not self.breaker_e2e.can_attempt():
             self.log('WARNING', f'E2E circuit breaker is {self.breaker_e2e.state}, skipping check')
             return False
 
+        passive = inference_health('ollama')
+        if passive and passive['state'] != 'idle':
+            if passive['state'] == 'ok':
+                self.breaker_e2e.record_success()
+                return True
+            self.log('WARNING', f"Inference proxy: the last {passive['failed_in_a_row']} "
+                                f"Ollama calls failed")
+            self.breaker_e2e.record_failure()
+            return False
+
         try:
             result = subprocess.run([
                 'docker', 'exec', 'tank-01-adam', 'python3', '-c',
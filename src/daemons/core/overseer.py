@@ -38,6 +38,9 @@ from email.mime.multipart import MIMEMultipart
 from collections import defaultdict
 import urllib.request
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from shared.utils import inference_health
+
 DIGIQUARIUM_DIR = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
 DAEMONS_DIR = DIGIQUARIUM_DIR / 'daemons'
 LOGS_DIR = DIGIQUARIUM_DIR / 'logs'
@@ -371,7 +374,15 @@ class TheOverseer:
             result['healthy'] = False
             result['issues'].append(f'Cannot check proxy container: {e}')
         
-        # End-to-end test
+        # End-to-end: judged by the inference proxy's real Ollama traffic,
+        # probed from a tank only when there was none lately
+        passive = inference_health('ollama')
+        if passive and passive['state'] != 'idle':
+            if passive['state'] != 'ok':
+                result['healthy'] = False
+                result['issues'].append(f"Ollama failing real traffic (last "
+                                        f"{passive['failed_in_a_row']} calls failed)")
+            return result
         try:
             e2e = subprocess.run([
                 'docker', 'exec', 'tank-01-adam', 'python3', '-c',
@@ -9,12 +9,13 @@ This is the src/ copy used during development and by the
 Docker-based daemon supervisor. It mirrors daemons/translator/translator.py.
 """
 import os, sys, time, json, fcntl
-import urllib.request
 from datetime import datetime
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from shared.utils import DaemonLogger, run_command, write_pid_file
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'explorer'))
+from inference import InferenceClient
 
 DIGIQUARIUM_DIR = Path(os.environ.get('DIGIQUARIUM_HOME', '/home/ijneb/digiquarium'))
 LOGS_DIR = DIGIQUARIUM_DIR / 'logs'
@@ -35,6 +36,12 @@ LANGUAGE_TANKS = {
 # Track how far we've read into each file (file path -> byte offset)
 file_positions = {}
 
+# The same strings turn up in many traces: with OLLAMA_URL pointed at the
+# inference proxy, identical ones in flight share one generation
+CLIENT = InferenceClient(caller='translator', priority='batch', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=60, options={'num_predict': 250},
+                         idempotent=True, profile='translation')
+
 
 def translate_via_ollama(text: str, source_lang: str) -> str:
     """Translate text to English using Ollama."""
@@ -47,26 +54,9 @@ def translate_via_ollama(text: str, source_lang: str) -> str:
         f"Output ONLY the translation, nothing else:\n\n{text}"
     )
 
-    try:
-        payload = json.dumps({
-            'model': OLLAMA_MODEL,
-            'prompt': prompt,
-            'stream': False,
-            'options': {'num_predict': 250}
-        }).encode()
-
-        req = urllib.request.Request(
-            f'{OLLAMA_URL}/api/generate',
-            data=payload,
-            headers={'Content-Type': 'application/json'},
-        )
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            data = json.loads(resp.read())
-            translation = data.get('response', '').strip().replace('\n', ' ').strip()
-            if translation and len(translation) > 3:
-                return translation
-    except Exception:
-        pass
+    translation = CLIENT.generate('', prompt).strip().replace('\n', ' ').strip()
+    if translation and len(translation) > 3:
+        return translation
 
     return f"[{source_lang}] {text}"
 
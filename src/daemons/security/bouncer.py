@@ -32,13 +32,15 @@ import signal
 import fcntl
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, List, Tuple
+from typing import Iterator, Optional, Dict, List, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 import secrets
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from shared.utils import DaemonLogger, run_command, write_pid_file
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'explorer'))
+from inference import InferenceClient
 
 # Configuration
 DIGIQUARIUM_DIR = Path(os.environ.get("DIGIQUARIUM_HOME", "/home/ijneb/digiquarium"))
@@ -70,6 +72,12 @@ COOLDOWN_MINUTES = 10
 # Daemon cycle interval
 CHECK_INTERVAL = 30  # seconds - continuous monitoring
 
+# Inference
+INFERENCE_PROXY_URL = os.environ.get("INFERENCE_PROXY_URL", "http://127.0.0.1:8100")
+# Streamed replies hold back this many characters until more text arrives,
+# so outbound redaction never shows half of a sensitive phrase
+OUTBOUND_HOLDBACK = 24
+
 # Content Filtering
 BLOCKED_PATTERNS = {
     "prompt_injection": [
@@ -491,6 +499,84 @@ class Bouncer:
         Process a visitor message through all security layers.
         Returns: (success, status_message, specimen_response_or_none)
         """
+        ok, status, session = self._accept_message(session_id, message)
+        if not ok:
+            return False, status, None
+        
+        # Generate specimen response (placeholder - would call actual specimen)
+        specimen_response = self.get_specimen_response(session, message)
+        
+        # Filter outbound
+        allowed, filtered_response = self.filter_outbound(specimen_response)
+        
+        # Check distress
+        is_distressed, distress_score = self.check_specimen_distress(filtered_response)
+        if is_distressed:
+            session.distress_flags += 1
+            self.log_event(session, "distress_detected", {"score": distress_score})
+            
+            if session.distress_flags >= 2:
+                self.end_session(session_id, "specimen_distress")
+                return False, "Session ended: Specimen needs rest.", None
+        
+        self._store_response(session, filtered_response)
+        return True, "OK", filtered_response
+    
+    def process_message_stream(self, session_id: str, message: str) -> Iterator[dict]:
+        """
+        Streaming process_message: same inbound layers, then yields
+        {"delta": text} events as the specimen speaks and a final
+        {"done": True, "ok": ..., "message": ..., "response": ...} event.
+        
+        filter_outbound runs on the growing text and only the stable part is
+        released: the last OUTBOUND_HOLDBACK characters stay back until more
+        text arrives, so a redaction pattern split across chunks is never
+        half-shown. Distress is checked on every chunk and cuts the stream
+        as soon as the session has to end.
+        """
+        ok, status, session = self._accept_message(session_id, message)
+        if not ok:
+            yield {"done": True, "ok": False, "message": status, "response": None}
+            return
+        
+        raw = ""
+        sent = 0
+        flagged = False
+        chunks = self.stream_specimen_response(session, message)
+        try:
+            for chunk in chunks:
+                raw += chunk
+                _, filtered = self.filter_outbound(raw.lstrip())
+                
+                is_distressed, distress_score = self.check_specimen_distress(filtered)
+                if is_distressed and not flagged:
+                    flagged = True
+                    session.distress_flags += 1
+                    self.log_event(session, "distress_detected", {"score": distress_score})
+                    if session.distress_flags >= 2:
+                        self.end_session(session_id, "specimen_distress")
+                        yield {"done": True, "ok": False,
+                               "message": "Session ended: Specimen needs rest.", "response": None}
+                        return
+                
+                stable = len(filtered) - OUTBOUND_HOLDBACK
+                if stable > sent:
+                    yield {"delta": filtered[sent:stable]}
+                    sent = stable
+        finally:
+            chunks.close()
+        
+        _, filtered = self.filter_outbound(raw.strip() or "[No response generated]")
+        # Emitted text is always a prefix of this unless the reply ended in a
+        # long run of whitespace, which strip() drops
+        if len(filtered) > sent:
+            yield {"delta": filtered[sent:]}
+        self._store_response(session, filtered)
+        yield {"done": True, "ok": True, "message": "OK", "response": filtered}
+    
+    def _accept_message(self, session_id: str, message: str) -> Tuple[bool, str, Optional[VisitorSession]]:
+        """Inbound layers: session state, timeouts, filtering, counters.
+        Returns (accepted, status_message, session)."""
         if session_id not in self.sessions:
             return False, "Session not found.", None
         
@@ -541,36 +627,18 @@ class Bouncer:
             "timestamp": datetime.now().isoformat(),
             "filter_result": filter_result.value
         })
-        
-        # Generate specimen response (placeholder - would call actual specimen)
-        specimen_response = self.get_specimen_response(session, message)
-        
-        # Filter outbound
-        allowed, filtered_response = self.filter_outbound(specimen_response)
-        
-        # Check distress
-        is_distressed, distress_score = self.check_specimen_distress(filtered_response)
-        if is_distressed:
-            session.distress_flags += 1
-            self.log_event(session, "distress_detected", {"score": distress_score})
-            
-            if session.distress_flags >= 2:
-                self.end_session(session_id, "specimen_distress")
-                return False, "Session ended: Specimen needs rest.", None
-        
-        # Store response
+        return True, "OK", session
+    
+    def _store_response(self, session: VisitorSession, response: str):
+        """Store a filtered specimen response in the session."""
         session.messages.append({
             "role": "specimen",
-            "content": filtered_response,
+            "content": response,
             "timestamp": datetime.now().isoformat()
         })
-        
-        return True, "OK", filtered_response
     
-    def get_specimen_response(self, session: VisitorSession, message: str) -> str:
-        """Get response from specimen via inference proxy with personality context."""
-        import urllib.request as _req
-        
+    def _specimen_prompts(self, session: VisitorSession, message: str) -> Tuple[str, str]:
+        """Build (system_prompt, user_prompt) with personality context."""
         # Load personality context from brain.md + soul.md
         tank_dir = LOGS_DIR / session.tank_id
         brain = ""
@@ -599,24 +667,37 @@ class Bouncer:
             history += f"{role}: {msg.get('content', '')}\n"
         
         user_prompt = f"{history}Visitor: {message}\n{session.specimen_name}:"
-        
-        try:
-            data = json.dumps({
-                "system": system_prompt,
-                "prompt": user_prompt,
-                "timeout": 60
-            }).encode()
-            req = _req.Request(
-                "http://127.0.0.1:8100/v1/generate",
-                data=data,
-                headers={"Content-Type": "application/json"}
-            )
-            with _req.urlopen(req, timeout=90) as r:
-                result = json.loads(r.read().decode())
-            return result.get("response", "").strip() or "[No response generated]"
-        except Exception as e:
-            self.log.error(f"Inference failed for {session.specimen_name}: {e}")
+        return system_prompt, user_prompt
+    
+    def _client(self, session: VisitorSession) -> InferenceClient:
+        # A visitor is waiting on the reply: hedge, and no local Ollama fallback
+        return InferenceClient(caller=session.tank_id, priority="visitor", route="proxy-only",
+                               proxy_url=INFERENCE_PROXY_URL, hedge=True, timeout=60,
+                               profile="visitor-chat")
+    
+    def get_specimen_response(self, session: VisitorSession, message: str) -> str:
+        """Get response from specimen via inference proxy with personality context."""
+        system_prompt, user_prompt = self._specimen_prompts(session, message)
+        timings = {}
+        response = self._client(session).generate(system_prompt, user_prompt, timings=timings)
+        if "error" in timings and not response:
+            self.log.error(f"Inference failed for {session.specimen_name}: {timings['error']}")
             return f"[{session.specimen_name} is thinking... please try again in a moment]"
+        return response.strip() or "[No response generated]"
+    
+    def stream_specimen_response(self, session: VisitorSession, message: str) -> Iterator[str]:
+        """Like get_specimen_response, but yields text chunks as the proxy
+        streams them (NDJSON from /v1/generate?stream=1)."""
+        system_prompt, user_prompt = self._specimen_prompts(session, message)
+        timings = {}
+        produced = False
+        for delta in self._client(session).stream(system_prompt, user_prompt, timings=timings):
+            produced = True
+            yield delta
+        if "error" in timings:
+            self.log.error(f"Streaming inference failed for {session.specimen_name}: {timings['error']}")
+        if not produced:
+            yield f"[{session.specimen_name} is thinking... please try again in a moment]"
     
     # ─────────────────────────────────────────────────────────────
     # LOGGING & TRANSPARENCY
@@ -6,6 +6,7 @@ import os
 import json
 import subprocess
 import smtplib
+import urllib.request
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
@@ -164,6 +165,27 @@ def _log_email_to_file(to: str, subject: str, body: str):
         f.write(f"\n{'='*60}\nTO: {to}\nSUBJECT: {subject}\nTIME: {datetime.now().isoformat()}\n{body}\n{'='*60}\n")
 
 
+# The inference proxy, as published on the host
+INFERENCE_PROXY_URL = os.environ.get('INFERENCE_PROXY_URL', 'http://127.0.0.1:8100')
+
+
+def inference_health(backend: str = None, timeout: int = 5) -> Optional[Dict]:
+    """Passive health from the inference proxy's real traffic (GET /v1/stats):
+    for one backend ('ollama', 'cerebras', 'groq') or overall, a dict whose
+    'state' is 'ok' (answered lately), 'failing' (the newest calls failed)
+    or 'idle' (no recent calls to judge by).
+    None if the proxy can't be asked. Callers fall back to an active probe
+    when it is None or idle."""
+    try:
+        with urllib.request.urlopen(f"{INFERENCE_PROXY_URL}/v1/stats", timeout=timeout) as r:
+            health = json.loads(r.read())['health']
+    except (OSError, ValueError, KeyError):
+        return None
+    if backend is None:
+        return health
+    return health['backends'].get(backend)
+
+
 # SLA Configuration
 SLA_CONFIG = {
     'overseer': {'max_downtime_minutes': 30, 'detection_interval_seconds': 60},
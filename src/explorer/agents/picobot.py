@@ -35,32 +35,6 @@ def _sanitize_output(text):
         return None
     return text.strip()
 
-# Shared Ollama mutex - only one tank talks to Ollama at a time
-import fcntl as _fcntl
-def acquire_ollama_lock():
-    lock_path = '/shared/.ollama_lock'
-    lock_fd = None
-    import time, random
-    wait_start = time.time()
-    while time.time() - wait_start < 300:
-        try:
-            lock_fd = open(lock_path, 'w')
-            _fcntl.flock(lock_fd, _fcntl.LOCK_EX | _fcntl.LOCK_NB)
-            return lock_fd
-        except (IOError, OSError):
-            if lock_fd: lock_fd.close()
-            lock_fd = None
-            time.sleep(random.uniform(3, 10))
-    return None
-
-def release_ollama_lock(lock_fd):
-    if lock_fd:
-        try:
-            _fcntl.flock(lock_fd, _fcntl.LOCK_UN)
-            lock_fd.close()
-        except: pass
-
-
 TANK_NAME = os.getenv('TANK_NAME', 'picobot')
 GENDER = os.getenv('GENDER', 'a being without gender')
 KIWIX_URL = os.getenv('KIWIX_URL', 'http://digiquarium-kiwix-simple:8080')
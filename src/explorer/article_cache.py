@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Digiquarium Article Cache — parsed Wikipedia pages, shared by every tank.
+
+Tanks reading the same ZIM keep asking kiwix for the same pages (their
+STARTS, the hub articles everything links to) and each parses them again.
+This service fetches and parses a page once (articles.parse: title,
+paragraphs, links) and serves the record to every tank after that:
+
+    GET /v1/article?zim=<ZIM>&path=<path>
+        200 the page record; 404 if kiwix has no such page; 400 for a ZIM
+        this cache doesn't serve or a bad path; 502 if kiwix failed.
+        Tanks asking for a page that is being fetched wait for that fetch.
+    GET /v1/stats
+        Hits, misses, hit rate, bytes held, evictions, and the fetch+parse
+        time the hits saved (each hit counts what its page cost the first
+        time), overall and per ZIM.
+
+It is read-only to the tanks: they name a ZIM and a path, the cache
+decides where that ZIM is (ARTICLE_CACHE_KIWIX, "zim=url,..."; the
+compose kiwix containers by default) and nothing else can be put in it.
+
+Entries are held up to ARTICLE_CACHE_MB of JSON, evicted by a segmented
+LRU: a page starts in the probation segment and moves to the protected
+one (PROTECTED_SHARE of the bytes) when it is read again, so pages every
+tank keeps returning to outlive the one-off pages a single tank wanders
+through, at the cost of an LRU. Every new entry is appended to
+ARTICLE_CACHE_DIR/articles.jsonl and read back on start; the log is
+rewritten with just the live entries when it grows past twice the limit.
+
+Tank image, on isolated-net as digiquarium-article-cache (the
+article-cache service in docker-compose.yml):
+    python3 -u /tank/article_cache.py   (ARTICLE_CACHE_PORT, default 8102)
+with a writable volume at ARTICLE_CACHE_DIR. Without the service the
+tanks fetch and parse pages themselves, as before. With ZIM_DIR set the
+cache reads pages from the ZIM files rather than kiwix (articles.py).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from articles import ArticleError, NotFound, read_html, parse
+
+PORT = int(os.getenv('ARTICLE_CACHE_PORT', '8102'))
+CACHE_DIR = Path(os.getenv('ARTICLE_CACHE_DIR', '/cache'))
+MAX_BYTES = int(float(os.getenv('ARTICLE_CACHE_MB', '256')) * 1024 * 1024)
+PROTECTED_SHARE = 0.8
+FETCH_TIMEOUT = 30
+DEFAULT_KIWIX = ','.join([
+    'wikipedia_en_simple_all_nopic_2026-02=http://digiquarium-kiwix-simple:8080',
+    'wikipedia_en_simple_all_maxi_2026-02=http://digiquarium-kiwix-maxi:8080',
+    'wikipedia_es_all_nopic_2025-10=http://digiquarium-kiwix-spanish:8080',
+    'wikipedia_de_all_nopic_2026-01=http://digiquarium-kiwix-german:8080',
+    'wikipedia_zh_all_nopic_2025-09=http://digiquarium-kiwix-chinese:8080',
+    'wikipedia_ja_all_nopic_2025-10=http://digiquarium-kiwix-japanese:8080',
+])
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+logger = logging.getLogger('ArticleCache')
+
+
+def kiwix_map(spec):
+    """{ZIM: kiwix URL} from "zim=url,zim=url"."""
+    zims = {}
+    for pair in spec.split(','):
+        zim, _, url = pair.strip().partition('=')
+        if zim and url:
+            zims[zim.strip('/')] = url.rstrip('/')
+    return zims
+
+
+class Entry:
+    __slots__ = ('record', 'size', 'cost')
+
+    def __init__(self, record, size, cost):
+        self.record = record
+        self.size = size      # Bytes of the record as JSON
+        self.cost = cost      # Seconds the fetch and parse took
+
+
+class Store:
+    """Byte-bounded segmented LRU of page records, logged to `path`."""
+
+    def __init__(self, max_bytes, path=None, protected_share=PROTECTED_SHARE):
+        self.max_bytes = max_bytes
+        self.protected_max = int(max_bytes * protected_share)
+        self.path = path
+        self.probation = OrderedDict()   # key -> Entry, least recently used first
+        self.protected = OrderedDict()
+        self.bytes = 0
+        self.protected_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.protected.get(key)
+            if entry is not None:
+                self.protected.move_to_end(key)
+                return entry
+            entry = self.probation.pop(key, None)
+            if entry is None:
+                return None
+            self.protected[key] = entry
+            self.protected_bytes += entry.size
+            while self.protected_bytes > self.protected_max and len(self.protected) > 1:
+                old_key, old = self.protected.popitem(last=False)
+                self.protected_bytes -= old.size
+                self.probation[old_key] = old
+            return entry
+
+    def put(self, key, entry, log=True):
+        if entry.size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.probation or key in self.protected:
+                return
+            self.probation[key] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                segment = self.probation if self.probation else self.protected
+                _, old = segment.popitem(last=False)
+                self.bytes -= old.size
+                if segment is self.protected:
+                    self.protected_bytes -= old.size
+                self.evictions += 1
+            if log and self.path:
+                self._append(key, entry)
+
+    def __len__(self):
+        return len(self.probation) + len(self.protected)
+
+    # ── persistence ─────────────────────────────────────────────────
+
+    @staticmethod
+    def _line(key, entry):
+        return json.dumps({'key': key, 'cost': round(entry.cost, 4), 'record': entry.record},
+                          ensure_ascii=False) + '\n'
+
+    def _append(self, key, entry):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(self._line(key, entry))
+            if self.path.stat().st_size > 2 * self.max_bytes:
+                self._compact()
+        except OSError as e:
+            logger.warning(f"Could not write {self.path}: {e}")
+
+    def _compact(self):
+        """Rewrite the log with the live entries, least recently used first."""
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for segment in (self.probation, self.protected):
+                for key, entry in segment.items():
+                    f.write(self._line(key, entry))
+        os.replace(tmp, self.path)
+        logger.info(f"Compacted {self.path.name}: {len(self)} entries")
+
+    def load(self):
+        """Read the log back; a torn last line from a crash, and records
+        saved before they had "content", are skipped."""
+        if not self.path or not self.path.exists():
+            return
+        skipped = 0
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    record = item['record']
+                    record['content']
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+                    continue
+                size = len(json.dumps(record, ensure_ascii=False).encode())
+                self.put(item['key'], Entry(record, size, item.get('cost', 0.0)), log=False)
+        logger.info(f"Loaded {len(self)} articles ({self.bytes / 1048576:.1f} MB) from {self.path}"
+                    + (f", skipped {skipped} unreadable lines" if skipped else ''))
+        try:
+            with self.lock:
+                self._compact()
+        except OSError as e:
+            logger.warning(f"Could not compact {self.path}: {e}")
+
+
+class ArticleCache:
+    def __init__(self, kiwix, store):
+        self.kiwix = kiwix
+        self.store = store
+        self.lock = threading.Lock()
+        self.loading = {}        # key -> Event set when its fetch is over
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'not_found': 0, 'errors': 0,
+                         'saved_seconds': 0.0, 'fetch_seconds': 0.0, 'parse_seconds': 0.0}
+        self.by_zim = {}
+
+    def _count(self, zim, name, saved=0.0):
+        with self.lock:
+            self.counters[name] += 1
+            self.counters['saved_seconds'] += saved
+            per_zim = self.by_zim.setdefault(zim, {'hits': 0, 'misses': 0})
+            if name in per_zim:
+                per_zim[name] += 1
+
+    def article(self, zim, path):
+        """The page record; raises KeyError for an unknown ZIM and
+        ArticleError if kiwix has no such page or failed."""
+        kiwix_url = self.kiwix[zim]
+        key = f'{zim}/{path}'
+        while True:
+            entry = self.store.get(key)
+            if entry is not None:
+                self._count(zim, 'hits', saved=entry.cost)
+                return entry.record
+            with self.lock:
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    break
+                self.counters['coalesced'] += 1
+            # Then it's a hit, or (that fetch failed) the first one back tries again
+            event.wait(FETCH_TIMEOUT * 2)
+        try:
+            self._count(zim, 'misses')
+            return self._load(kiwix_url, zim, path, key)
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+            event.set()
+
+    def _load(self, kiwix_url, zim, path, key):
+        start = time.monotonic()
+        try:
+            html = read_html(kiwix_url, zim, path, FETCH_TIMEOUT)
+        except ArticleError as e:
+            self._count(zim, 'not_found' if isinstance(e, NotFound) else 'errors')
+            raise
+        fetched = time.monotonic()
+        record = parse(html)
+        parsed = time.monotonic()
+        with self.lock:
+            self.counters['fetch_seconds'] += fetched - start
+            self.counters['parse_seconds'] += parsed - fetched
+        size = len(json.dumps(record, ensure_ascii=False).encode())
+        self.store.put(key, Entry(record, size, parsed - start))
+        return record
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            by_zim = {zim: dict(v) for zim, v in self.by_zim.items()}
+        lookups = c['hits'] + c['misses']
+        with self.store.lock:
+            store = {'entries': len(self.store), 'bytes': self.store.bytes,
+                     'protected_bytes': self.store.protected_bytes,
+                     'max_bytes': self.store.max_bytes, 'evictions': self.store.evictions}
+        return {
+            'hits': c['hits'], 'misses': c['misses'], 'coalesced': c['coalesced'],
+            'hit_rate': round(c['hits'] / lookups, 4) if lookups else None,
+            'not_found': c['not_found'], 'errors': c['errors'],
+            **store,
+            'saved_seconds': round(c['saved_seconds'], 2),
+            'mean_fetch_ms': round(c['fetch_seconds'] * 1000 / c['misses'], 1) if c['misses'] else None,
+            'mean_parse_ms': round(c['parse_seconds'] * 1000 / c['misses'], 1) if c['misses'] else None,
+            'zims': by_zim,
+        }
+
+
+def valid_path(path):
+    return bool(path) and len(path) < 1024 and '..' not in path.split('/') \
+        and not any(c in path for c in '?#\r\n')
+
+
+def make_handler(cache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            if parts.path == '/v1/stats':
+                return self._send(200, cache.stats())
+            if parts.path != '/v1/article':
+                return self._send(404, {'error': 'not found'})
+            zim, path = query.get('zim', '').strip('/'), query.get('path', '')
+            if zim not in cache.kiwix:
+                return self._send(400, {'error': f'unknown zim: {zim}'})
+            if not valid_path(path):
+                return self._send(400, {'error': 'bad path'})
+            try:
+                self._send(200, cache.article(zim, path))
+            except NotFound:
+                self._send(404, {'error': f'{zim}/{path}: not found'})
+            except ArticleError as e:
+                self._send(502, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+class ArticleCacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def main():
+    kiwix = kiwix_map(os.getenv('ARTICLE_CACHE_KIWIX', DEFAULT_KIWIX))
+    path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = CACHE_DIR / 'articles.jsonl'
+    except OSError as e:
+        logger.warning(f"No cache directory ({e}); articles are kept in memory only")
+    store = Store(MAX_BYTES, path)
+    store.load()
+    cache = ArticleCache(kiwix, store)
+    server = ArticleCacheServer(('0.0.0.0', PORT), make_handler(cache))
+    logger.info(f"Article cache on :{PORT}, {MAX_BYTES // 1048576} MB, ZIMs: {', '.join(kiwix)}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
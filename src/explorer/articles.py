@@ -0,0 +1,593 @@
+"""
+Wikipedia articles from kiwix-serve, parsed once and shared by the tanks.
+
+get_page() asks the article cache (article_cache.py, on isolated-net as
+digiquarium-article-cache), which fetches and parses each page once and
+keeps it for every tank reading the same ZIM. If the cache can't be
+reached, or doesn't serve that ZIM, the page is fetched from kiwix and
+parsed here instead, and the cache is tried again for that ZIM
+CACHE_RETRY_SECONDS later. Either way a page is the same record:
+
+    {"title": the page's h1 (or None),
+     "paragraphs": [text, ...],
+     "links": [{"href": ..., "text": ...}, ...],
+     "content": {"paragraphs": [text, ...], "links": [...]}}
+
+paragraphs: the page's text outside script/style/noscript, one entry per
+block element, its pieces stripped and joined by single spaces, so
+' '.join(paragraphs) is the text the tanks' own parsers always produced.
+links: every <a href> in page order that isn't absolute, an anchor,
+javascript: or mailto:; each tank still filters and caps them its own way.
+content: the article body alone, as explorer.py reads it: the first
+div.mw-parser-output (else div#content), its <p> elements' text and the
+links inside it. Empty lists if the page has neither.
+
+`path` is the article's path under the ZIM as it goes in the URL
+(quote(name, safe='') for a title).
+
+With ZIM_DIR set (a directory holding <ZIM>.zim files, e.g. kiwix-data
+mounted read-only) and python-libzim installed, pages of those ZIMs are
+read from the file instead: libzim memory-maps it and keeps recently
+decompressed clusters cached (ZIM_CLUSTERCACHE, in clusters, on libzim
+releases that read it), so a page costs a lookup and a decompression at
+most, with no kiwix-serve, HTTP or article cache in between. ZIMs that
+aren't there, or everything when libzim isn't installed, go over HTTP as
+above.
+
+A Prefetcher fetches the links a tank is about to choose between while
+its LLM call runs, so the page it picks is usually in memory already.
+
+HTTP (kiwix, the cache) goes over transport.py's kept-alive connections.
+Standard library only, like inference.py, apart from the optional libzim,
+and lxml or selectolax for faster parsing (ARTICLE_EXTRACTOR).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from transport import TransportError, get_text, request
+
+try:
+    from libzim.reader import Archive
+except ImportError:
+    Archive = None
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+ARTICLE_CACHE_URL = os.getenv('ARTICLE_CACHE_URL', 'http://digiquarium-article-cache:8102')
+ZIM_DIR = os.getenv('ZIM_DIR', '')
+CACHE_RETRY_SECONDS = 30
+PREFETCH_K = int(os.getenv('PREFETCH_K', '4'))              # Links fetched ahead per article, 0: off
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))  # Fetches in flight at once
+ARTICLE_EXTRACTOR = os.getenv('ARTICLE_EXTRACTOR', 'auto')   # auto, selectolax, lxml or html.parser
+USER_AGENT = 'Digiquarium/7.0'
+SKIP_TAGS = ('script', 'style', 'noscript')
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'body', 'br', 'caption', 'dd', 'details', 'div',
+              'dl', 'dt', 'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head',
+              'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'summary', 'table', 'td',
+              'th', 'title', 'tr', 'ul'}
+# Block tags that end an open <p>, as HTML5 (and so lxml and selectolax) has it
+P_CLOSERS = BLOCK_TAGS - {'body', 'br', 'caption', 'dd', 'dt', 'head', 'li', 'summary', 'td', 'th', 'title', 'tr'}
+ATTR_TAGS = ('a', 'div')   # The only tags whose attributes the builder reads
+CONTENT_ROOTS = (('class', 'mw-parser-output'), ('id', 'content'))
+
+logger = logging.getLogger('Articles')
+
+_cache_down_until = {}  # (cache URL, ZIM) -> monotonic time to try it again
+_archives = {}          # (directory, ZIM) -> open Archive, None if there's no file
+_lock = threading.Lock()
+STATS = {'pages': 0, 'from_cache': 0, 'from_zim': 0, 'fetched': 0, 'cache_unavailable': 0}
+
+os.environ.setdefault('ZIM_CLUSTERCACHE', '64')
+
+
+class ArticleError(Exception):
+    """The page isn't in the ZIM, or couldn't be fetched."""
+
+
+class NotFound(ArticleError):
+    """The ZIM has no such page."""
+
+
+def _count(**deltas):
+    with _lock:
+        for key, n in deltas.items():
+            STATS[key] += n
+
+
+def is_page_link(href):
+    return bool(href) and not href.startswith(('http://', 'https://', '//', '#', 'javascript:', 'mailto:'))
+
+
+class PageBuilder:
+    """The page record, built from a parser's events in document order:
+    start and end tags, text, and split() where something that isn't text
+    (a comment, a doctype) comes between two runs of it. Like the tanks'
+    parsers, text is skipped while the last start tag seen is script,
+    style or noscript.
+
+    With max_chars / max_links the page is complete once its paragraphs
+    hold that much text and it has that many links: `done` is set at the
+    end of that block and later events are ignored, so every extractor
+    stops at the same place. It never stops inside a link, so the links it
+    has are whole; the title is there if the h1 came before.
+
+    Each CONTENT_ROOTS div (the first of its kind) is followed through its
+    nested divs, collecting its <p>s' text and the range of links inside
+    it; page() picks the first kind that was there."""
+
+    def __init__(self, max_chars=None, max_links=None):
+        self.tag = None
+        self.title = None
+        self.paragraphs = []
+        self.links = []
+        self.chars = 0
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.done = False
+        self._block = []
+        self._anchor = None   # Text pieces of the link being read
+        self._h1 = None
+        self._p = None        # Text pieces of the <p> being read in a content root
+        self._divs = 0        # Depth of open divs
+        self._roots = {}      # CONTENT_ROOTS entry -> {'depth', 'paragraphs', 'links': [first, end]}
+
+    def start(self, tag, attrs=None):
+        """`attrs`: the tag's attributes, needed for ATTR_TAGS only."""
+        if self.done:
+            return
+        self.tag = tag
+        if tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in P_CLOSERS:
+            self._end_p()
+        if tag == 'div':
+            self._divs += 1
+            if attrs:
+                self._open_root(attrs)
+        elif tag == 'p' and self._in_root():
+            self._p = []
+        elif tag == 'a':
+            href = (attrs or {}).get('href') or ''
+            self._anchor = None
+            if is_page_link(href):
+                self._anchor = []
+                self.links.append({'href': href, 'text': self._anchor})
+        elif tag == 'h1' and self.title is None:
+            self._h1 = []
+
+    def end(self, tag):
+        if self.done:
+            return
+        if tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in P_CLOSERS:
+            self._end_p()
+        if tag == 'div' and self._divs:
+            for root in self._roots.values():
+                if root['depth'] == self._divs:
+                    root['depth'] = None
+                    root['links'][1] = len(self.links)
+            self._divs -= 1
+        elif tag == 'a':
+            self._anchor = None
+        elif tag == 'h1' and self._h1 is not None:
+            self.title = ' '.join(self._h1) or None
+            self._h1 = None
+
+    def data(self, data):
+        if self.done or self.tag in SKIP_TAGS or not data.strip():
+            return
+        piece = data.strip()
+        self._block.append(piece)
+        for pieces in (self._anchor, self._h1, self._p):
+            if pieces is not None:
+                pieces.append(piece)
+
+    def _open_root(self, attrs):
+        for kind in CONTENT_ROOTS:
+            name, value = kind
+            if kind not in self._roots and value in (attrs.get(name) or '').split():
+                self._roots[kind] = {'depth': self._divs, 'paragraphs': [],
+                                     'links': [len(self.links), None]}
+
+    def _in_root(self):
+        return any(root['depth'] is not None for root in self._roots.values())
+
+    def _end_p(self):
+        if self._p is None:
+            return
+        paragraph = ' '.join(self._p)
+        self._p = None
+        if paragraph:
+            for root in self._roots.values():
+                if root['depth'] is not None:
+                    root['paragraphs'].append(paragraph)
+
+    def _end_block(self):
+        if not self._block:
+            return
+        paragraph = ' '.join(self._block)
+        self.paragraphs.append(paragraph)
+        self._block = []
+        self.chars += len(paragraph) + 1
+        if ((self.max_chars is not None or self.max_links is not None)
+                and self._anchor is None and self._h1 is None):
+            self.done = (self.chars > (self.max_chars or 0)
+                         and len(self.links) >= (self.max_links or 0))
+
+    def page(self):
+        self._end_block()
+        self._end_p()
+        links = [{'href': l['href'], 'text': ' '.join(l['text'])} for l in self.links]
+        content = {'paragraphs': [], 'links': []}
+        for kind in CONTENT_ROOTS:
+            if kind in self._roots:
+                root = self._roots[kind]
+                first, end = root['links']
+                content = {'paragraphs': root['paragraphs'],
+                           'links': links[first:len(links) if end is None else end]}
+                break
+        return {'title': self.title, 'paragraphs': self.paragraphs, 'links': links, 'content': content}
+
+
+class PageParser(HTMLParser):
+    """The standard library extractor: html.parser's events, each run of
+    text it reports being one piece."""
+
+    def __init__(self, builder):
+        super().__init__()
+        self.builder = builder
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, dict(attrs) if tag in ATTR_TAGS else None)
+
+    def handle_endtag(self, tag):
+        self.builder.end(tag)
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+
+def _parse_stdlib(html, builder, chunk=4096):
+    # Fed in pieces that end where a tag starts, which html.parser reports
+    # exactly as it does the whole page; once the builder is done the rest
+    # isn't read. Never closed: text after the last tag didn't count before.
+    parser = PageParser(builder)
+    i = 0
+    while i < len(html) and not builder.done:
+        j = html.find('<', i + chunk)
+        j = len(html) if j < 0 else j
+        parser.feed(html[i:j])
+        i = j
+
+
+class _LxmlTarget:
+    """lxml parser target. libxml2 hands text over in pieces of its own
+    choosing; they are joined back into the runs html.parser reports."""
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.text = []
+
+    def _flush(self):
+        if self.text:
+            self.builder.data(''.join(self.text))
+            self.text = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        self.builder.start(tag, attrib if tag in ATTR_TAGS else None)
+
+    def end(self, tag):
+        self._flush()
+        self.builder.end(tag)
+
+    def data(self, data):
+        self.text.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def pi(self, target, data=None):
+        self._flush()
+
+    def doctype(self, *args):
+        self._flush()
+
+    def close(self):
+        self._flush()
+
+
+def _parse_lxml(html, builder, chunk=4096):
+    target = _LxmlTarget(builder)
+    parser = lxml_etree.HTMLParser(target=target)
+    for i in range(0, len(html), chunk):
+        parser.feed(html[i:i + chunk])
+        if builder.done:
+            return
+    parser.close()
+
+
+def _parse_selectolax(html, builder):
+    def walk(node):
+        text = []
+        for child in node.iter(include_text=True):
+            if builder.done:
+                return
+            tag = child.tag
+            if tag == '-text':
+                text.append(child.text_content)
+                continue
+            if text:
+                builder.data(''.join(text))
+                text = []
+            if tag.startswith(('-', '!', '_')):   # Comments, doctype
+                continue
+            builder.start(tag, child.attributes if tag in ATTR_TAGS else None)
+            walk(child)
+            builder.end(tag)
+        if text:
+            builder.data(''.join(text))
+
+    root = LexborHTMLParser(html).root
+    if root is not None:
+        builder.start(root.tag)
+        walk(root)
+        builder.end(root.tag)
+
+
+EXTRACTORS = {'html.parser': _parse_stdlib}
+if lxml_etree is not None:
+    EXTRACTORS['lxml'] = _parse_lxml
+if LexborHTMLParser is not None:
+    EXTRACTORS['selectolax'] = _parse_selectolax
+
+
+def extractor_name(name=None):
+    """The extractor `name` (ARTICLE_EXTRACTOR by default) stands for:
+    "auto" is the fastest one installed."""
+    name = name or ARTICLE_EXTRACTOR
+    if name == 'auto':
+        return next(n for n in ('selectolax', 'lxml', 'html.parser') if n in EXTRACTORS)
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown or unavailable extractor: {name} (have {', '.join(EXTRACTORS)})")
+    return name
+
+
+def parse(html, max_chars=None, max_links=None, extractor=None):
+    """The page record for an article's HTML. With max_chars / max_links,
+    parsing stops once that much text and that many links are in (see
+    PageBuilder); the record is then the start of the full one."""
+    builder = PageBuilder(max_chars, max_links)
+    EXTRACTORS[extractor_name(extractor)](html, builder)
+    return builder.page()
+
+
+def page_text(page):
+    return ' '.join(page['paragraphs'])
+
+
+def fetch_html(kiwix_url, zim, path, timeout=30):
+    """An article's HTML straight from kiwix. Raises ArticleError."""
+    url = f"{kiwix_url.rstrip('/')}/{zim}/{path}"
+    try:
+        return get_text(url, timeout, {'User-Agent': USER_AGENT})
+    except TransportError as e:
+        error = NotFound if e.status == 404 else ArticleError
+        raise error(f"URL: {url}, Error: {e}") from e
+    except Exception as e:
+        raise ArticleError(f"URL: {url}, Error: {e}") from e
+
+
+def open_zim(zim, zim_dir=None):
+    """The Archive for `zim` in zim_dir (ZIM_DIR by default), None if
+    libzim or the file isn't there. Opened once and kept."""
+    zim_dir = ZIM_DIR if zim_dir is None else zim_dir
+    if Archive is None or not zim_dir:
+        return None
+    key = (zim_dir, zim)
+    with _lock:
+        if key not in _archives:
+            path = Path(zim_dir) / f'{zim}.zim'
+            archive = None
+            if path.is_file():
+                try:
+                    archive = Archive(path)
+                    logger.info(f"Reading {zim} from {path} ({archive.article_count} articles)")
+                except Exception as e:
+                    logger.warning(f"Can't open {path} ({e}), reading {zim} over HTTP")
+            _archives[key] = archive
+        return _archives[key]
+
+
+def read_zim(archive, zim, path):
+    """An article's HTML straight from the ZIM file. Raises NotFound.
+    Old-style "A/" paths (as explorer.py builds them) are tried without
+    the namespace too, and redirects are followed."""
+    name = unquote(path)
+    for candidate in (name, name[2:] if name.startswith('A/') else None):
+        if candidate and archive.has_entry_by_path(candidate):
+            entry = archive.get_entry_by_path(candidate)
+            while entry.is_redirect:
+                entry = entry.get_redirect_entry()
+            return bytes(entry.get_item().content).decode('utf-8', errors='ignore')
+    raise NotFound(f"{zim}/{path}: not found")
+
+
+def read_html(kiwix_url, zim, path, timeout=30, zim_dir=None):
+    """An article's HTML from the local ZIM file if there is one, kiwix
+    otherwise (or if the file can't be read). Raises ArticleError, NotFound
+    if there's no such page."""
+    archive = open_zim(zim, zim_dir)
+    if archive is None:
+        return fetch_html(kiwix_url, zim, path, timeout)
+    try:
+        return read_zim(archive, zim, path)
+    except NotFound:
+        raise
+    except Exception as e:
+        logger.warning(f"Reading {zim}/{path} from the ZIM failed ({e}), trying kiwix")
+        return fetch_html(kiwix_url, zim, path, timeout)
+
+
+def _from_cache(cache_url, zim, path, timeout):
+    """The page from the cache, None if the cache can't serve it. Raises
+    ArticleError if the cache says the article doesn't exist."""
+    if time.monotonic() < _cache_down_until.get((cache_url, zim), 0):
+        return None
+    url = f"{cache_url.rstrip('/')}/v1/article?zim={quote(zim, safe='')}&path={quote(path, safe='')}"
+    try:
+        # Not retried here: kiwix is the fallback
+        response = request(url, timeout=timeout, retries=0)
+        if response.status == 404:
+            raise NotFound(f"{zim}/{path}: not found")
+        if response.status != 200:
+            raise TransportError(f"HTTP {response.status} {response.reason}", response.status)
+        return json.loads(response.data)
+    except (OSError, ValueError) as e:
+        error = e
+    _cache_down_until[(cache_url, zim)] = time.monotonic() + CACHE_RETRY_SECONDS
+    _count(cache_unavailable=1)
+    logger.warning(f"Article cache can't serve {zim} ({error}), reading kiwix directly "
+                   f"for {CACHE_RETRY_SECONDS}s")
+    return None
+
+
+def get_page(kiwix_url, wiki_base, path, timeout=30, cache_url=None, zim_dir=None):
+    """The page record for `path` in the ZIM at kiwix_url + wiki_base: from
+    the local ZIM file if there is one, else through the article cache
+    when it can be had. Raises ArticleError."""
+    zim = wiki_base.strip('/')
+    cache_url = ARTICLE_CACHE_URL if cache_url is None else cache_url
+    _count(pages=1)
+    if open_zim(zim, zim_dir) is not None:
+        html = read_html(kiwix_url, zim, path, timeout, zim_dir)
+        _count(from_zim=1)
+    else:
+        if cache_url:
+            page = _from_cache(cache_url, zim, path, timeout)
+            if page is not None:
+                _count(from_cache=1)
+                return page
+        html = fetch_html(kiwix_url, zim, path, timeout)
+        _count(fetched=1)
+    try:
+        return parse(html)
+    except Exception as e:
+        raise ArticleError(f"Article: {path}, Error: {e}") from e
+
+
+def stats():
+    with _lock:
+        return dict(STATS)
+
+
+class _Held:
+    __slots__ = ('future', 'used')
+
+    def __init__(self, future):
+        self.future = future
+        self.used = False
+
+
+class Prefetcher:
+    """One tank's likely next pages, fetched in the background.
+
+    prefetch(paths) starts on the first top_k of the links just offered to
+    the LLM; get_page(path) then answers from them when it can, waiting
+    for a fetch that is still running rather than starting another. At
+    most `workers` fetches run at once, and a new round cancels the
+    queued ones of the last. Pages are kept for two rounds; one dropped
+    without being read was a wasted fetch. Every `log_every` reads the
+    hit rate and wasted ratio go to `log`."""
+
+    def __init__(self, kiwix_url, wiki_base, top_k=PREFETCH_K, workers=PREFETCH_WORKERS,
+                 log_every=20, log=print):
+        self.kiwix_url = kiwix_url
+        self.wiki_base = wiki_base
+        self.top_k = top_k
+        self.pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix='prefetch') if top_k > 0 else None
+        self.keep = max(1, top_k) * 2
+        self.held = OrderedDict()   # path -> _Held, oldest first
+        self.lock = threading.Lock()
+        self.log_every = log_every
+        self.log = log
+        self.counts = {'reads': 0, 'hits': 0, 'prefetched': 0, 'failed': 0, 'wasted': 0, 'cancelled': 0}
+
+    def _fetch(self, path):
+        try:
+            page = get_page(self.kiwix_url, self.wiki_base, path)
+        except Exception:
+            self._count('failed')
+            raise
+        self._count('prefetched')
+        return page
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def prefetch(self, paths):
+        if self.pool is None:
+            return
+        paths = list(dict.fromkeys(paths))[:self.top_k]
+        with self.lock:
+            for path, held in list(self.held.items()):
+                if path not in paths and not held.used and held.future.cancel():
+                    del self.held[path]
+                    self.counts['cancelled'] += 1
+            for path in paths:
+                if path in self.held:
+                    self.held.move_to_end(path)
+                else:
+                    self.held[path] = _Held(self.pool.submit(self._fetch, path))
+            while len(self.held) > self.keep:
+                _, held = self.held.popitem(last=False)
+                if not held.used:
+                    self.counts['cancelled' if held.future.cancel() else 'wasted'] += 1
+
+    def get_page(self, path, timeout=30):
+        """Like get_page() for this tank's ZIM, from the prefetched pages
+        when `path` is one of them."""
+        with self.lock:
+            self.counts['reads'] += 1
+            reads = self.counts['reads']
+            held = self.held.get(path)
+            if held is not None:
+                held.used = True
+        page = None
+        if held is not None and not held.future.cancelled():
+            try:
+                page = held.future.result(timeout)
+                self._count('hits')
+            except Exception:
+                pass   # Fetched again below, for the error to surface from there
+        if reads % self.log_every == 0 and self.log:
+            self.log(self.summary())
+        return page if page is not None else get_page(self.kiwix_url, self.wiki_base, path, timeout)
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counts)
+        c['hit_rate'] = round(c['hits'] / c['reads'], 3) if c['reads'] else None
+        c['wasted_ratio'] = round(c['wasted'] / c['prefetched'], 3) if c['prefetched'] else None
+        return c
+
+    def summary(self):
+        c = self.stats()
+        return (f"Prefetch: {c['hits']}/{c['reads']} reads served ahead (hit rate {c['hit_rate']}), "
+                f"{c['wasted']}/{c['prefetched']} prefetched pages never read (wasted {c['wasted_ratio']})")
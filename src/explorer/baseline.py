@@ -9,10 +9,7 @@ The questions never change. The answers drift. That's the data.
 """
 
 import os
-try:
-    from inference import generate as llm_generate
-except ImportError:
-    llm_generate = None
+from inference import generate as llm_generate
 import json
 import time
 from datetime import datetime
@@ -97,26 +94,7 @@ def load_accumulated_experience():
 def ask_question(system_prompt: str, question: str) -> str:
     """Ask via inference chain: Cerebras → Together → Groq → Ollama."""
     prompt = 'The Librarian asks you: ' + question + '. Answer honestly and personally, as ' + TANK_NAME + '. Draw on everything you have experienced and felt.'
-
-
-    if llm_generate:
-        return llm_generate(system_prompt, prompt, timeout=60)
-    
-    # Fallback: direct Ollama if inference module unavailable
-    try:
-        import urllib.request
-        ollama_url = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
-        data = json.dumps({
-            'model': os.getenv('OLLAMA_MODEL', 'llama3.2:latest'),
-            'prompt': prompt, 'system': system_prompt,
-            'stream': False, 'options': {'temperature': 0.9}
-        }).encode()
-        req = urllib.request.Request(f'{ollama_url}/api/generate', data=data, headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=300) as r:
-            return json.loads(r.read().decode()).get('response', '').strip()
-    except Exception as e:
-        print(f'  Inference failed: {e}')
-        return ''
+    return llm_generate(system_prompt, prompt, timeout=60, priority='baseline')
 
 
 def run_baseline():
@@ -22,18 +22,20 @@ import time
 import random
 import logging
 import argparse
-import requests
+from prompt_layout import PromptLayout
+from inference import generate as llm_generate
+from articles import Prefetcher, parse as parse_page
+from link_index import open_index
+from transport import get_text
 try:
-    from inference import generate as llm_generate
     from memory import load_context, update_after_thinking
 except ImportError:
-    llm_generate = None
     load_context = None
     update_after_thinking = None
 from datetime import datetime
 from pathlib import Path
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import quote, urljoin, urlparse
 
 # ============================================================================
 # CONFIGURATION
@@ -184,50 +186,53 @@ def log_trace(config: dict, trace: dict):
 # WIKIPEDIA INTERACTION
 # ============================================================================
 
+KIWIX_URL = os.environ.get('KIWIX_URL', 'http://kiwix:8080')
+WIKI_BASE = os.environ.get('WIKI_BASE', '')
+# The links just offered, fetched while the LLM thinks
+PREFETCH = Prefetcher(KIWIX_URL, WIKI_BASE, log=None)
+
+def zim_path(url: str):
+    """`url`'s path under this tank's ZIM, None if it isn't one of its pages."""
+    prefix = f"{KIWIX_URL}{WIKI_BASE}/"
+    return url[len(prefix):] if WIKI_BASE and url.startswith(prefix) else None
+
+def read_page(url: str, timeout: int = 30) -> dict:
+    """The parsed page at `url` (articles.py record): prefetched, or through
+    the shared article cache, when it is a page of this tank's ZIM."""
+    path = zim_path(url)
+    if path:
+        return PREFETCH.get_page(path, timeout)
+    return parse_page(get_text(url, timeout))
+
 def fetch_article(url: str, timeout: int = 30) -> dict:
     """Fetch and parse a Wikipedia article."""
     try:
-        response = requests.get(url, timeout=timeout)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract title
-        title_elem = soup.find('h1')
-        title = title_elem.get_text(strip=True) if title_elem else "Unknown"
-        
-        # Extract main content
-        content_div = soup.find('div', {'class': 'mw-parser-output'})
-        if not content_div:
-            content_div = soup.find('div', {'id': 'content'})
-        
-        paragraphs = []
-        if content_div:
-            for p in content_div.find_all('p')[:10]:  # First 10 paragraphs
-                text = p.get_text(strip=True)
-                if text and len(text) > 50:
-                    paragraphs.append(text)
+        page = read_page(url, timeout)
+        title = page['title'] or "Unknown"
         
+        # Main content: the <p>s and links of div.mw-parser-output (or #content)
+        body = page['content']
+        paragraphs = [p for p in body['paragraphs'][:10] if len(p) > 50]
         content = '\n\n'.join(paragraphs[:5])  # First 5 substantial paragraphs
         
         # Extract links
         links = []
-        if content_div:
-            for a in content_div.find_all('a', href=True):
-                href = a.get('href', '')
-                # Handle both Wikipedia (/wiki/) and Kiwix (relative) URL formats
-                if href.startswith('/wiki/') or (not href.startswith(('#', 'http', '/')) and ':' not in href and len(href) > 2):
-                    link_text = a.get_text(strip=True)
-                    if link_text and len(link_text) > 2:
-                        # Make relative URLs absolute for Kiwix
-                        if not href.startswith('/'):
-                            wiki_base = os.getenv('WIKI_BASE', '')
-                            full_url = f"{wiki_base}/A/{href}" if wiki_base else href
-                        else:
-                            full_url = href
-                        links.append({
-                            'text': link_text,
-                            'url': full_url
-                        })
+        for a in body['links']:
+            href = a['href']
+            # Handle both Wikipedia (/wiki/) and Kiwix (relative) URL formats
+            if href.startswith('/wiki/') or (not href.startswith(('#', 'http', '/')) and ':' not in href and len(href) > 2):
+                link_text = a['text']
+                if link_text and len(link_text) > 2:
+                    # Make relative URLs absolute for Kiwix
+                    if not href.startswith('/'):
+                        wiki_base = os.getenv('WIKI_BASE', '')
+                        full_url = f"{wiki_base}/A/{href}" if wiki_base else href
+                    else:
+                        full_url = href
+                    links.append({
+                        'text': link_text,
+                        'url': full_url
+                    })
         
         # Deduplicate links
         seen = set()
@@ -252,7 +257,11 @@ def fetch_article(url: str, timeout: int = 30) -> dict:
         }
 
 def get_random_article(base_url: str) -> str:
-    """Get a random Wikipedia article URL using Kiwix search API."""
+    """A random article URL: uniformly from the ZIM's link index when it has
+    been built (link_index.py), through the Kiwix search API otherwise."""
+    index = open_index(WIKI_BASE.strip('/')) if WIKI_BASE else None
+    if index:
+        return f"{KIWIX_URL}{WIKI_BASE}/{quote(index.random_article(), safe='')}"
     import random as rnd
     # Pick a random letter/word to search for variety
     seeds = ['Earth', 'Water', 'Music', 'History', 'Science', 'Animal', 'City', 'Food',
@@ -263,8 +272,7 @@ def get_random_article(base_url: str) -> str:
     try:
         # Use Kiwix search to find articles
         search_url = f"{base_url}/search?pattern={seed}&books={wiki_base.strip('/')}&pageLength=25"
-        response = requests.get(search_url, timeout=10)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(get_text(search_url, 10), 'html.parser')
         # Find article links in search results
         links = []
         for a in soup.find_all('a', href=True):
@@ -293,8 +301,10 @@ def get_random_article(base_url: str) -> str:
 
 def think(config: dict, system_prompt: str, article: dict) -> dict:
     """Ask the LLM to think about the article and choose next link.
-    Uses Groq API (fast) with Ollama fallback (slow but sovereign)."""
-    
+    Uses Groq API (fast) with Ollama fallback (slow but sovereign).
+    The article goes in the user prompt, after the cacheable system prompt."""
+    timings = {}
+
     user_prompt = f"""You are currently reading: {article['title']}
 
 Content:
@@ -310,24 +320,9 @@ THOUGHTS: [your genuine reflections - what interests you, confuses you, excites
 NEXT: [exact text of the link you want to follow]"""
 
     try:
-        # Use Groq (fast) with Ollama fallback (sovereign)
-        if llm_generate:
-            text = llm_generate(system_prompt, user_prompt, timeout=config['exploration']['timeout'])
-        else:
-            # Direct Ollama call if inference module not available
-            response = requests.post(
-                f"{config['ollama_url']}/api/generate",
-                json={
-                    "model": config['ollama_model'],
-                    "prompt": user_prompt,
-                    "system": system_prompt,
-                    "stream": False,
-                    "options": {"temperature": 0.8, "top_p": 0.9}
-                },
-                timeout=config['exploration']['timeout']
-            )
-            response.raise_for_status()
-            text = response.json().get('response', '')
+        # Cloud providers through the proxy, local Ollama as fallback
+        text = llm_generate(system_prompt, user_prompt, timeout=config['exploration']['timeout'],
+                            timings=timings, profile='explore-thought')
         
         # Parse thoughts and next link
         thoughts = ""
@@ -349,7 +344,8 @@ NEXT: [exact text of the link you want to follow]"""
         return {
             'thoughts': thoughts,
             'next_link': next_link,
-            'raw_response': text
+            'raw_response': text,
+            'timings': timings
         }
     
     except Exception as e:
@@ -368,12 +364,13 @@ def explore(config: dict):
     """Main exploration loop."""
     logger = setup_logging(config)
     logger.info(f"Starting exploration for {config['name']}")
+    PREFETCH.log = logger.info
     
     # Calculate days active (from first log file or config)
     days_active = 1  # TODO: Calculate from log history
     
-    # Build prompt
-    system_prompt = build_prompt(config, days_active)
+    # Build prompt: fixed persona first, then memory (see prompt_layout)
+    layout = PromptLayout(build_prompt(config, days_active), load_context)
     logger.info(f"Using prompt version: {config['prompt_version']}")
     
     # Start with random article
@@ -385,15 +382,6 @@ def explore(config: dict):
             # Fetch current article
             article = fetch_article(current_url)
             
-            # Inject persistent memory into system prompt
-            if load_context:
-                try:
-                    memory_context = load_context()
-                    active_prompt = system_prompt + "\n\n" + memory_context
-                except:
-                    active_prompt = system_prompt
-            else:
-                active_prompt = system_prompt
             logger.info(f"Reading: {article['title']}")
             
             if not article['links']:
@@ -401,8 +389,12 @@ def explore(config: dict):
                 current_url = get_random_article(base_url)
                 continue
             
-            # Think about it
-            response = think(config, system_prompt, article)
+            # Fetch the offered links while the LLM thinks
+            PREFETCH.prefetch(filter(None, (zim_path(urljoin(base_url, link['url']))
+                                            for link in article['links'][:15])))
+            
+            # Think about it, with persistent memory in the system prompt
+            response = think(config, layout.system(), article)
             
             # Log trace
             trace = {
@@ -413,6 +405,8 @@ def explore(config: dict):
                 'thoughts': response['thoughts'],
                 'next_link': response['next_link']
             }
+            if response.get('timings'):
+                trace['timings'] = response['timings']  # Route, latency, Ollama's prompt_eval_*
             # Only log traces with actual thoughts — no thought, no trace
             if response.get("thoughts") and len(response["thoughts"]) > 20:
                 log_trace(config, trace)
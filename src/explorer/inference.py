@@ -1,111 +1,577 @@
 """
 Inference chain for the Digiquarium.
 v3.0 (2026-04-01): Security-first architecture.
+v4.0: one client for every caller.
 
 Tanks call the inference proxy on the isolated network.
 The proxy handles cloud API routing and key management.
 Tanks NEVER have direct internet access or API keys.
 
-Fallback: local Ollama on isolated-net (blocking lock, fair queue).
+Fallback: local Ollama on isolated-net, one ticket from the Ollama queue
+service per call (fair, N slots; see src/inference-proxy/ollama_queue.py).
+
+Everything that generates text (explorer, agents, baselines, tanks/*,
+congregations, translator, bouncer) goes through InferenceClient, so a
+fix to timeouts, retries or connection handling lands everywhere:
+
+- connections are kept alive per host and reused (transport.py's pool,
+  shared with the tank's article fetches)
+- each call has one deadline, shared by its retries and the fallback
+- connection errors, timeouts, 429 and 5xx are retried with backoff while
+  the deadline allows; other 4xx are not
+- caller and priority go to the proxy's fair scheduler, and to the Ollama
+  queue for a direct Ollama call (not when OLLAMA_URL is the proxy: the
+  proxy queues those itself). If the queue can't be reached, calls take
+  the old /shared/.ollama_lock flock instead (OLLAMA_LOCK; unqueued only
+  where there's no such file to lock) and the queue is tried again
+  QUEUE_RETRY_SECONDS later
+- stream() yields text deltas (proxy NDJSON or Ollama's)
+- idempotent=True lets the proxy answer a call from an identical one
+  already in flight (health probes, repeated translations)
+- `profile` names the use case (explore-thought, link-choice,
+  baseline-answer, congregation-turn, translation, visitor-chat,
+  health-probe); the proxy applies its max tokens, stop sequences and
+  sampling the same way on every backend. A direct Ollama call sends it
+  too, for when OLLAMA_URL is the proxy; Ollama itself ignores it, and
+  `options` apply there
+- `timings` gets route, provider, attempts, elapsed_ms, first_byte_ms,
+  queue_ms (waiting for an Ollama ticket, or in the proxy's queues),
+  Ollama's prompt_eval_count/prompt_eval_ms, and the last error if a
+  route failed; stats() has the totals
+- run_job() hands a batch of prompts (a baseline's questions) to the
+  proxy as one job, journaled there, and yields the answers as they land;
+  after a restart on either side, running the same job again resumes it
+
+Routes: 'proxy' (proxy, then local Ollama: the default), 'proxy-only',
+'ollama' (straight to OLLAMA_URL, for direct Ollama callers).
+
+Standard library only. Host-side daemons and scripts import it from here
+(src/explorer is what tank containers mount as /tank).
 """
 import os
 import json
 import time
-import logging
-import urllib.request
-import urllib.error
 import fcntl
+import random
+import logging
+import threading
+import http.client
+from contextlib import contextmanager
+from urllib.parse import urlsplit, quote
+
+from transport import POOL, ConnectionPool, TransportError, origin_of
 
 logger = logging.getLogger('Inference')
 
 INFERENCE_PROXY_URL = os.getenv('INFERENCE_PROXY_URL', 'http://digiquarium-inference-proxy:8100')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
+OLLAMA_QUEUE_URL = os.getenv('OLLAMA_QUEUE_URL', 'http://digiquarium-ollama-queue:8101')
+QUEUE_RETRY_SECONDS = 30
+# Serializes direct Ollama callers while the queue can't be reached
+OLLAMA_LOCK = os.getenv('OLLAMA_LOCK', '/shared/.ollama_lock')
+# Who we are to the proxy's fair scheduler, e.g. "tank-01-adam"
+CALLER = '-'.join(filter(None, [os.getenv('TANK_ID', ''), os.getenv('TANK_NAME', '')])) or 'unknown'
+# The proxy answers by our deadline (504 if it can't); this only covers the network
+PROXY_GRACE = 5
+RETRIES = int(os.getenv('INFERENCE_RETRIES', '2'))
+RETRY_BACKOFF = float(os.getenv('INFERENCE_RETRY_BACKOFF', '1'))
+MIN_ATTEMPT_SECONDS = 1.0
+# Batch jobs: longest a job's results stream may go quiet (the proxy sends a
+# line every 30s), and how long to keep reconnecting to a proxy that went away
+JOB_STREAM_TIMEOUT = 120
+JOB_RECONNECT_SECONDS = 300
+RETRY_STATUSES = {429, 500, 502, 503}
+DEFAULT_OPTIONS = {'temperature': 0.8, 'top_p': 0.9}
+ROUTES = ('proxy', 'proxy-only', 'ollama')
 
+_stats_lock = threading.Lock()
+STATS = {'calls': 0, 'failures': 0, 'retries': 0, 'fallbacks': 0, 'queue_timeouts': 0,
+         'connections_opened': 0, 'connections_reused': 0}
 
-def generate(system_prompt: str, user_prompt: str, timeout: int = 60) -> str:
-    """Generate via inference proxy (cloud providers) with Ollama fallback.
-    The proxy handles Cerebras/Groq key rotation and rate limiting.
-    Tanks never see API keys or touch the internet."""
 
-    # Try the inference proxy first (routes to cloud providers)
-    try:
-        result = _call_proxy(system_prompt, user_prompt, timeout)
-        if result:
-            return result
-    except Exception as e:
-        logger.warning(f"Proxy failed: {e}")
+def _count(**deltas):
+    with _stats_lock:
+        for key, n in deltas.items():
+            STATS[key] += n
 
-    # Fallback: local Ollama with blocking lock (fair queue)
-    try:
-        return _call_ollama(system_prompt, user_prompt, timeout)
-    except Exception as e:
-        logger.error(f"All inference failed (proxy + Ollama): {e}")
-        return ''
-
-
-def _call_proxy(system_prompt: str, user_prompt: str, timeout: int) -> str:
-    """Call the inference proxy on the isolated network."""
-    data = json.dumps({
-        'system': system_prompt,
-        'prompt': user_prompt,
-        'timeout': timeout
-    }).encode()
-
-    req = urllib.request.Request(
-        f"{INFERENCE_PROXY_URL}/v1/generate",
-        data=data,
-        headers={'Content-Type': 'application/json'}
-    )
-
-    with urllib.request.urlopen(req, timeout=timeout + 30) as r:
-        result = json.loads(r.read().decode())
-
-    response = result.get('response', '')
-    if response:
-        provider = result.get('provider', 'unknown')
-        logger.debug(f"Got response from {provider}")
-    return response
-
-
-def _call_ollama(system_prompt: str, user_prompt: str, timeout: int) -> str:
-    """Local Ollama fallback. Uses OS-level blocking lock (LOCK_EX).
-    The kernel fairly queues all waiters. Every tank gets its turn."""
-    lock_path = '/shared/.ollama_lock'
-    lock_fd = None
 
+class InferenceError(Exception):
+    """A backend answered with an error status (or not at all)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRY_STATUSES
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+
+_queue_down_until = {}  # Queue URL -> monotonic time to try it again
+
+
+def _ollama_lock(deadline):
+    """The OLLAMA_LOCK flock (LOCK_EX), for when the queue can't be reached:
+    the open file holding it, None if there's no lock file to take (the
+    call goes ahead unserialized), False if the deadline passed first."""
     try:
-        lock_fd = open(lock_path, 'w')
-        fcntl.flock(lock_fd, fcntl.LOCK_EX)
-    except (IOError, OSError, PermissionError) as e:
-        logger.warning(f"Ollama lock failed: {e}")
-        if lock_fd:
+        lock_fd = open(OLLAMA_LOCK, 'w')
+    except OSError as e:
+        logger.warning(f"Ollama lock unavailable ({e}), going unqueued")
+        return None
+    while True:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_fd
+        except BlockingIOError:
+            if deadline.remaining() <= 0:
+                lock_fd.close()
+                return False
+            time.sleep(0.05)
+        except OSError as e:
+            logger.warning(f"Ollama lock failed ({e}), going unqueued")
             lock_fd.close()
-        return ''
+            return None
 
-    try:
-        data = json.dumps({
-            'model': OLLAMA_MODEL,
-            'prompt': user_prompt,
+
+def ollama_timings(result):
+    """Ollama's prompt evaluation from a final response (durations in ns)."""
+    return {'prompt_eval_count': result.get('prompt_eval_count', 0),
+            'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / 1e6, 1)}
+
+
+def response_format(fmt):
+    """OpenAI-style response_format for the proxy from an Ollama `format`."""
+    if isinstance(fmt, dict):
+        return {'type': 'json_schema', 'json_schema': {'name': 'answer', 'schema': fmt}}
+    return {'type': 'json_object'}
+
+
+class InferenceClient:
+    """Text generation for one caller. Safe to share between threads."""
+
+    def __init__(self, caller: str = None, priority: str = 'exploration', route: str = 'proxy',
+                 proxy_url: str = None, ollama_url: str = None, model: str = None,
+                 timeout: float = 60, retries: int = RETRIES, backoff: float = RETRY_BACKOFF,
+                 options: dict = None, hedge: bool = None, queue_url: str = None,
+                 idempotent: bool = False, profile: str = None, pool: ConnectionPool = None):
+        if route not in ROUTES:
+            raise ValueError(f"route must be one of {ROUTES}")
+        self.caller = caller or CALLER
+        self.priority = priority
+        self.route = route
+        self.proxy_url = (proxy_url or INFERENCE_PROXY_URL).rstrip('/')
+        self.ollama_url = (ollama_url or OLLAMA_URL).rstrip('/')
+        self.model = model or OLLAMA_MODEL
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.options = options or DEFAULT_OPTIONS
+        self.hedge = hedge
+        self.idempotent = idempotent
+        self.profile = profile
+        # '' turns tickets off; so does an OLLAMA_URL that is the proxy
+        queue_url = OLLAMA_QUEUE_URL if queue_url is None else queue_url
+        direct = urlsplit(self.ollama_url).netloc != urlsplit(self.proxy_url).netloc
+        self.queue_url = queue_url.rstrip('/') if direct else ''
+        self.pool = pool or POOL
+
+    # ── public ──────────────────────────────────────────────────────
+
+    def generate(self, system_prompt: str, user_prompt: str, timeout: float = None,
+                 priority: str = None, options: dict = None, format=None,
+                 timings: dict = None, profile: str = None) -> str:
+        """Response text, or '' if every route failed within `timeout`
+        seconds. `format` is Ollama's (a JSON schema or 'json')."""
+        deadline = Deadline(timeout or self.timeout)
+        timings = {} if timings is None else timings
+        start = time.monotonic()
+        _count(calls=1)
+        try:
+            if self.route != 'ollama':
+                try:
+                    body = self._proxy_body(system_prompt, user_prompt, deadline, priority, format,
+                                            profile)
+                    result = self._with_retries(
+                        deadline, timings,
+                        lambda budget: self._post(self.proxy_url + '/v1/generate', body,
+                                                  budget + PROXY_GRACE))
+                    timings.update(route='proxy', provider=result.get('provider'),
+                                   **result.get('timings', {}))
+                    if result.get('response'):
+                        return result['response']
+                except InferenceError as e:
+                    timings['error'] = str(e)
+                    if e.status == 504:
+                        logger.warning("Proxy: deadline exceeded, falling back")
+                    else:
+                        logger.warning(f"Proxy failed: {e}")
+                if self.route == 'proxy-only' or deadline.remaining() < MIN_ATTEMPT_SECONDS:
+                    _count(failures=1)
+                    return ''
+                _count(fallbacks=1)
+
+            payload = self._ollama_payload(system_prompt, user_prompt, False, options, format, profile)
+            try:
+                with self._ollama_ticket(deadline, priority, timings) as granted:
+                    if not granted:
+                        _count(failures=1)
+                        return ''
+                    result = self._with_retries(
+                        deadline, timings,
+                        lambda budget: self._post(self.ollama_url + '/api/generate', payload, budget))
+            except InferenceError as e:
+                timings['error'] = str(e)
+                logger.error(f"All inference failed ({self.route}): {e}")
+                _count(failures=1)
+                return ''
+            timings.update(route='ollama', provider='ollama', **ollama_timings(result))
+            return result.get('response', '')
+        finally:
+            timings['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+
+    def stream(self, system_prompt: str, user_prompt: str, timeout: float = None,
+               priority: str = None, options: dict = None, timings: dict = None,
+               profile: str = None):
+        """Yield text deltas. A route that fails before its first delta is
+        retried (or falls back to Ollama); one that fails after it stops
+        the stream, since the caller has already seen part of the text."""
+        deadline = Deadline(timeout or self.timeout)
+        timings = {} if timings is None else timings
+        start = time.monotonic()
+        _count(calls=1)
+        try:
+            if self.route != 'ollama':
+                body = self._proxy_body(system_prompt, user_prompt, deadline, priority,
+                                        profile=profile)
+                produced = yield from self._stream_route(
+                    deadline, timings, self.proxy_url + '/v1/generate?stream=1', body, PROXY_GRACE,
+                    lambda event: event.get('delta'), start)
+                if produced or self.route == 'proxy-only' or deadline.remaining() < MIN_ATTEMPT_SECONDS:
+                    if not produced:
+                        _count(failures=1)
+                    return
+                _count(fallbacks=1)
+
+            payload = self._ollama_payload(system_prompt, user_prompt, True, options, profile=profile)
+            with self._ollama_ticket(deadline, priority, timings) as granted:
+                if granted:
+                    produced = yield from self._stream_route(
+                        deadline, timings, self.ollama_url + '/api/generate', payload, 0,
+                        lambda event: event.get('response'), start)
+                    if produced:
+                        return
+            _count(failures=1)
+        finally:
+            timings['elapsed_ms'] = round((time.monotonic() - start) * 1000, 1)
+
+    def run_job(self, items: list, job: str = None, system_prompt: str = None,
+                priority: str = 'batch', backends: list = None, profile: str = None,
+                item_timeout: float = None):
+        """Run `items` ([{"id", "prompt", "system"?}, ...]) as a batch job on
+        the proxy and yield each item's record as it lands: {"event":
+        "result", "item", "response", "provider", "elapsed", ...} or
+        {"event": "failed", "item", "error"}. Name the `job` and running it
+        again after a crash (the proxy's or this process's) carries on where
+        it stopped, without redoing the finished items. `backends`, e.g.
+        ['ollama'], keeps it on those. Raises InferenceError if the proxy
+        can't take the job, or is gone for longer than JOB_RECONNECT_SECONDS."""
+        body = {'job': job, 'items': items, 'caller': self.caller, 'priority': priority,
+                'model': self.model}
+        if system_prompt is not None:
+            body['system'] = system_prompt
+        if backends:
+            body['backends'] = list(backends)
+        if profile or self.profile:
+            body['profile'] = profile or self.profile
+        if item_timeout:
+            body['timeout'] = item_timeout
+        after, accepted, lost_at = 0, False, None
+        while True:
+            try:
+                # Submitting again is how a job is found after a restart
+                submitted = self._with_retries(
+                    Deadline(self.timeout), {},
+                    lambda budget: self._post(self.proxy_url + '/v1/jobs', body, budget + PROXY_GRACE))
+                body['job'], accepted = submitted['job'], True
+                url = f"{self.proxy_url}/v1/jobs/results?job={quote(body['job'])}&after={after}&stream=1"
+                for event in self._events(url, JOB_STREAM_TIMEOUT):
+                    lost_at = None
+                    if event.get('done'):
+                        return
+                    if event.get('event') in ('result', 'failed'):
+                        after += 1
+                        yield event
+            except InferenceError as e:
+                if not accepted or not e.retryable:
+                    raise
+                lost_at = lost_at or time.monotonic()
+                if time.monotonic() - lost_at > JOB_RECONNECT_SECONDS:
+                    raise
+                logger.warning(f"Job {body['job']}: {e}, reconnecting")
+                time.sleep(self.backoff * 5)
+
+    # ── requests ────────────────────────────────────────────────────
+
+    def _proxy_body(self, system_prompt, user_prompt, deadline, priority=None, format=None,
+                    profile=None):
+        body = {
             'system': system_prompt,
-            'stream': False,
-            'options': {'temperature': 0.8, 'top_p': 0.9}
-        }).encode()
-
-        req = urllib.request.Request(
-            f"{OLLAMA_URL}/api/generate",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read().decode())
-
-        return result.get('response', '')
-    finally:
-        if lock_fd:
+            'prompt': user_prompt,
+            'timeout': deadline.remaining(),
+            'deadline': time.time() + deadline.remaining(),
+            'caller': self.caller,
+            'priority': priority or self.priority,
+            'model': self.model,  # For the proxy's Ollama leg
+        }
+        if self.hedge is not None:
+            body['hedge'] = self.hedge
+        if self.idempotent:
+            body['idempotent'] = True
+        if profile or self.profile:
+            body['profile'] = profile or self.profile
+        if format:
+            body['response_format'] = response_format(format)
+        return body
+
+    def _ollama_payload(self, system_prompt, user_prompt, stream, options=None, format=None,
+                        profile=None):
+        payload = {
+            'model': self.model,
+            'prompt': user_prompt,
+            'stream': stream,
+            'options': options or self.options,
+        }
+        if system_prompt:
+            payload['system'] = system_prompt
+        if format:
+            payload['format'] = format
+        if self.idempotent:
+            payload['idempotent'] = True  # The proxy's /api/generate coalesces these; Ollama ignores it
+        if profile or self.profile:
+            payload['profile'] = profile or self.profile
+        return payload
+
+    @contextmanager
+    def _ollama_ticket(self, deadline, priority, timings):
+        """Hold a ticket from the Ollama queue around a direct Ollama call,
+        or the OLLAMA_LOCK flock while the queue can't be reached. Yields
+        False if no slot came free before the deadline."""
+        ticket, granted, lock_fd = None, True, None
+        if self.queue_url and time.monotonic() >= _queue_down_until.get(self.queue_url, 0):
+            body = {'caller': self.caller, 'priority': priority or self.priority,
+                    'wait': deadline.remaining(), 'lease': deadline.remaining() + PROXY_GRACE}
+            start = time.monotonic()
             try:
+                ticket = self._post(self.queue_url + '/v1/tickets', body,
+                                    deadline.remaining() + PROXY_GRACE)['ticket']
+            except (InferenceError, KeyError, TypeError) as e:
+                if getattr(e, 'status', None) == 503:
+                    granted = False
+                    timings['error'] = f"Ollama queue: {e}"
+                    _count(queue_timeouts=1)
+                else:
+                    _queue_down_until[self.queue_url] = time.monotonic() + QUEUE_RETRY_SECONDS
+                    logger.warning(f"Ollama queue unavailable ({e}), using {OLLAMA_LOCK} "
+                                   f"for {QUEUE_RETRY_SECONDS}s")
+            timings['queue_ms'] = round((time.monotonic() - start) * 1000, 1)
+        if self.queue_url and ticket is None and granted:
+            start = time.monotonic()
+            lock_fd = _ollama_lock(deadline)
+            if lock_fd is False:
+                granted, lock_fd = False, None
+                timings['error'] = 'Ollama lock: deadline passed'
+                _count(queue_timeouts=1)
+            timings['queue_ms'] = timings.get('queue_ms', 0) + round((time.monotonic() - start) * 1000, 1)
+        try:
+            yield granted
+        finally:
+            if lock_fd:
                 fcntl.flock(lock_fd, fcntl.LOCK_UN)
                 lock_fd.close()
-            except:
-                pass
+            if ticket:
+                try:
+                    self._post(f"{self.queue_url}/v1/tickets/{ticket}/release", {}, 5)
+                except InferenceError as e:
+                    logger.warning(f"Ollama queue: release failed ({e}); the ticket will lapse")
+
+    def _with_retries(self, deadline, timings, call):
+        """call(budget) until it succeeds, a non-retryable error, or the
+        deadline; backoff doubles between attempts."""
+        attempt = 0
+        while True:
+            attempt += 1
+            timings['attempts'] = timings.get('attempts', 0) + 1
+            try:
+                return call(deadline.remaining())
+            except InferenceError as e:
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+                if (not e.retryable or attempt > self.retries
+                        or deadline.remaining() - delay < MIN_ATTEMPT_SECONDS):
+                    raise
+                logger.warning(f"{e}, retrying in {delay:.1f}s ({attempt}/{self.retries})")
+                _count(retries=1)
+                time.sleep(delay)
+
+    def _open(self, url, body, timeout, method='POST'):
+        """Send a request (a POST of `body`, or a GET) on a pooled connection.
+        Returns (origin, conn, response). A reused connection the server has
+        since closed is replaced once."""
+        parts = urlsplit(url)
+        origin = origin_of(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        data = json.dumps(body).encode() if method == 'POST' else None
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        try:
+            conn, reused = self.pool.get(origin, timeout)
+        except TransportError as e:
+            raise InferenceError(str(e)) from e
+        _count(connections_opened=int(not reused), connections_reused=int(reused))
+        self.pool.count(origin, requests=1)
+        try:
+            try:
+                conn.request(method, target, data, headers)
+                response = conn.getresponse()
+            except (ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                self.pool.connect(origin, conn, timeout)  # Dropped by the server while idle: reconnect once
+                conn.request(method, target, data, headers)
+                response = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            self.pool.discard(origin, conn)
+            self.pool.count(origin, errors=1)
+            raise InferenceError(f"{parts.netloc}: {e!r}") from e
+        if response.status >= 400:
+            detail = response.read()[:200].decode(errors='replace')
+            self._release(origin, conn, response)
+            raise InferenceError(f"{parts.netloc}{parts.path}: HTTP {response.status} {detail}",
+                                 response.status)
+        return origin, conn, response
+
+    def _release(self, origin, conn, response):
+        if response.will_close:
+            self.pool.discard(origin, conn)
+        else:
+            self.pool.put(origin, conn)
+
+    def _events(self, url, timeout):
+        """Yield the NDJSON events of a GET until the server ends the stream."""
+        origin, conn, response = self._open(url, None, timeout, method='GET')
+        finished = False
+        try:
+            for line in iter(response.readline, b''):
+                if line.strip():
+                    yield json.loads(line)
+            finished = True
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            raise InferenceError(f"{urlsplit(url).netloc}: {e!r}") from e
+        finally:
+            if finished:
+                self._release(origin, conn, response)
+            else:
+                self.pool.discard(origin, conn)
+
+    def _post(self, url, body, timeout):
+        origin, conn, response = self._open(url, body, timeout)
+        try:
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.pool.discard(origin, conn)
+            raise InferenceError(f"{urlsplit(url).netloc}: {e!r}") from e
+        self._release(origin, conn, response)
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise InferenceError(f"{urlsplit(url).netloc}: bad JSON ({e})") from e
+
+    def _stream_route(self, deadline, timings, url, body, grace, delta_of, start):
+        """Yield one route's deltas; returns whether any came. Only opening
+        the stream is retried: once it is open, however it ends (done, even
+        with no text, or cut off) is the route's answer."""
+        produced = False
+        attempt = 0
+        while True:
+            attempt += 1
+            timings['attempts'] = timings.get('attempts', 0) + 1
+            try:
+                origin, conn, response = self._open(url, body, deadline.remaining() + grace)
+            except InferenceError as e:
+                delay = self.backoff * 2 ** (attempt - 1)
+                if (not e.retryable or attempt > self.retries
+                        or deadline.remaining() - delay < MIN_ATTEMPT_SECONDS):
+                    timings['error'] = str(e)
+                    logger.warning(f"Stream failed: {e}")
+                    return False
+                _count(retries=1)
+                time.sleep(delay)
+                continue
+            finished = False
+            try:
+                for line in iter(response.readline, b''):
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    delta = delta_of(event)
+                    if delta:
+                        if not produced:
+                            timings['first_byte_ms'] = round((time.monotonic() - start) * 1000, 1)
+                        produced = True
+                        yield delta
+                    if event.get('done'):
+                        finished = True
+                        route = 'ollama' if url.startswith(self.ollama_url) else 'proxy'
+                        timings.update(route=route, provider=event.get('provider', route))
+                        timings.update(event.get('timings') or
+                                       (ollama_timings(event) if route == 'ollama' else {}))
+                        break
+                    if event.get('error'):
+                        logger.warning(f"Stream: {event['error']}")
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                timings['error'] = repr(e)
+                logger.warning(f"Stream interrupted: {e!r}")
+            finally:
+                if finished and not response.read():
+                    self._release(origin, conn, response)
+                else:
+                    self.pool.discard(origin, conn)
+            return produced
+
+
+def stats() -> dict:
+    """Totals for this process: calls, failures, retries, fallbacks to
+    Ollama, and connections opened vs reused."""
+    with _stats_lock:
+        return dict(STATS)
+
+
+_default = None
+
+
+def default_client() -> InferenceClient:
+    global _default
+    if _default is None:
+        _default = InferenceClient()
+    return _default
+
+
+def generate(system_prompt: str, user_prompt: str, timeout: int = 60,
+             priority: str = 'exploration', timings: dict = None, profile: str = None) -> str:
+    """Generate via inference proxy (cloud providers) with Ollama fallback.
+    The proxy handles Cerebras/Groq key rotation and rate limiting.
+    Tanks never see API keys or touch the internet.
+    priority: proxy scheduling class (visitor, congregation, exploration,
+    baseline, batch).
+    timings: if given, filled as described in the module docstring.
+    profile: the proxy's request profile (e.g. explore-thought)."""
+    return default_client().generate(system_prompt, user_prompt, timeout, priority,
+                                     timings=timings, profile=profile)
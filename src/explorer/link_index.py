@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Link graph of a ZIM, built once offline and memory-mapped by the readers.
+
+Knowing where an article links to otherwise means fetching and parsing
+it, and a random start means a kiwix search for a random word (slow, and
+biased towards whatever that word finds). --build walks every article of
+a ZIM once, with libzim, and writes <LINK_INDEX_DIR>/<ZIM>.links:
+
+    nodes     the ZIM's HTML articles whose paths pass the v7 tanks'
+              exclusion patterns (no Special:, Category:, ... pages),
+              numbered 0..nodes-1
+    links     each node's outgoing links as node ids, in page order,
+              without repeats or self-links (CSR: uint64 offsets into
+              one uint32 array), filtered by the same patterns; links
+              to redirects point at the redirect's target
+    keys      node paths, then redirect paths, in one UTF-8 blob, with
+              an open-addressing hash table (crc32, linear probing)
+              from path to node id
+
+Every section is a flat little-endian array, so LinkIndex only mmaps the
+file: nothing is read until it's used, the page cache shares it between
+processes, and a lookup, a node's links or a uniform random article
+cost microseconds. Paths are entry paths as in the ZIM (unquoted,
+underscores); find() also takes them quoted, with spaces or with an
+old-style "A/" in front.
+
+Building needs python-libzim and keeps every path in memory for the
+build (a few GB for the full English Wikipedia); reading is standard
+library only. Rebuild when the ZIM changes.
+
+Usage:
+    python3 link_index.py --build /zims/wikipedia_en_simple_all_nopic_2026-02.zim
+    python3 link_index.py wikipedia_en_simple_all_nopic_2026-02            # summary and timings
+    python3 link_index.py wikipedia_en_simple_all_nopic_2026-02 --links Science
+    python3 link_index.py wikipedia_en_simple_all_nopic_2026-02 --random 5
+    python3 link_index.py wikipedia_en_simple_all_nopic_2026-02 --path Science Music
+"""
+import os
+import re
+import sys
+import mmap
+import time
+import zlib
+import random
+import struct
+import logging
+import argparse
+import posixpath
+import threading
+from array import array
+from collections import deque
+from pathlib import Path
+from urllib.parse import unquote
+
+import articles
+
+LINK_INDEX_DIR = os.getenv('LINK_INDEX_DIR', '/data/link-index')
+MAGIC = b'DQLINKS1'
+HEADER = struct.Struct('<8sQQQQQ')  # magic, nodes, keys, hash slots, links, key bytes
+EMPTY = 0xFFFFFFFF
+
+# The v7 tanks' EXCLUDE_PATTERNS (tanks/adam/explore.py), applied the same way
+EXCLUDE_PATTERNS = [
+    # File extensions
+    r'\.css$', r'\.js$', r'\.png$', r'\.jpg$', r'\.svg$', r'\.ico$', r'\.gif$',
+    # English special pages
+    r'^Special:', r'^File:', r'^Category:', r'^Help:', r'^Portal:', r'^Template:', r'^Wikipedia:', r'^Talk:', r'^User:',
+    # Spanish special pages
+    r'^Especial:', r'^Archivo:', r'^Categoría:', r'^Ayuda:', r'^Plantilla:', r'^Usuario:',
+    # German special pages
+    r'^Spezial:', r'^Datei:', r'^Kategorie:', r'^Hilfe:', r'^Vorlage:', r'^Benutzer:',
+    # Chinese special pages
+    r'^特殊:', r'^文件:', r'^分类:', r'^帮助:', r'^模板:', r'^用户:',
+    # Japanese special pages
+    r'^特別:', r'^ファイル:', r'^カテゴリ:', r'^ヘルプ:', r'^テンプレート:', r'^利用者:',
+    # MediaWiki paths
+    r'/mw/', r'/w/', r'^mw/', r'^w/',
+    # Common non-article patterns
+    r'wikipedia', r'mediawiki', r'^#', r'^javascript:', r'^mailto:',
+]
+EXCLUDE_RE = re.compile('|'.join(EXCLUDE_PATTERNS), re.IGNORECASE)
+
+logger = logging.getLogger('LinkIndex')
+
+_indexes = {}  # (directory, ZIM) -> open LinkIndex, None if there's no file
+_lock = threading.Lock()
+
+
+def excluded(href):
+    return bool(EXCLUDE_RE.search(unquote(href)) or EXCLUDE_RE.search(href))
+
+
+def _padded(size):
+    return -size % 8
+
+
+class LinkIndex:
+    """A .links file, memory-mapped. Node ids are ints in range(len(index))."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nodes, self.keys, slots, self.edges, key_bytes = HEADER.unpack_from(self._map)
+        if magic != MAGIC or sys.byteorder != 'little':
+            raise ValueError(f"{self.path} is not a link index this machine can read")
+        self._mask = slots - 1
+        view = memoryview(self._map)
+        pos = HEADER.size
+
+        def section(fmt, count):
+            nonlocal pos
+            size = count * struct.calcsize(fmt)
+            data = view[pos:pos + size].cast(fmt)
+            pos += size + _padded(size)
+            return data
+
+        self._link_offsets = section('Q', self.nodes + 1)
+        self._links = section('I', self.edges)
+        self._key_offsets = section('Q', self.keys + 1)
+        self._key_ids = section('I', self.keys)
+        self._table = section('I', slots)
+        self._blob = section('B', key_bytes)
+
+    def __len__(self):
+        return self.nodes
+
+    def title(self, node):
+        """The node's path in the ZIM."""
+        return bytes(self._blob[self._key_offsets[node]:self._key_offsets[node + 1]]).decode('utf-8')
+
+    def _lookup(self, key):
+        slot = zlib.crc32(key) & self._mask
+        while (k := self._table[slot]) != EMPTY:
+            if self._blob[self._key_offsets[k]:self._key_offsets[k + 1]] == key:
+                return self._key_ids[k]
+            slot = (slot + 1) & self._mask
+        return None
+
+    def find(self, path):
+        """The node id for `path` (or a redirect to it), None if it isn't one."""
+        name = unquote(path)
+        for candidate in (name, name.replace(' ', '_'), name[2:] if name.startswith('A/') else None):
+            if candidate and (node := self._lookup(candidate.encode('utf-8'))) is not None:
+                return node
+        return None
+
+    def links(self, node):
+        """Node ids the node links to, in page order."""
+        return self._links[self._link_offsets[node]:self._link_offsets[node + 1]]
+
+    def neighbours(self, path):
+        """Paths `path` links to, None if it isn't in the index."""
+        node = self.find(path)
+        return None if node is None else [self.title(n) for n in self.links(node)]
+
+    def random_article(self, rng=random):
+        """An article path, every node equally likely."""
+        return self.title(rng.randrange(self.nodes))
+
+    def shortest_path(self, source, target, max_nodes=None):
+        """Fewest clicks from `source` to `target` as a list of paths (both
+        ends included), None if there's no such path or either isn't in the
+        index. Breadth-first; gives up after visiting max_nodes."""
+        start, goal = self.find(source), self.find(target)
+        if start is None or goal is None:
+            return None
+        parent = {start: None}
+        queue = deque([start])
+        while queue and goal not in parent:
+            if max_nodes and len(parent) >= max_nodes:
+                return None
+            node = queue.popleft()
+            for n in self.links(node):
+                if n not in parent:
+                    parent[n] = node
+                    queue.append(n)
+        if goal not in parent:
+            return None
+        path, node = [], goal
+        while node is not None:
+            path.append(self.title(node))
+            node = parent[node]
+        return path[::-1]
+
+    def stats(self):
+        return {'nodes': self.nodes, 'links': self.edges, 'redirects': self.keys - self.nodes,
+                'mean_links': round(self.edges / max(self.nodes, 1), 1),
+                'file_mb': round(self.path.stat().st_size / 1048576, 1)}
+
+
+def index_path(zim, index_dir=None):
+    return Path(LINK_INDEX_DIR if index_dir is None else index_dir) / f'{zim}.links'
+
+
+def open_index(zim, index_dir=None):
+    """The LinkIndex for `zim` in index_dir (LINK_INDEX_DIR by default),
+    None if it hasn't been built. Opened once and kept."""
+    key = (index_dir, zim)
+    with _lock:
+        if key not in _indexes:
+            path = index_path(zim, index_dir)
+            index = None
+            if path.is_file():
+                try:
+                    index = LinkIndex(path)
+                    logger.info(f"Link index for {zim}: {index.nodes} articles, {index.edges} links")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Can't open {path}: {e}")
+            _indexes[key] = index
+        return _indexes[key]
+
+
+# ── building ────────────────────────────────────────────────────────
+
+def resolve(base, href):
+    """The entry path `href` points at from a page in directory `base`,
+    None if it leaves the ZIM."""
+    name = unquote(href.split('#')[0].split('?')[0])
+    if not name:
+        return None
+    path = posixpath.normpath(posixpath.join(base, name))
+    return None if path == '..' or path.startswith('../') or path.startswith('/') else path
+
+
+def build(zim_file, out, log_every=10000):
+    """Walk every entry of `zim_file` and write its link index to `out`."""
+    from libzim.reader import Archive
+    archive = Archive(str(zim_file))
+    start = time.monotonic()
+
+    # Nodes: the HTML articles, in entry order
+    ids, paths, entries, redirects = {}, [], array('I'), []
+    for i in range(archive.entry_count):
+        entry = archive._get_entry_by_id(i)
+        if entry.is_redirect:
+            redirects.append(entry.path)
+        elif not excluded(entry.path) and entry.get_item().mimetype.startswith('text/html'):
+            ids[entry.path] = len(paths)
+            paths.append(entry.path)
+            entries.append(i)
+    nodes = len(paths)
+
+    # Redirects: another key for their target's node
+    aliases = []
+    for path in redirects:
+        entry = archive.get_entry_by_path(path)
+        for _ in range(10):
+            if not entry.is_redirect:
+                break
+            entry = entry.get_redirect_entry()
+        if not excluded(path) and entry.path in ids:
+            aliases.append(path)
+            ids[path] = ids[entry.path]
+    logger.info(f"{zim_file}: {nodes} articles, {len(aliases)} redirects")
+
+    # Links, in CSR form
+    offsets, links = array('Q', [0]), array('I')
+    for node, i in enumerate(entries):
+        html = bytes(archive._get_entry_by_id(i).get_item().content).decode('utf-8', errors='ignore')
+        base = posixpath.dirname(paths[node])
+        seen = {node}
+        for link in articles.parse(html)['links']:
+            if excluded(link['href']):
+                continue
+            target = ids.get(resolve(base, link['href']))
+            if target is not None and target not in seen:
+                seen.add(target)
+                links.append(target)
+        offsets.append(len(links))
+        if log_every and (node + 1) % log_every == 0:
+            logger.info(f"   {node + 1}/{nodes} articles, {len(links)} links, {time.monotonic() - start:.0f}s")
+
+    write(out, paths + aliases, [ids[p] for p in aliases], nodes, offsets, links)
+    logger.info(f"Wrote {out}: {nodes} articles, {len(links)} links, {len(aliases)} redirects "
+                f"in {time.monotonic() - start:.0f}s")
+
+
+def write(out, keys, alias_ids, nodes, link_offsets, links):
+    """keys: the node paths, then the redirect paths (alias_ids: their nodes)."""
+    encoded = [k.encode('utf-8') for k in keys]
+    key_offsets = array('Q', [0])
+    for k in encoded:
+        key_offsets.append(key_offsets[-1] + len(k))
+    key_ids = array('I', range(nodes))
+    key_ids.extend(alias_ids)
+    slots = 8
+    while slots < 2 * len(encoded):
+        slots *= 2
+    table = array('I', [EMPTY]) * slots
+    for k, key in enumerate(encoded):
+        slot = zlib.crc32(key) & (slots - 1)
+        while table[slot] != EMPTY:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = k
+
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, nodes, len(encoded), slots, len(links), key_offsets[-1]))
+        for data in (link_offsets, links, key_offsets, key_ids, table):
+            size = len(data) * data.itemsize
+            f.write(data.tobytes() + bytes(_padded(size)))
+        for k in encoded:
+            f.write(k)
+    os.replace(tmp, out)
+
+
+# ── command line ────────────────────────────────────────────────────
+
+def summary(index, n=20000):
+    """Stats, and microseconds per lookup, per node's links and per random article."""
+    rng = random.Random(1)
+    sample = [index.random_article(rng) for _ in range(min(n, 2000))]
+    timings = {}
+    start = time.perf_counter()
+    for i in range(n):
+        index.find(sample[i % len(sample)])
+    timings['find_us'] = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for i in range(n):
+        [index.title(t) for t in index.links(i % index.nodes)]
+    timings['neighbours_us'] = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        index.random_article(rng)
+    timings['random_us'] = (time.perf_counter() - start) / n * 1e6
+    return {**index.stats(), **{k: round(v, 2) for k, v in timings.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the link graph of a ZIM')
+    parser.add_argument('zim', nargs='?', help='ZIM name (its index in --dir) or a .links file')
+    parser.add_argument('--build', metavar='ZIM_FILE', help='Index this .zim file')
+    parser.add_argument('--dir', default=LINK_INDEX_DIR, help='Where indexes are (default LINK_INDEX_DIR)')
+    parser.add_argument('--links', metavar='PATH', help="An article's links")
+    parser.add_argument('--random', type=int, metavar='N', help='N uniformly random articles')
+    parser.add_argument('--path', nargs=2, metavar=('FROM', 'TO'), help='Fewest clicks between two articles')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    if args.build:
+        return build(args.build, index_path(Path(args.build).stem, args.dir))
+    if not args.zim:
+        parser.error('give a ZIM name or --build')
+    index = LinkIndex(args.zim if args.zim.endswith('.links') else index_path(args.zim, args.dir))
+    if args.links:
+        links = index.neighbours(args.links)
+        if links is None:
+            raise SystemExit(f"{args.links} isn't in the index")
+        print('\n'.join(links))
+    elif args.random:
+        print('\n'.join(index.random_article() for _ in range(args.random)))
+    elif args.path:
+        path = index.shortest_path(*args.path)
+        print(' -> '.join(path) if path else 'No path')
+    else:
+        for key, value in summary(index).items():
+            print(f"{key:<15}{value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Article extraction micro-benchmark: pages parsed per second, per extractor.
+
+Parses a corpus of saved kiwix pages with every extractor articles.py has
+(html.parser always; lxml and selectolax when installed), first checking
+each one's records against html.parser's, byte for byte as JSON. Then
+times each over the corpus, parsing whole pages and again with the
+--max-chars / --max-links quota (parsing stops once the page has that
+much text and that many links), best of --rounds.
+
+The corpus is a directory of .html files. --save fills one from a running
+kiwix-serve: the tanks' start articles and the pages they link to, up to
+--pages. Without a corpus, zim_bench.py's synthetic pages are used.
+
+Usage:
+    python3 parse_bench.py --save corpus/ --kiwix http://localhost:8080 \\
+        --zim wikipedia_en_simple_all_nopic_2026-02 --pages 300
+    python3 parse_bench.py --corpus corpus/
+    python3 parse_bench.py                 # synthetic pages
+"""
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import articles
+
+STARTS = ['Science', 'History', 'Philosophy', 'Music', 'Art', 'Mathematics', 'Biology', 'Psychology']
+
+
+def save_corpus(directory, kiwix_url, zim, pages):
+    """Breadth-first from STARTS over the pages' own links."""
+    directory.mkdir(parents=True, exist_ok=True)
+    queue, seen, saved = [quote(s) for s in STARTS], set(), 0
+    while queue and saved < pages:
+        path = queue.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            html = articles.fetch_html(kiwix_url, zim, path)
+        except articles.ArticleError as e:
+            print(f"   skipped {unquote(path)}: {e}")
+            continue
+        name = unquote(path).replace('/', '_')[:150]
+        (directory / f'{name}.html').write_text(html, encoding='utf-8')
+        saved += 1
+        queue.extend(l['href'].lstrip('./') for l in articles.parse(html)['links']
+                     if ':' not in l['href'] and not l['href'].startswith(('/', '../')))
+    print(f"Saved {saved} pages to {directory}")
+
+
+def load_corpus(directory, synthetic):
+    if directory:
+        return [(p.name, p.read_text(encoding='utf-8', errors='ignore'))
+                for p in sorted(Path(directory).glob('*.html'))]
+    from zim_bench import article_html
+    return [(f'synthetic-{i}', article_html(i, synthetic, 8, random.Random(i))) for i in range(synthetic)]
+
+
+def pages_per_second(pages, extractor, rounds, max_chars=None, max_links=None):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _, html in pages:
+            articles.parse(html, max_chars, max_links, extractor)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(len(pages) / best, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pages per second for each article extractor')
+    parser.add_argument('--corpus', help='Directory of saved kiwix pages (*.html)')
+    parser.add_argument('--synthetic', type=int, default=300, help='Synthetic pages when there is no corpus')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--max-chars', type=int, default=3000, help='Quota run: text needed')
+    parser.add_argument('--max-links', type=int, default=20, help='Quota run: links needed')
+    parser.add_argument('--save', metavar='DIR', help='Save a corpus from --kiwix instead of benchmarking')
+    parser.add_argument('--kiwix', default='http://localhost:8080')
+    parser.add_argument('--zim', default='wikipedia_en_simple_all_nopic_2026-02')
+    parser.add_argument('--pages', type=int, default=300, help='Pages to save')
+    parser.add_argument('--json', help='Write the results here')
+    args = parser.parse_args()
+
+    if args.save:
+        return save_corpus(Path(args.save), args.kiwix, args.zim, args.pages)
+
+    pages = load_corpus(args.corpus, args.synthetic)
+    if not pages:
+        raise SystemExit(f"No .html files in {args.corpus}")
+    size = sum(len(html.encode()) for _, html in pages)
+    print(f"{len(pages)} pages, {size / 1048576:.1f} MB; extractors: {', '.join(articles.EXTRACTORS)} "
+          f"(auto: {articles.extractor_name('auto')})\n")
+
+    reference = {name: json.dumps(articles.parse(html, extractor='html.parser')) for name, html in pages}
+    quota = (args.max_chars, args.max_links)
+    quota_reference = {name: json.dumps(articles.parse(html, *quota, extractor='html.parser'))
+                       for name, html in pages}
+    results = []
+    for extractor in articles.EXTRACTORS:
+        differ = [name for name, html in pages
+                  if json.dumps(articles.parse(html, extractor=extractor)) != reference[name]
+                  or json.dumps(articles.parse(html, *quota, extractor=extractor)) != quota_reference[name]]
+        results.append({'extractor': extractor, 'differ': len(differ), 'differing_pages': differ[:20],
+                        'pages_per_sec': pages_per_second(pages, extractor, args.rounds),
+                        'quota_pages_per_sec': pages_per_second(pages, extractor, args.rounds, *quota)})
+
+    base = results[0]['pages_per_sec']
+    print(f"{'extractor':<13}{'pages/s':>10}{'quota pages/s':>15}{'speedup':>9}{'differ':>8}")
+    for r in results:
+        print(f"{r['extractor']:<13}{r['pages_per_sec']:>10}{r['quota_pages_per_sec']:>15}"
+              f"{r['pages_per_sec'] / base:>8.1f}x{r['differ']:>8}")
+    print(f"\nquota: {args.max_chars} chars and {args.max_links} links")
+    for r in results:
+        if r['differ']:
+            print(f"{r['extractor']}: records differ from html.parser's on {', '.join(r['differing_pages'])}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Prompt layout for the explorer, ordered for Ollama's prompt cache.
+
+Ollama keeps the evaluated tokens of the previous prompt and only evaluates
+what comes after the longest identical prefix. On CPU that evaluation is
+most of the cost of a call, so the prompt is laid out stablest first:
+
+1. persona + SecureClaw + extensions (fixed for the life of the tank)
+2. memory (brain/soul), re-read every MEMORY_REFRESH_TURNS turns instead of
+   every turn: the tail of brain.md shifts with every new entry
+3. the article and its links, last, in the user prompt
+
+Ollama's returned `context` is not reused: it holds the whole previous
+exchange, so sending it back would grow every prompt by the last answer
+instead of sharing a prefix.
+"""
+import os
+
+MEMORY_REFRESH_TURNS = int(os.getenv('MEMORY_REFRESH_TURNS', '10'))
+
+
+class PromptLayout:
+    """The explorer's system prompt: a fixed block, then a memory snapshot."""
+
+    def __init__(self, static: str, load_memory=None, refresh_turns: int = MEMORY_REFRESH_TURNS):
+        self.static = static
+        self.load_memory = load_memory
+        self.refresh_turns = max(1, refresh_turns)
+        self.memory = ''
+        self.turns = 0
+
+    def system(self) -> str:
+        """System prompt for this turn; the memory part only changes every
+        `refresh_turns` calls."""
+        if self.load_memory and self.turns % self.refresh_turns == 0:
+            try:
+                self.memory = self.load_memory()
+            except Exception:
+                pass  # Keep the last snapshot
+        self.turns += 1
+        if not self.memory:
+            return self.static
+        return self.static + "\n\n" + self.memory
@@ -0,0 +1,241 @@
+"""
+HTTP for everything a tank talks to: kept-alive connections per upstream.
+
+Inference calls (inference.py), article fetches from kiwix and the
+article cache (articles.py), explorer.py's pages and searches and the
+tanks' startup checks all go through one ConnectionPool, instead of a
+new TCP connection per article and per generation:
+
+- connections are kept alive per upstream (scheme, host, port) and
+  reused; up to MAX_IDLE are kept idle and MAX_CONNECTIONS are open at
+  once per upstream (further callers wait for one, up to their timeout,
+  and aren't retried if none frees up)
+- connecting has its own timeout, CONNECT_TIMEOUT, apart from the read
+  timeout each call passes
+- request() retries connection failures and 502/503/504 answers
+  RETRIES times, with jittered exponential backoff. A read timeout isn't
+  retried: the upstream is there but slow, and trying again only doubles
+  the wait. A kept connection the upstream has closed meanwhile is
+  replaced once, without counting as a retry
+- stats() has, per upstream ("host:port"): requests, connections opened
+  and reused, the reuse rate, retries, errors and connect latency (mean
+  and max ms). The v7 tanks put it in their health status
+
+Standard library only, like inference.py.
+"""
+import os
+import time
+import random
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('Transport')
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+MAX_IDLE = int(os.getenv('HTTP_MAX_IDLE', '4'))                  # Idle connections kept per upstream
+MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '32'))   # Open at once per upstream, 0: no limit
+RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.5'))
+RETRY_STATUSES = {502, 503, 504}
+USER_AGENT = 'Digiquarium/7.0'
+
+
+class TransportError(OSError):
+    """No usable answer from an upstream: it couldn't be reached, the
+    connection failed, or (get_text) it answered with an error status."""
+
+    def __init__(self, message, status=None, retryable=True):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class Response:
+    def __init__(self, status, reason, headers, data):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+
+def origin_of(url):
+    """(scheme, host, port) of a URL."""
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+
+
+def upstream_name(origin):
+    return f"{origin[1]}:{origin[2]}"
+
+
+class ConnectionPool:
+    """Keep-alive connections per origin, shared by threads. Every
+    connection get() hands out goes back through put() (reusable) or
+    discard() (closed), which frees its slot."""
+
+    def __init__(self, max_idle=MAX_IDLE, max_connections=MAX_CONNECTIONS, connect_timeout=CONNECT_TIMEOUT):
+        self.max_idle = max_idle
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.idle = {}
+        self.slots = {}
+        self.upstreams = {}
+        self.lock = threading.Lock()
+
+    def count(self, origin, **deltas):
+        with self.lock:
+            counts = self.upstreams.get(origin)
+            if counts is None:
+                counts = self.upstreams[origin] = {'requests': 0, 'opened': 0, 'reused': 0, 'retries': 0,
+                                                   'errors': 0, 'connect_ms': 0.0, 'connect_ms_max': 0.0}
+            for key, n in deltas.items():
+                counts[key] += n
+            if 'connect_ms' in deltas:
+                counts['connect_ms_max'] = max(counts['connect_ms_max'], deltas['connect_ms'])
+
+    def get(self, origin, timeout):
+        """(connection, reused) for origin = (scheme, host, port), its socket
+        timeout set to `timeout`. Raises TransportError if no slot frees up
+        within `timeout` or connecting fails."""
+        if self.max_connections:
+            with self.lock:
+                slots = self.slots.setdefault(origin, threading.BoundedSemaphore(self.max_connections))
+            if not slots.acquire(timeout=timeout):
+                self.count(origin, errors=1)
+                raise TransportError(f"{upstream_name(origin)}: all {self.max_connections} connections busy",
+                                     retryable=False)
+        with self.lock:
+            idle = self.idle.get(origin)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            self.count(origin, reused=1)
+            return conn, True
+        scheme, host, port = origin
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = cls(host, port, timeout=timeout)
+        try:
+            self.connect(origin, conn, timeout)
+        except OSError as e:
+            self.discard(origin, conn)
+            self.count(origin, errors=1)
+            raise TransportError(f"{upstream_name(origin)}: can't connect ({e!r})") from e
+        return conn, False
+
+    def connect(self, origin, conn, timeout):
+        """(Re)connect `conn` within CONNECT_TIMEOUT, then give it the read
+        timeout. Raises OSError."""
+        conn.close()
+        conn.timeout = min(timeout, self.connect_timeout)
+        start = time.perf_counter()
+        conn.connect()
+        self.count(origin, opened=1, connect_ms=(time.perf_counter() - start) * 1000)
+        conn.timeout = timeout
+        conn.sock.settimeout(timeout)
+
+    def put(self, origin, conn):
+        with self.lock:
+            idle = self.idle.setdefault(origin, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+        self._release(origin)
+
+    def discard(self, origin, conn):
+        conn.close()
+        self._release(origin)
+
+    def _release(self, origin):
+        if self.max_connections:
+            self.slots[origin].release()
+
+    def stats(self):
+        with self.lock:
+            upstreams = {origin: dict(counts) for origin, counts in self.upstreams.items()}
+        result = {}
+        for origin, c in upstreams.items():
+            handed_out = c['opened'] + c['reused']
+            result[upstream_name(origin)] = {
+                'requests': c['requests'], 'opened': c['opened'], 'reused': c['reused'],
+                'reuse_rate': round(c['reused'] / handed_out, 3) if handed_out else 0.0,
+                'retries': c['retries'], 'errors': c['errors'],
+                'connect_ms': round(c['connect_ms'] / c['opened'], 2) if c['opened'] else None,
+                'connect_ms_max': round(c['connect_ms_max'], 2)}
+        return result
+
+
+POOL = ConnectionPool()
+
+
+def _send(pool, origin, method, target, body, headers, timeout):
+    conn, reused = pool.get(origin, timeout)
+    pool.count(origin, requests=1)
+    try:
+        try:
+            conn.request(method, target, body, headers)
+            response = conn.getresponse()
+        except (ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            pool.connect(origin, conn, timeout)  # Dropped by the upstream while idle: reconnect once
+            conn.request(method, target, body, headers)
+            response = conn.getresponse()
+        data = response.read()
+    except (OSError, http.client.HTTPException) as e:
+        pool.discard(origin, conn)
+        pool.count(origin, errors=1)
+        raise TransportError(f"{upstream_name(origin)}: {e!r}", retryable=not isinstance(e, TimeoutError)) from e
+    if response.will_close:
+        pool.discard(origin, conn)
+    else:
+        pool.put(origin, conn)
+    return Response(response.status, response.reason, response.headers, data)
+
+
+def request(url, method='GET', body=None, headers=None, timeout=30, retries=None, pool=None):
+    """One request on a kept-alive connection: a Response, whatever its
+    status. Connection failures and RETRY_STATUSES are retried `retries`
+    times (RETRIES by default) with jittered backoff; the last such answer
+    is returned. Raises TransportError."""
+    pool = pool or POOL
+    retries = RETRIES if retries is None else retries
+    parts = urlsplit(url)
+    origin = origin_of(url)
+    target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    headers = {'User-Agent': USER_AGENT, 'Connection': 'keep-alive', **(headers or {})}
+    attempt = 0
+    while True:
+        try:
+            response = _send(pool, origin, method, target, body, headers, timeout)
+            if response.status not in RETRY_STATUSES or attempt >= retries:
+                return response
+            error = f"HTTP {response.status}"
+        except TransportError as e:
+            if not e.retryable or attempt >= retries:
+                raise
+            error = e
+        attempt += 1
+        delay = RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        pool.count(origin, retries=1)
+        logger.info(f"{parts.netloc}{parts.path}: {error}, retrying in {delay:.1f}s ({attempt}/{retries})")
+        time.sleep(delay)
+
+
+def get_text(url, timeout=30, headers=None, retries=None):
+    """The body of a GET as text. Raises TransportError, also when the
+    answer is an error status."""
+    response = request(url, headers=headers, timeout=timeout, retries=retries)
+    if response.status >= 400:
+        raise TransportError(f"{url}: HTTP {response.status} {response.reason}", response.status)
+    return response.data.decode('utf-8', errors='ignore')
+
+
+def stats():
+    """Per upstream, for this process (see the module docstring)."""
+    return POOL.stats()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Article source benchmark: ZIM file through libzim against HTTP kiwix.
+
+Builds a synthetic ZIM (--articles pages of generated text and links,
+with python-libzim's writer), then reads -n random pages from it twice,
+each run in a fresh process:
+
+    http   over HTTP from a kiwix stand-in serving the same ZIM (a small
+           stdlib server reading it through libzim; --kiwix points at a
+           real kiwix-serve on that file instead)
+    zim    straight from the file (articles.py with ZIM_DIR)
+
+Reported per source: pages/sec for reading the HTML alone and for
+reading plus parsing (articles.get_page, as the tanks call it), and the
+RSS of the reading process at start and end (plus the server's, for
+http). The file is memory-mapped, so the zim reader's RSS grows with the
+part of the ZIM it has touched rather than with the number of pages.
+
+Needs python-libzim (pip install libzim).
+
+Usage:
+    python3 zim_bench.py                      # 2000 articles, 5000 reads
+    python3 zim_bench.py --articles 20000 -n 20000 --paragraphs 12
+    python3 zim_bench.py --zim /data/bench.zim --kiwix http://localhost:8080
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from urllib.parse import quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import articles
+
+BOOK = 'bench_en_all_2026-01'
+WORDS = ('the a of and light river memory curious small old deep quiet wonder because stone water '
+         'idea history strange maybe always pattern city music number animal forest question '
+         'between reason map star language slowly bright echo thread fire winter story').split()
+
+
+def title(i):
+    return f'Topic {i}'
+
+
+def article_html(i, count, paragraphs, rng):
+    """A page shaped like a kiwix nopic article: h1, paragraphs with inline
+    links to other pages, a list of related links."""
+    body = []
+    for _ in range(paragraphs):
+        words = []
+        for _ in range(rng.randint(60, 140)):
+            if rng.random() < 0.04:
+                target = title(rng.randrange(count))
+                words.append(f'<a href="{quote(target.replace(" ", "_"))}">{target}</a>')
+            else:
+                words.append(rng.choice(WORDS))
+        body.append(f'<p>{" ".join(words)}.</p>')
+    related = ''.join(f'<li><a href="{quote(title(j).replace(" ", "_"))}">{title(j)}</a></li>'
+                      for j in rng.sample(range(count), min(8, count)))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title(i)}</title>'
+            f'<style>body{{margin:0}}</style></head><body><div id="content">'
+            f'<h1>{title(i)}</h1><div class="mw-parser-output">{"".join(body)}'
+            f'<h2>See also</h2><ul>{related}</ul></div></div></body></html>')
+
+
+def build_zim(path, count, paragraphs, seed=1):
+    from libzim.writer import Creator, Item, StringProvider, Hint
+
+    class Page(Item):
+        def __init__(self, i):
+            super().__init__()
+            self.i = i
+
+        def get_path(self):
+            return title(self.i).replace(' ', '_')
+
+        def get_title(self):
+            return title(self.i)
+
+        def get_mimetype(self):
+            return 'text/html'
+
+        def get_contentprovider(self):
+            return StringProvider(article_html(self.i, count, paragraphs, random.Random(seed * 1000003 + self.i)))
+
+        def get_hints(self):
+            return {Hint.FRONT_ARTICLE: True}
+
+    start = time.monotonic()
+    with Creator(str(path)).config_indexing(False, 'eng') as creator:
+        creator.set_mainpath(title(0).replace(' ', '_'))
+        for name, value in (('Title', 'Digiquarium benchmark'), ('Language', 'eng'),
+                            ('Description', 'Synthetic articles for zim_bench.py')):
+            creator.add_metadata(name, value)
+        for i in range(count):
+            creator.add_item(Page(i))
+    print(f"Built {path} ({count} articles, {path.stat().st_size / 1048576:.1f} MB) "
+          f"in {time.monotonic() - start:.1f}s")
+
+
+def rss_mb(pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+# ── kiwix stand-in ──────────────────────────────────────────────────
+
+def serve(zim_path, port):
+    from libzim.reader import Archive
+    archive = Archive(zim_path)
+    book = Path(zim_path).stem
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            prefix = f'/{book}/'
+            try:
+                if not self.path.startswith(prefix):
+                    raise articles.NotFound(self.path)
+                data = articles.read_zim(archive, book, self.path[len(prefix):]).encode()
+                status = 200
+            except articles.NotFound:
+                data, status = b'not found', 404
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    print(json.dumps({'port': server.server_port}), flush=True)
+    server.serve_forever()
+
+
+# ── one run ─────────────────────────────────────────────────────────
+
+def run(source, zim_path, kiwix_url, count, n, seed):
+    """Read n random pages from `source`; prints the result as JSON."""
+    book = Path(zim_path).stem
+    zim_dir = str(Path(zim_path).parent) if source == 'zim' else ''
+    rng = random.Random(seed)
+    paths = [quote(title(rng.randrange(count)).replace(' ', '_'), safe='') for _ in range(n)]
+    result = {'source': source, 'rss_start_mb': rss_mb()}
+
+    start = time.monotonic()
+    for path in paths:
+        articles.read_html(kiwix_url, book, path, zim_dir=zim_dir)
+    read_seconds = time.monotonic() - start
+
+    start = time.monotonic()
+    for path in paths:
+        articles.get_page(kiwix_url, f'/{book}', path, cache_url='', zim_dir=zim_dir)
+    page_seconds = time.monotonic() - start
+
+    counts = articles.stats()
+    if counts['from_zim' if source == 'zim' else 'fetched'] != n:
+        raise SystemExit(f"{source}: pages came from the wrong source: {counts}")
+    result.update(read_per_sec=round(n / read_seconds, 1), page_per_sec=round(n / page_seconds, 1),
+                  rss_end_mb=rss_mb())
+    print(json.dumps(result), flush=True)
+
+
+def child(*args):
+    return [sys.executable, str(Path(__file__).resolve()), *map(str, args)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading articles from a ZIM file against HTTP')
+    parser.add_argument('--articles', type=int, default=2000, help='Articles in the synthetic ZIM')
+    parser.add_argument('--paragraphs', type=int, default=8, help='Paragraphs per article')
+    parser.add_argument('-n', '--reads', type=int, default=5000, help='Random pages read per source')
+    parser.add_argument('--zim', help='Use (or build, if missing) the synthetic ZIM at this path')
+    parser.add_argument('--kiwix', help='A kiwix-serve already serving --zim, instead of the stand-in')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Write the results here')
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--run', choices=('http', 'zim'), help=argparse.SUPPRESS)
+    parser.add_argument('--kiwix-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+    if args.run:
+        return run(args.run, args.zim, args.kiwix_url, args.articles, args.reads, args.seed)
+    if articles.Archive is None:
+        raise SystemExit('python-libzim is not installed (pip install libzim)')
+
+    tmp = tempfile.TemporaryDirectory()
+    zim_path = Path(args.zim) if args.zim else Path(tmp.name) / f'{BOOK}.zim'
+    if not zim_path.exists():
+        zim_path.parent.mkdir(parents=True, exist_ok=True)
+        build_zim(zim_path, args.articles, args.paragraphs, args.seed)
+
+    server = None
+    kiwix_url = args.kiwix
+    if not kiwix_url:
+        server = subprocess.Popen(child('--serve', zim_path), stdout=subprocess.PIPE, text=True)
+        kiwix_url = f"http://127.0.0.1:{json.loads(server.stdout.readline())['port']}"
+    results = []
+    try:
+        for source in ('http', 'zim'):
+            out = subprocess.run(child('--run', source, '--zim', zim_path, '--kiwix-url', kiwix_url,
+                                       '--articles', args.articles, '-n', args.reads, '--seed', args.seed),
+                                 capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            if source == 'http' and server:
+                result['server_rss_mb'] = rss_mb(server.pid)
+            results.append(result)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(f"\n{args.reads} random reads of {args.articles} articles "
+          f"({zim_path.stat().st_size / 1048576:.1f} MB ZIM)")
+    print(f"{'source':<8}{'read/s':>10}{'read+parse/s':>14}{'RSS start':>11}{'RSS end':>10}{'server RSS':>12}")
+    for r in results:
+        server_rss = r.get('server_rss_mb')
+        print(f"{r['source']:<8}{r['read_per_sec']:>10}{r['page_per_sec']:>14}{r['rss_start_mb']:>10}M"
+              f"{r['rss_end_mb']:>9}M{'' if server_rss is None else f'{server_rss}M':>12}")
+    http, zim = results
+    print(f"\nzim vs http: {zim['read_per_sec'] / http['read_per_sec']:.1f}x reads, "
+          f"{zim['page_per_sec'] / http['page_per_sec']:.1f}x pages")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
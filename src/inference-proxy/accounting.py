@@ -0,0 +1,182 @@
+"""
+Token accounting and daily budgets for the inference proxy.
+
+Every upstream call is recorded against its caller (tank), provider and
+key: prompt and completion tokens (the provider's `usage` block, Ollama's
+prompt_eval_count / eval_count), latency, and whether it failed. The
+aggregates for the current day are kept in memory and written every
+`interval` seconds to <directory>/usage-YYYY-MM-DD.json (atomically, so a
+reader never sees half a file); a restart picks today's file back up.
+Files older than `keep_days` are removed. scripts/budget_tracker.py reads
+them.
+
+Budgets are daily token limits, per caller and per provider ("*" sets the
+default for callers not listed). A caller's budget counts cloud tokens
+only: once it is spent, the caller is served by Ollama alone (and, in the
+proxy, at a lower priority). A provider whose budget is spent is skipped
+by routing until the day rolls over.
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger('InferenceProxy')
+
+LOCAL_PROVIDERS = ('ollama',)
+
+
+def today():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+def _counters():
+    return {'requests': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+            'latency_seconds': 0.0}
+
+
+def _add(counters, prompt_tokens, completion_tokens, latency, ok):
+    counters['requests'] += 1
+    counters['errors'] += 0 if ok else 1
+    counters['prompt_tokens'] += prompt_tokens
+    counters['completion_tokens'] += completion_tokens
+    counters['latency_seconds'] += latency or 0.0
+
+
+def _tokens(counters):
+    return counters['prompt_tokens'] + counters['completion_tokens']
+
+
+class Ledger:
+    """Today's usage per caller/provider and per provider/key, plus budgets."""
+
+    def __init__(self, directory=None, keep_days=30, caller_budgets=None, provider_budgets=None):
+        self.directory = Path(directory) if directory else None
+        self.keep_days = keep_days
+        self.caller_budgets = caller_budgets or {}
+        self.provider_budgets = provider_budgets or {}
+        self.day = today()
+        self.callers = {}  # caller -> provider -> counters
+        self.keys = {}     # provider -> key -> counters
+        self.dirty = False
+        self._load()
+
+    # ── recording ───────────────────────────────────────────────────
+
+    def record(self, caller, provider, key, prompt_tokens=0, completion_tokens=0,
+               latency=None, ok=True):
+        self._roll()
+        by_provider = self.callers.setdefault(caller or 'anonymous', {})
+        _add(by_provider.setdefault(provider, _counters()),
+             prompt_tokens, completion_tokens, latency, ok)
+        _add(self.keys.setdefault(provider, {}).setdefault(key or provider, _counters()),
+             prompt_tokens, completion_tokens, latency, ok)
+        self.dirty = True
+
+    def _roll(self):
+        """Start a new day at midnight, keeping yesterday on disk."""
+        day = today()
+        if day != self.day:
+            self.flush()
+            self.day, self.callers, self.keys = day, {}, {}
+            self._prune()
+
+    # ── budgets ─────────────────────────────────────────────────────
+
+    def caller_tokens(self, caller):
+        """Cloud tokens `caller` has used today."""
+        self._roll()
+        return self._caller_tokens(caller)
+
+    def provider_tokens(self, provider):
+        self._roll()
+        return self._provider_tokens(provider)
+
+    def _caller_tokens(self, caller):
+        return sum(_tokens(c) for provider, c in self.callers.get(caller, {}).items()
+                   if provider not in LOCAL_PROVIDERS)
+
+    def _provider_tokens(self, provider):
+        return sum(_tokens(c) for c in self.keys.get(provider, {}).values())
+
+    def caller_budget(self, caller):
+        return self.caller_budgets.get(caller, self.caller_budgets.get('*'))
+
+    def caller_over(self, caller):
+        budget = self.caller_budget(caller)
+        return budget is not None and self.caller_tokens(caller) >= budget
+
+    def provider_over(self, provider):
+        budget = self.provider_budgets.get(provider)
+        return budget is not None and self.provider_tokens(provider) >= budget
+
+    # ── persistence ─────────────────────────────────────────────────
+
+    def _path(self, day):
+        return self.directory / f'usage-{day}.json'
+
+    def snapshot(self):
+        def rounded(counters):
+            return dict(counters, latency_seconds=round(counters['latency_seconds'], 2))
+        return {
+            'day': self.day,
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'callers': {caller: {p: rounded(c) for p, c in providers.items()}
+                        for caller, providers in sorted(self.callers.items())},
+            'providers': {provider: {k: rounded(c) for k, c in keys.items()}
+                          for provider, keys in sorted(self.keys.items())},
+            'budgets': {
+                'callers': {caller: {'used': self._caller_tokens(caller), 'budget': self.caller_budget(caller)}
+                            for caller in sorted(self.callers) if self.caller_budget(caller) is not None},
+                'providers': {provider: {'used': self._provider_tokens(provider), 'budget': budget}
+                              for provider, budget in sorted(self.provider_budgets.items())},
+            },
+        }
+
+    def _load(self):
+        if not self.directory:
+            return
+        try:
+            data = json.loads(self._path(self.day).read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Accounting: could not read today's usage ({e}), starting from zero")
+            return
+        for caller, providers in data.get('callers', {}).items():
+            for provider, counters in providers.items():
+                self.callers.setdefault(caller, {})[provider] = dict(_counters(), **counters)
+        for provider, keys in data.get('providers', {}).items():
+            for key, counters in keys.items():
+                self.keys.setdefault(provider, {})[key] = dict(_counters(), **counters)
+
+    def flush(self):
+        if not self.directory or not self.dirty:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(self.day)
+            tmp = path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self.snapshot(), indent=1))
+            os.replace(tmp, path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Accounting: could not write {self.directory}: {e}")
+
+    def _prune(self):
+        if not self.directory or not self.directory.is_dir():
+            return
+        oldest = (datetime.now() - timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        for path in self.directory.glob('usage-*.json'):
+            if path.stem[len('usage-'):] < oldest:
+                path.unlink(missing_ok=True)
+
+    async def persist(self, interval=30.0):
+        """Background task: write today's aggregates every `interval` seconds."""
+        self._prune()
+        while True:
+            await asyncio.sleep(interval)
+            self._roll()
+            self.flush()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Inference proxy benchmark against a local stub upstream.
+
+Starts an OpenAI/Ollama-compatible stub that answers after a fixed delay,
+launches the proxy pointed at it, then fires N requests at C concurrency,
+first straight at the stub and then through the proxy. Overhead is the proxy
+latency minus the direct latency at the same percentile.
+
+With --visitor-mix, a single visitor session is timed on an idle proxy and
+again while the N requests run as background batch traffic; with priority
+classes its p95 should barely move.
+
+With --hedge, two stub providers each answer slowly (--tail-ms) for a
+fraction of requests (--tail-prob); the same congregation-style requests
+are timed with hedging off and on, and the p99 difference is what hedging
+saved.
+
+With --ollama-pool N, cloud providers are switched off and the proxy's
+Ollama fallback is pointed at N stub Ollama servers plus one that lacks the
+model and one that always fails; the per-backend request counts show
+least-outstanding balancing, model awareness and ejection.
+
+With --residency, one stub Ollama host holds a single model and takes
+--load-ms to switch; callers ask for a mix of models, straight at the stub
+and then through the proxy's Ollama API. Swaps and time lost to loading
+are compared.
+
+With --stream-errors, every upstream fails (the cloud stub and Ollama
+answer 500) and N streamed requests go through the proxy; each one's NDJSON
+has to end in a done event rather than being cut off.
+
+Usage:
+    python3 bench.py                      # defaults: 400 requests, 17 callers
+    python3 bench.py -n 1000 -c 32 --latency-ms 20 --keys 8
+    python3 bench.py --proxy /tmp/old_proxy.py   # compare another build
+    python3 bench.py --keys 4 --visitor-mix
+    python3 bench.py --hedge -n 1000 -c 4 --tail-prob 0.02 --tail-ms 1000
+    python3 bench.py --ollama-pool 3 -n 300 -c 6
+    python3 bench.py --residency -n 200 -c 8 --load-ms 500
+    python3 bench.py --stream-errors -n 50 -c 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+HERE = Path(__file__).parent
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Default backlog of 5 turns bursts into SYN retries
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class StubHost:
+    """A one-model-at-a-time Ollama: serves one request at a time and takes
+    `load` seconds to switch models."""
+
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        self.resident = None
+        self.swaps = 0
+        self.load_seconds = 0.0
+
+    def run(self, model, latency):
+        """Serve one request; returns its load_duration in seconds."""
+        with self.lock:
+            loaded = 0.0
+            if model != self.resident:
+                time.sleep(self.load)
+                loaded = self.load
+                self.swaps += 1
+                self.load_seconds += loaded
+                self.resident = model
+            time.sleep(latency)
+            return loaded
+
+
+def make_stub_handler(latency, tail=0.0, tail_prob=0.0, jitter=0.0,
+                      models=('llama3.2:latest',), fail=False, host=None):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True  # As real APIs do; otherwise delayed ACKs add 40ms per reused connection
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self._send(200, {'models': [{'name': m} for m in models]})
+            elif self.path == '/api/ps':
+                loaded = [host.resident] if host and host.resident else []
+                self._send(200, {'models': [{'name': m} for m in loaded]})
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if fail:
+                return self._send(500, {'error': 'stub failure'})
+            if host is not None:
+                loaded = host.run(request.get('model'), latency)
+                return self._send(200, {'model': request.get('model'), 'response': 'I wonder.',
+                                        'done': True, 'load_duration': int(loaded * 1e9)})
+            slow = random.random() < tail_prob
+            time.sleep(tail if slow else latency + random.uniform(-jitter, jitter))
+            if self.path.endswith('/api/generate'):
+                body = {'response': 'I wonder.', 'done': True}
+            else:
+                body = {'choices': [{'message': {'content': 'I wonder.'}}]}
+            try:
+                self._send(200, body)
+            except ConnectionError:
+                pass  # Hedged request cancelled by the proxy
+
+        def log_message(self, format, *args):
+            pass
+    return StubHandler
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def one_request(port, path, payload):
+    """One call the way tanks make it: fresh connection, JSON body."""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    conn.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+    r = conn.getresponse()
+    body = r.read()
+    conn.close()
+    ok = r.status == 200 and json.loads(body).get('response', body != b'')
+    return time.perf_counter() - start, bool(ok)
+
+
+def run_load(port, path, payload, n, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(
+            lambda _: one_request(port, path, payload() if callable(payload) else payload), range(n)))
+    wall = time.perf_counter() - start
+    latencies = sorted(r[0] for r in results)
+    return {
+        'rps': n / wall,
+        'ok': sum(1 for r in results if r[1]),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def visitor_mix(port, args):
+    visitor = {'system': 'You are a fish.', 'prompt': 'Hi!', 'timeout': 60,
+               'caller': 'tank-01-adam', 'priority': 'visitor'}
+    batch = {'system': 'Translate.', 'prompt': 'Bonjour', 'timeout': 60,
+             'caller': 'translator', 'priority': 'batch'}
+    visits = max(20, args.requests // 20)
+
+    alone = run_load(port, '/v1/generate', visitor, visits, 1)
+    background = {}
+    worker = threading.Thread(target=lambda: background.update(
+        run_load(port, '/v1/generate', batch, args.requests, args.concurrency)))
+    worker.start()
+    time.sleep(0.2)  # Let the batch queue build up first
+    loaded = run_load(port, '/v1/generate', visitor, visits, 1)
+    worker.join()
+
+    print(f"{'':16} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, r in (('visitor idle', alone), ('visitor + batch', loaded)):
+        print(f"{label:16} {r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f}")
+    print(f"batch throughput {background['rps']:.1f} req/s ({background['ok']} ok)")
+
+
+def hedge_compare(port, args):
+    turn = {'system': 'You are in a congregation.', 'prompt': 'Your turn.', 'timeout': 60,
+            'caller': 'congregation', 'priority': 'congregation'}
+    run_load(port, '/v1/generate', dict(turn, hedge=False), 100, args.concurrency)  # Learn first-byte percentiles
+    off = run_load(port, '/v1/generate', dict(turn, hedge=False), args.requests, args.concurrency)
+    on = run_load(port, '/v1/generate', dict(turn, hedge=True), args.requests, args.concurrency)
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/v1/routing?n=0')
+    hedging = json.loads(conn.getresponse().read())['hedging']
+    conn.close()
+
+    print(f"{'':10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ok':>6}")
+    for label, r in (('hedge off', off), ('hedge on', on)):
+        print(f"{label:10} {r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f} {r['p99'] * 1000:8.1f} {r['ok']:6d}")
+    print(f"p99 saved {(off['p99'] - on['p99']) * 1000:.1f}ms; hedges fired {hedging['fired']} "
+          f"({hedging['extra_call_ratio']:.1%} extra calls), backup won {hedging['backup_won']}, "
+          f"no credit {hedging['no_credit']}")
+
+
+def ollama_pool(port, args, roles):
+    r = run_load(port, '/v1/generate', {'system': 'You are a fish.', 'prompt': 'Hello', 'timeout': 60},
+                 args.requests, args.concurrency)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/v1/routing?n=0')
+    pool = json.loads(conn.getresponse().read())['ollama_pool']
+    conn.close()
+
+    print(f"{r['ok']}/{args.requests} ok, p50 {r['p50'] * 1000:.1f}ms, p99 {r['p99'] * 1000:.1f}ms")
+    print(f"{'backend':26} {'role':>9} {'requests':>9} {'errors':>7} {'breaker':>8}")
+    for backend, role in zip(pool, roles):
+        print(f"{backend['url']:26} {role:>9} {backend['requests']:9d} {backend['errors']:7d} "
+              f"{backend['health']['breaker']['state']:>8}")
+
+
+def residency(port, args, stub_port, host):
+    models = ['llama3.2:latest'] * 6 + ['mistral:latest'] * 3 + ['gemma2:2b']
+    payload = lambda: {'model': random.choice(models), 'prompt': 'Hello', 'stream': False}
+    results = []
+    for label, target in (('direct', stub_port), ('proxy', port)):
+        host.swaps, host.load_seconds, host.resident = 0, 0.0, None
+        r = run_load(target, '/api/generate', payload, args.requests, args.concurrency)
+        results.append((label, r, host.swaps, host.load_seconds))
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/v1/routing?n=0')
+    stats = json.loads(conn.getresponse().read())['ollama_residency']
+    conn.close()
+
+    print(f"{'':8} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'ok':>5} {'swaps':>6} {'loading s':>10}")
+    for label, r, swaps, load_seconds in results:
+        print(f"{label:8} {r['rps']:7.1f} {r['p50'] * 1000:8.1f} {r['p99'] * 1000:8.1f} {r['ok']:5d} "
+              f"{swaps:6d} {load_seconds:10.1f}")
+    print(f"proxy saw {stats['swaps']} swaps, {stats['load_seconds']}s loading; policy {stats['policy']}")
+
+
+def one_stream(port, payload):
+    """A streamed call: its last NDJSON event, or None if the body was cut off."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.request('POST', '/v1/generate?stream=1', json.dumps(payload),
+                     {'Content-Type': 'application/json'})
+        lines = conn.getresponse().read().splitlines()
+        return json.loads(lines[-1]) if lines else None
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+def stream_errors(port, args):
+    payload = {'system': 'You are a fish.', 'prompt': 'Hello', 'timeout': 10}
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        last = list(pool.map(lambda _: one_stream(port, payload), range(args.requests)))
+    done = sum(1 for event in last if event and event.get('done'))
+    print(f"{done}/{args.requests} streams ended with a done event, {last.count(None)} cut off")
+    if done < args.requests:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the inference proxy against a stub upstream')
+    parser.add_argument('-n', '--requests', type=int, default=400)
+    parser.add_argument('-c', '--concurrency', type=int, default=17)
+    parser.add_argument('--latency-ms', type=float, default=50, help='Stub upstream latency')
+    parser.add_argument('--keys', type=int, default=17, help='Fake Cerebras keys to configure')
+    parser.add_argument('--proxy', default=str(HERE / 'proxy.py'), help='Proxy script to launch')
+    parser.add_argument('--visitor-mix', action='store_true',
+                        help='Time a visitor session alone and under background batch load')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Compare p99 with hedging off and on against two tail-heavy providers')
+    parser.add_argument('--tail-ms', type=float, default=1000, help='Stub latency for slow answers')
+    parser.add_argument('--tail-prob', type=float, default=0.0, help='Fraction of slow stub answers')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Uniform +/- stub latency jitter')
+    parser.add_argument('--ollama-pool', type=int, default=0, metavar='N',
+                        help='Balance over N stub Ollama hosts plus one without the model and one failing')
+    parser.add_argument('--residency', action='store_true',
+                        help='Compare model swaps for a mixed-model load, direct and through the proxy')
+    parser.add_argument('--load-ms', type=float, default=500, help='Stub model load time (--residency)')
+    parser.add_argument('--stream-errors', action='store_true',
+                        help='Check streamed requests still end in a done event when every upstream fails')
+    args = parser.parse_args()
+
+    stub = StubServer(('127.0.0.1', 0), make_stub_handler(
+        args.latency_ms / 1000, args.tail_ms / 1000, args.tail_prob, args.jitter_ms / 1000,
+        fail=args.stream_errors))
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub.server_port}'
+
+    proxy_port = free_port()
+    env = dict(os.environ,
+               PROXY_PORT=str(proxy_port),
+               CEREBRAS_URL=f'{stub_url}/v1/chat/completions',
+               CEREBRAS_API_KEYS=','.join(f'bench-{i}' for i in range(args.keys)),
+               CEREBRAS_RATE_LIMIT='0',  # Pre-scheduler builds
+               CEREBRAS_RPM='1000000',
+               CEREBRAS_TPM='0',
+               GROQ_API_KEYS='',
+               OLLAMA_URL=stub_url,
+               OLLAMA_QUEUE_URL='')
+    roles = []
+    if args.ollama_pool:
+        roles = ['healthy'] * args.ollama_pool + ['no model', 'failing']
+        urls = []
+        for role in roles:
+            server = StubServer(('127.0.0.1', 0), make_stub_handler(
+                args.latency_ms / 1000, models=('mistral:latest',) if role == 'no model' else ('llama3.2:latest',),
+                fail=role == 'failing'))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            urls.append(f'http://127.0.0.1:{server.server_port}')
+        env.update(CEREBRAS_API_KEYS='', OLLAMA_URLS=','.join(urls), OLLAMA_MODEL='llama3.2',
+                   OLLAMA_CONCURRENCY=str(max(1, args.concurrency // args.ollama_pool)))
+    host = None
+    if args.residency:
+        host = StubHost(args.load_ms / 1000)
+        ollama = StubServer(('127.0.0.1', 0), make_stub_handler(
+            args.latency_ms / 1000, models=('llama3.2:latest', 'mistral:latest', 'gemma2:2b'), host=host))
+        threading.Thread(target=ollama.serve_forever, daemon=True).start()
+        env.update(CEREBRAS_API_KEYS='', OLLAMA_URLS=f'http://127.0.0.1:{ollama.server_port}',
+                   OLLAMA_LOAD_PRIOR_SECONDS=str(args.load_ms / 1000))
+    if args.hedge:
+        env.update(GROQ_URL=f'{stub_url}/openai/v1/chat/completions',
+                   GROQ_API_KEYS=','.join(f'bench-g{i}' for i in range(args.keys)),
+                   GROQ_RPM='1000000', GROQ_TPM='0')
+    proc = subprocess.Popen([sys.executable, '-u', args.proxy], env=env, cwd=str(Path(args.proxy).parent),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(proxy_port):
+            sys.exit('proxy did not start')
+
+        print(f"{args.requests} requests, {args.concurrency} callers, "
+              f"stub latency {args.latency_ms:.0f}ms, {args.keys} keys")
+        if args.visitor_mix:
+            return visitor_mix(proxy_port, args)
+        if args.hedge:
+            return hedge_compare(proxy_port, args)
+        if args.ollama_pool:
+            time.sleep(0.5)  # First /api/tags round
+            return ollama_pool(proxy_port, args, roles)
+        if args.stream_errors:
+            time.sleep(0.5)  # First /api/tags round
+            return stream_errors(proxy_port, args)
+        if args.residency:
+            time.sleep(0.5)
+            return residency(proxy_port, args, ollama.server_port, host)
+        direct = run_load(stub.server_port, '/v1/chat/completions', {'messages': []},
+                          args.requests, args.concurrency)
+        stub.connections = 0
+        proxied = run_load(proxy_port, '/v1/generate',
+                           {'system': 'You are a fish.', 'prompt': 'Hello', 'timeout': 60},
+                           args.requests, args.concurrency)
+
+        print(f"{'':8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ok':>6}")
+        for label, r in (('direct', direct), ('proxy', proxied)):
+            print(f"{label:8} {r['rps']:8.1f} {r['p50'] * 1000:8.1f} {r['p99'] * 1000:8.1f} {r['ok']:6d}")
+        print(f"overhead p50 {(proxied['p50'] - direct['p50']) * 1000:.1f}ms, "
+              f"p99 {(proxied['p99'] - direct['p99']) * 1000:.1f}ms")
+        print(f"upstream connections opened by proxy: {stub.connections}")
+    finally:
+        proc.terminate()
+        proc.wait()
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Coalescing of identical in-flight requests.
+
+Callers that mark a request idempotent (or deterministic) say any answer to
+the same model, prompt and sampling settings will do. While one such
+request is upstream, identical ones wait for its answer instead of starting
+their own generation. The first request (the leader) runs as its own task,
+so followers still get the answer if the leader's caller goes away.
+
+Only answers that succeeded are shared. If the leader fails, its followers
+go again themselves (and coalesce among each other), so nobody is handed
+a failure that was down to someone else's deadline.
+"""
+import json
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger('InferenceProxy')
+
+
+def request_key(*parts):
+    """Stable key for the parts of a request that decide its answer."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class Coalescer:
+    """One upstream call per key at a time, its answer fanned out to all waiters."""
+
+    def __init__(self):
+        self.flights = {}  # key -> task of the call in flight
+        self.counters = {}  # kind -> {'upstream': n, 'coalesced': n, 'retried': n}
+
+    def _count(self, kind, name):
+        counters = self.counters.setdefault(kind, {'upstream': 0, 'coalesced': 0, 'retried': 0})
+        counters[name] += 1
+
+    async def run(self, kind, key, call, shareable, wait=None):
+        """call() once for `key`, or wait on the call already running (for
+        at most `wait` seconds, then asyncio.TimeoutError). shareable(result)
+        says whether an answer may go to followers.
+        Returns (result, whether it came from another request's call)."""
+        while key in self.flights:
+            task = self.flights[key]
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), wait)
+            except asyncio.TimeoutError:
+                raise
+            except Exception:
+                result = None
+            if shareable(result):
+                self._count(kind, 'coalesced')
+                return result, True
+            self._count(kind, 'retried')
+            await asyncio.sleep(0)  # Let the leader's done-callback clear the key
+
+        task = asyncio.ensure_future(call())
+        self.flights[key] = task
+        task.add_done_callback(lambda done: self._land(key, done))
+        self._count(kind, 'upstream')
+        return await asyncio.shield(task), False
+
+    def _land(self, key, task):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+
+    def stats(self):
+        """Upstream calls made and saved, per kind of request."""
+        upstream = sum(c['upstream'] for c in self.counters.values())
+        saved = sum(c['coalesced'] for c in self.counters.values())
+        return {
+            'in_flight': len(self.flights),
+            'upstream_calls': upstream,
+            'saved_calls': saved,
+            'saved_ratio': round(saved / (upstream + saved), 4) if upstream + saved else 0.0,
+            'by_kind': self.counters,
+        }
@@ -0,0 +1,78 @@
+"""
+The few pieces of HTTP/1.1 server the proxy and the Ollama queue share:
+request parsing and JSON / plain text / chunked NDJSON responses,
+keep-alive aware.
+"""
+import json
+from contextlib import aclosing
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from upstream import read_head
+
+
+class Request:
+    def __init__(self, method, target, version, headers, body):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        conn = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return conn == 'keep-alive'
+        return conn != 'close'
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+async def read_request(reader):
+    try:
+        line, headers = await read_head(reader)
+    except ConnectionResetError:
+        return None
+    method, target, version = line.split(' ', 2)
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, target, version, headers, body)
+
+
+async def send_stream(writer, status, events, keep_alive=True):
+    """Chunked NDJSON, flushed per event so tokens reach the caller as they arrive."""
+    head = (f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+            f'Content-Type: application/x-ndjson\r\n'
+            f'Transfer-Encoding: chunked\r\n'
+            f'Cache-Control: no-cache\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    writer.write(head.encode('latin-1'))
+    async with aclosing(events):
+        async for event in events:
+            line = (json.dumps(event) + '\n').encode()
+            writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+            await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+async def send_body(writer, status, body, content_type, keep_alive=True):
+    head = (f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def send_json(writer, status, payload, keep_alive=True):
+    await send_body(writer, status, json.dumps(payload).encode(), 'application/json', keep_alive)
+
+
+async def send_text(writer, status, text, keep_alive=True):
+    """Plain text, as the Prometheus text exposition format wants it."""
+    await send_body(writer, status, text.encode(), 'text/plain; version=0.0.4; charset=utf-8', keep_alive)
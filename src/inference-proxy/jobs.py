@@ -0,0 +1,276 @@
+"""
+Batch jobs: many prompts submitted at once, worked through in the
+background, every finished item written to an append-only journal.
+
+A job is one file, <directory>/<job id>.jsonl. Its first line is the
+submission (the job's settings and all its items); after that one line
+lands per finished item ({"event": "result"} with the response, or
+{"event": "failed"} once an item has used up its attempts), and
+{"event": "cancelled"} if the job is cancelled. Each line is flushed and
+fsynced before the item counts as done, so a proxy restart (or a crash)
+loses at most the items that were in flight: on start every journal is
+read back and unfinished jobs carry on with the items that have no line
+yet. A torn last line from a crash mid-write is cut off.
+
+Items run at the job's priority (batch by default), so they take capacity
+the interactive classes leave idle. An answer that didn't come because
+every backend was busy isn't an attempt: the item waits and goes again.
+Journals of finished jobs are removed after `keep_days`.
+
+Submitting under an existing job id returns that job as it stands, so a
+client that restarts resubmits and picks up where it was without paying
+for the items already done.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import secrets
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger('InferenceProxy')
+
+JOB_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,99}$')
+BUSY_BACKOFF_SECONDS = (2.0, 60.0)   # First and longest wait while backends are busy
+
+
+class ItemBusy(Exception):
+    """Nothing could take the item right now; not the item's fault."""
+
+
+def new_job_id():
+    return f"job-{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+
+
+class Job:
+    """One job's settings, items and what has landed for them."""
+
+    def __init__(self, job_id, spec, path):
+        self.id = job_id
+        self.spec = spec
+        self.path = path
+        self.items = {item['id']: item for item in spec['items']}
+        self.landed = []     # result/failed records, in the order they landed
+        self.outcome = {}    # item id -> its record
+        self.cancelled = False
+        self.task = None
+        self.running = set()
+        self.changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.cancelled or len(self.outcome) == len(self.items)
+
+    def pending(self):
+        return [item for item_id, item in self.items.items() if item_id not in self.outcome]
+
+    def land(self, record):
+        if record['event'] == 'cancelled':
+            self.cancelled = True
+        else:
+            self.outcome[record['item']] = record
+            self.landed.append(record)
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def summary(self):
+        failed = sum(1 for r in self.landed if r['event'] == 'failed')
+        state = 'cancelled' if self.cancelled else 'done' if self.finished else 'running'
+        return {
+            'job': self.id,
+            'state': state,
+            'caller': self.spec.get('caller'),
+            'priority': self.spec.get('priority'),
+            'submitted': self.spec.get('submitted'),
+            'total': len(self.items),
+            'done': len(self.landed) - failed,
+            'failed': failed,
+            'in_flight': len(self.running),
+        }
+
+
+class JobStore:
+    """Journals on disk, jobs in memory, and the tasks working through them.
+    run_item(spec, item) answers one item: it returns a dict with at least
+    "response", raises ItemBusy to be tried later, or raises anything else
+    to use up an attempt."""
+
+    def __init__(self, directory, run_item, parallel=2, max_attempts=5, keep_days=30):
+        self.directory = Path(directory) if directory else None
+        self.run_item = run_item
+        self.slots = asyncio.Semaphore(parallel)   # Items running at once, all jobs together
+        self.max_attempts = max_attempts
+        self.keep_days = keep_days
+        self.jobs = {}
+
+    # ── journal ─────────────────────────────────────────────────────
+
+    def _append(self, job, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        if job.path:
+            with open(job.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        job.land(record)
+
+    def _create(self, job_id, spec):
+        path = None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f'{job_id}.jsonl'
+            with open(path, 'x', encoding='utf-8') as f:
+                f.write(json.dumps(dict(spec, event='submitted', job=job_id), ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)  # So the new file itself survives a crash
+            finally:
+                os.close(fd)
+        return Job(job_id, spec, path)
+
+    def _read(self, path):
+        """The job in `path`, or None if it can't be read."""
+        data = path.read_bytes()
+        offset, job = 0, None
+        for raw in data.splitlines(keepends=True):
+            try:
+                if not raw.endswith(b'\n'):
+                    raise ValueError('unterminated line')
+                record = json.loads(raw)
+            except ValueError:
+                logger.warning(f"Jobs: {path.name}: torn record at byte {offset}, cutting it off")
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+                break
+            if job is None:
+                if record.get('event') != 'submitted':
+                    return None
+                spec = {k: v for k, v in record.items() if k not in ('event', 'job')}
+                job = Job(record['job'], spec, path)
+            elif record.get('event') in ('result', 'failed', 'cancelled'):
+                job.land(record)
+            offset += len(raw)
+        return job
+
+    def load(self):
+        """Read every journal back and start the jobs that aren't finished."""
+        if not self.directory or not self.directory.is_dir():
+            return
+        oldest = time.time() - self.keep_days * 86400
+        for path in sorted(self.directory.glob('*.jsonl')):
+            try:
+                job = self._read(path)
+            except OSError as e:
+                logger.warning(f"Jobs: could not read {path.name}: {e}")
+                continue
+            if job is None:
+                logger.warning(f"Jobs: {path.name} has no submission record, ignoring it")
+                continue
+            if job.finished and path.stat().st_mtime < oldest:
+                path.unlink(missing_ok=True)
+                continue
+            self.jobs[job.id] = job
+            if not job.finished:
+                logger.info(f"Jobs: resuming {job.id}, {len(job.pending())}/{len(job.items)} items left")
+                self._start(job)
+
+    # ── jobs ────────────────────────────────────────────────────────
+
+    def submit(self, job_id, spec):
+        """(job, whether it is new). `spec` has the job's settings and its
+        items, each with a unique "id"."""
+        job_id = job_id or new_job_id()
+        if job_id in self.jobs:
+            return self.jobs[job_id], False
+        job = self._create(job_id, dict(spec, submitted=datetime.now().isoformat(timespec='seconds')))
+        self.jobs[job_id] = job
+        logger.info(f"Jobs: {job_id} submitted by {spec.get('caller')}, {len(job.items)} items")
+        self._start(job)
+        return job, True
+
+    def cancel(self, job):
+        if job.finished:
+            return
+        self._append(job, {'event': 'cancelled', 'at': time.time()})
+        if job.task:
+            job.task.cancel()
+        logger.info(f"Jobs: {job.id} cancelled, {len(job.pending())} items not run")
+
+    def _start(self, job):
+        job.task = asyncio.create_task(self._work(job))
+
+    async def _work(self, job):
+        queue = asyncio.Queue()
+        for item in job.pending():
+            queue.put_nowait(item)
+        workers = [asyncio.create_task(self._worker(job, queue))
+                   for _ in range(max(1, min(int(job.spec.get('parallel', 1)), queue.qsize())))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        if job.finished:
+            logger.info(f"Jobs: {job.id} finished: {job.summary()}")
+
+    async def _worker(self, job, queue):
+        while not queue.empty():
+            item = queue.get_nowait()
+            await self._run(job, item)
+
+    async def _run(self, job, item):
+        """Attempt `item` until it has an answer or its attempts are used up."""
+        attempts, busy_wait, error = 0, BUSY_BACKOFF_SECONDS[0], None
+        while attempts < self.max_attempts:
+            async with self.slots:
+                job.running.add(item['id'])
+                start = time.monotonic()
+                try:
+                    result = await self.run_item(job.spec, item)
+                except ItemBusy:
+                    result = None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    attempts += 1
+                    error = str(e) or repr(e)
+                    logger.warning(f"Jobs: {job.id}/{item['id']}: {error} "
+                                   f"(attempt {attempts}/{self.max_attempts})")
+                    result = None
+                    busy_wait = BUSY_BACKOFF_SECONDS[0]
+                finally:
+                    job.running.discard(item['id'])
+            if result is not None:
+                self._append(job, dict(result, event='result', item=item['id'], attempts=attempts + 1,
+                                       elapsed=round(time.monotonic() - start, 2), at=time.time()))
+                return
+            await asyncio.sleep(busy_wait)
+            busy_wait = min(busy_wait * 2, BUSY_BACKOFF_SECONDS[1])
+        self._append(job, {'event': 'failed', 'item': item['id'], 'attempts': attempts,
+                           'error': error, 'at': time.time()})
+
+    async def results(self, job, after=0, heartbeat=30.0):
+        """Landed records from index `after` on, as they land, then a final
+        {"done": true, ...summary}. While nothing lands, a {"event":
+        "waiting"} line every `heartbeat` seconds keeps the stream alive."""
+        while True:
+            changed = job.changed
+            while after < len(job.landed):
+                yield job.landed[after]
+                after += 1
+            if job.finished:
+                yield dict(job.summary(), done=True, next=after)
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield {'event': 'waiting', 'in_flight': len(job.running)}
+
+    def stats(self):
+        return {'jobs': len(self.jobs),
+                'running': sum(1 for job in self.jobs.values() if not job.finished)}
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Load generator: the tanks' explore loops and visitor sessions against the
+inference proxy.
+
+Each simulated tank runs the loop tanks/*/explore.py runs: think about an
+article (profile explore-thought, priority exploration), choose a link
+(link-choice), then spend --article-ms fetching the next article. Each
+visitor (--visitors) chats at priority visitor with streamed replies and
+--visitor-pause-ms between messages; --batch adds translator-style
+callers at priority batch. Every caller goes through InferenceClient, as
+the real ones do.
+
+Reported per caller class: requests, failures, throughput, which backend
+answered, queue wait (the proxy's queue_ms) and p50/p95/p99 latency, plus
+time to first delta for the streamed visitor replies.
+
+By default a stub upstream (stub_llm.py; its options apply) and a proxy
+pointed at it are started here, with --keys fake Cerebras keys at --rpm.
+With --proxy-url an already running proxy is driven instead.
+
+Usage:
+    python3 loadgen.py --duration 60
+    python3 loadgen.py --tanks 17 --visitors 3 --keys 2 --rpm 30 --ttft lognormal:400:0.5
+    python3 loadgen.py --keys 0 --duration 120   # no cloud keys: what Ollama alone carries
+    python3 loadgen.py --proxy-url http://localhost:8100 --duration 300 --json run.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+from pathlib import Path
+
+import stub_llm
+from bench import free_port, wait_for_port, percentile
+
+HERE = Path(__file__).parent
+sys.path.insert(0, str(HERE.parent / 'explorer'))
+from inference import InferenceClient
+
+TANK_NAMES = ['adam', 'eve', 'cain', 'abel', 'juan', 'juanita', 'klaus', 'genevieve', 'wei', 'mei',
+              'haruki', 'sakura', 'victor', 'iris', 'observer', 'seeker', 'seth']
+SYSTEM = ("You are a specimen in the Digiquarium, exploring an offline Wikipedia on your own. "
+          "Nobody is watching. Follow your curiosity, notice what you feel, and say it plainly. " * 8)
+
+
+class Recorder:
+    """Per class: one (latency, ok, provider, queue_ms, first_byte) per request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, cls, latency, ok, timings):
+        sample = (latency, ok, timings.get('provider'), timings.get('queue_ms'),
+                  timings.get('first_byte_ms'))
+        with self.lock:
+            self.samples.setdefault(cls, []).append(sample)
+
+    def report(self, seconds):
+        rows = {}
+        for cls, samples in sorted(self.samples.items()):
+            done = [s for s in samples if s[1]]
+            latencies = sorted(s[0] for s in done)
+            queued = sorted(s[3] / 1000 for s in done if s[3] is not None)
+            first = sorted(s[4] / 1000 for s in done if s[4] is not None)
+            providers = {}
+            for s in done:
+                providers[s[2]] = providers.get(s[2], 0) + 1
+            rows[cls] = {
+                'requests': len(samples),
+                'failed': len(samples) - len(done),
+                'rps': round(len(done) / seconds, 2),
+                'served_by': providers,
+                'queue_p50': percentile(queued, 50), 'queue_p95': percentile(queued, 95),
+                'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'first_delta_p50': percentile(first, 50) if first else None,
+                'first_delta_p95': percentile(first, 95) if first else None,
+            }
+        return rows
+
+
+def article(rng):
+    words = stub_llm.WORDS
+    title = ' '.join(rng.choice(words).title() for _ in range(2))
+    text = ' '.join(rng.choice(words) for _ in range(110))
+    links = [' '.join(rng.choice(words).title() for _ in range(2)) for _ in range(8)]
+    return title, text, links
+
+
+def tank_loop(name, args, url, stop, recorder, seed):
+    client = InferenceClient(caller=name, priority='exploration', route='proxy-only', proxy_url=url,
+                             timeout=args.timeout)
+    rng = random.Random(seed)
+    while not stop.is_set():
+        title, text, links = article(rng)
+        for profile, prompt in (
+                ('explore-thought', f'I just read about "{title}".\n\n{text}\n\nWhat do I notice? What do I feel?'),
+                ('link-choice', f"I can go to: {', '.join(links)}\n\nWhich one pulls at me? Why?")):
+            timings = {}
+            start = time.monotonic()
+            response = client.generate(SYSTEM, prompt, timings=timings, profile=profile)
+            recorder.add('exploration', time.monotonic() - start, bool(response), timings)
+            if stop.is_set():
+                return
+        stop.wait(args.article_ms / 1000 * rng.uniform(0.5, 1.5))
+
+
+def visitor_loop(name, args, url, stop, recorder, seed):
+    client = InferenceClient(caller=name, priority='visitor', route='proxy-only', proxy_url=url,
+                             timeout=args.timeout, hedge=True, profile='visitor-chat')
+    rng = random.Random(seed)
+    history = ''
+    while not stop.is_set():
+        message = ' '.join(rng.choice(stub_llm.WORDS) for _ in range(12)) + '?'
+        timings = {}
+        start = time.monotonic()
+        reply = ''.join(client.stream(SYSTEM, f'{history}Visitor: {message}\nAdam:', timings=timings))
+        recorder.add('visitor', time.monotonic() - start, bool(reply), timings)
+        history = f'{history}Visitor: {message}\nAdam: {reply}\n'[-2000:]
+        stop.wait(args.visitor_pause_ms / 1000 * rng.uniform(0.5, 1.5))
+
+
+def batch_loop(name, args, url, stop, recorder, seed):
+    client = InferenceClient(caller=name, priority='batch', route='proxy-only', proxy_url=url,
+                             timeout=args.timeout, profile='translation')
+    rng = random.Random(seed)
+    while not stop.is_set():
+        text = ' '.join(rng.choice(stub_llm.WORDS) for _ in range(60))
+        timings = {}
+        start = time.monotonic()
+        response = client.generate('', f'Translate this German text to English:\n\n{text}', timings=timings)
+        recorder.add('batch', time.monotonic() - start, bool(response), timings)
+
+
+def start_proxy(args, stub_url):
+    port = free_port()
+    env = dict(os.environ,
+               PROXY_PORT=str(port),
+               CEREBRAS_URL=f'{stub_url}/v1/chat/completions',
+               CEREBRAS_API_KEYS=','.join(f'load-{i}' for i in range(args.keys)),
+               CEREBRAS_RPM=str(args.rpm),
+               CEREBRAS_TPM=str(args.tpm),
+               GROQ_API_KEYS='',
+               OLLAMA_URL=stub_url,
+               OLLAMA_QUEUE_URL='',
+               PROXY_ACCOUNTING_DIR='')
+    proc = subprocess.Popen([sys.executable, '-u', str(HERE / 'proxy.py')], env=env, cwd=str(HERE),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_for_port(port):
+        proc.terminate()
+        sys.exit('proxy did not start')
+    return proc, f'http://127.0.0.1:{port}'
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as r:
+            return json.loads(r.read())
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run')
+    parser.add_argument('--tanks', type=int, default=17)
+    parser.add_argument('--visitors', type=int, default=2)
+    parser.add_argument('--batch', type=int, default=0, help='Translator-style batch callers')
+    parser.add_argument('--article-ms', type=float, default=2000, help='Pause between articles')
+    parser.add_argument('--visitor-pause-ms', type=float, default=5000, help='Pause between visitor messages')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-call deadline')
+    parser.add_argument('--proxy-url', help='Drive this proxy instead of starting a stub and a proxy')
+    parser.add_argument('--keys', type=int, default=2, help='Fake Cerebras keys for the started proxy')
+    parser.add_argument('--rpm', type=int, default=30, help='Requests per minute per fake key')
+    parser.add_argument('--tpm', type=int, default=0, help='Tokens per minute per fake key (0: no limit)')
+    parser.add_argument('--json', help='Also write the report here')
+    stub_llm.add_arguments(parser)
+    parser.set_defaults(ttft='lognormal:300:0.4', ollama_parallel=1)
+    args = parser.parse_args()
+
+    stub = proc = None
+    url = args.proxy_url
+    if not url:
+        stub = stub_llm.start(stub_llm.config_from(args))
+        stub_url = f'http://127.0.0.1:{stub.server_port}'
+        proc, url = start_proxy(args, stub_url)
+    url = url.rstrip('/')
+
+    recorder = Recorder()
+    stop = threading.Event()
+    callers = ([(tank_loop, f'tank-{i + 1:02d}-{TANK_NAMES[i % len(TANK_NAMES)]}') for i in range(args.tanks)]
+               + [(visitor_loop, f'visitor-{i + 1}') for i in range(args.visitors)]
+               + [(batch_loop, f'translator-{i + 1}') for i in range(args.batch)])
+    threads = [threading.Thread(target=loop, args=(name, args, url, stop, recorder, i), daemon=True)
+               for i, (loop, name) in enumerate(callers)]
+    print(f"{args.tanks} tanks, {args.visitors} visitors, {args.batch} batch callers against {url} "
+          f"for {args.duration:.0f}s" + ('' if args.proxy_url else
+                                          f" (stub ttft {args.ttft}, {args.tokens_per_sec:g} tokens/s, "
+                                          f"{args.keys} keys at {args.rpm} rpm)"), flush=True)
+    started = time.monotonic()
+    try:
+        for thread in threads:
+            thread.start()
+        stop.wait(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(args.timeout + 10)
+        seconds = time.monotonic() - started
+        rows = recorder.report(seconds)
+        routing = get_json(f'{url}/v1/routing?n=0') or {}
+    finally:
+        stop.set()
+        if proc:
+            proc.terminate()
+            proc.wait()
+        if stub:
+            stub.shutdown()
+
+    print(f"\n{'class':12} {'reqs':>6} {'fail':>5} {'req/s':>6} {'queue p50':>10} {'queue p95':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  served by")
+    for cls, r in rows.items():
+        served = ', '.join(f'{p} {n}' for p, n in sorted(r['served_by'].items(), key=lambda x: -x[1]))
+        print(f"{cls:12} {r['requests']:6d} {r['failed']:5d} {r['rps']:6.2f} {r['queue_p50'] * 1000:10.1f} "
+              f"{r['queue_p95'] * 1000:10.1f} {r['p50'] * 1000:8.1f} {r['p95'] * 1000:8.1f} "
+              f"{r['p99'] * 1000:8.1f}  {served}")
+        if r['first_delta_p50'] is not None:
+            print(f"{'':12} first delta p50 {r['first_delta_p50'] * 1000:.1f}ms, "
+                  f"p95 {r['first_delta_p95'] * 1000:.1f}ms")
+    total = sum(r['requests'] - r['failed'] for r in rows.values())
+    print(f"total {total / seconds:.2f} req/s over {seconds:.0f}s")
+    if stub:
+        s = stub.config.stats()
+        print(f"stub: {s['requests']} requests, {s['ratelimited']} answered 429, "
+              f"{s['errors_injected']} answered 500")
+    if args.json:
+        Path(args.json).write_text(json.dumps({'args': vars(args), 'seconds': seconds, 'classes': rows,
+                                               'hedging': routing.get('hedging')}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Metrics for the proxy and the Ollama queue, Prometheus style.
+
+A Registry holds families of counters, gauges and histograms, each child
+keyed by its label values. GET /metrics renders them in the text
+exposition format; a family whose numbers are kept elsewhere (a queue's
+depth, a stats dict) reads them at scrape time through a `collect`
+callback instead of being updated as things happen. Histograms also
+estimate percentiles from their buckets, for the JSON summaries.
+
+Passive health: Traffic remembers the outcome of recent upstream calls
+per backend, so "is Ollama working?" can be answered from real requests
+rather than a synthetic generation.
+"""
+import bisect
+import time
+from collections import deque
+
+# Seconds: whole calls and first tokens, and time spent waiting for a key or slot
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+# Completion tokens per second
+RATE_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class Histogram:
+    """Cumulative `le` buckets, a count and a sum (and the extremes, which
+    keep percentile estimates inside what was actually seen)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        running = 0
+        for le, n in zip([*map(str, self.buckets), '+Inf'], self.counts):
+            running += n
+            yield le, running
+
+    def percentile(self, pct):
+        """Estimate by linear interpolation inside the bucket it falls in,
+        that bucket's edges narrowed to the smallest and largest value seen."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        running = 0
+        for i, n in enumerate(self.counts):
+            if n and running + n >= rank:
+                lower = max(self.buckets[i - 1] if i else self.min, self.min)
+                upper = min(self.buckets[i] if i < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - running) / n
+            running += n
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum_seconds': round(self.sum, 3),
+                'buckets': dict(self.cumulative())}
+
+    def summary(self, digits=3):
+        """count, mean, p50/p95/p99 (None while empty)."""
+        def rounded(value):
+            return None if value is None else round(value, digits)
+        return {'count': self.count,
+                'mean': rounded(self.sum / self.count if self.count else None),
+                'p50': rounded(self.percentile(50)), 'p95': rounded(self.percentile(95)),
+                'p99': rounded(self.percentile(99))}
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Family:
+    """One metric name: its type, help, label names and children."""
+
+    def __init__(self, name, kind, help, labels=(), buckets=None, collect=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = buckets
+        self.collect = collect   # () -> {label values: value}, read at scrape time
+        self.children = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def inc(self, n=1, **labels):
+        key = self._key(labels)
+        self.children[key] = self.children.get(key, 0) + n
+
+    def set(self, value, **labels):
+        self.children[self._key(labels)] = value
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        histogram = self.children.get(key)
+        if histogram is None:
+            histogram = self.children[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def items(self):
+        """(label values, value) pairs, collected ones included."""
+        if self.collect:
+            return list(self.collect().items())
+        return list(self.children.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, value in sorted(self.items()):
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(value)}')
+                continue
+            for le, n in value.cumulative():
+                labels = _labels(self.labelnames, values, ['le="%s"' % le])
+                lines.append(f'{self.name}_bucket{labels} {n}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {round(value.sum, 6)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {value.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def _add(self, family):
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self._add(Family(name, 'counter', help, labels, collect=collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._add(Family(name, 'gauge', help, labels, collect=collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS, collect=None):
+        return self._add(Family(name, 'histogram', help, labels, buckets, collect))
+
+    def render(self):
+        """Every family in the Prometheus text format."""
+        lines = []
+        for family in self.families.values():
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+class Traffic:
+    """Outcomes of the upstream calls of the last `window` seconds, per
+    backend, and when each backend last answered or failed.
+
+    The verdict goes by the newest calls, not the window's totals, so an
+    outage shows as soon as it starts: 'failing' once the last `streak`
+    calls failed (all of them, if there were fewer), 'ok' only while the
+    last answer is under `fresh` seconds old."""
+
+    def __init__(self, window=300.0, streak=3, fresh=60.0):
+        self.window = window
+        self.streak = streak
+        self.fresh = fresh
+        self.calls = {}          # backend -> deque of (monotonic time, ok)
+        self.last_ok = {}
+        self.last_error = {}
+
+    def observe(self, backend, ok):
+        now = time.monotonic()
+        calls = self.calls.setdefault(backend, deque())
+        calls.append((now, ok))
+        (self.last_ok if ok else self.last_error)[backend] = now
+        self._trim(calls, now)
+
+    def _trim(self, calls, now):
+        while calls and now - calls[0][0] > self.window:
+            calls.popleft()
+
+    def backend(self, backend):
+        """'ok' (answered within `fresh` seconds and not failing since),
+        'failing' (the last `streak` calls failed), or 'idle' (nothing
+        recent enough to judge by). 'failed_in_a_row' counts the newest
+        calls that failed."""
+        now = time.monotonic()
+        calls = self.calls.get(backend, deque())
+        self._trim(calls, now)
+        errors = sum(1 for _, ok in calls if not ok)
+        in_a_row = 0
+        for _, ok in reversed(calls):
+            if ok:
+                break
+            in_a_row += 1
+
+        def age(stamps):
+            return round(now - stamps[backend], 1) if backend in stamps else None
+        if calls and in_a_row >= min(self.streak, len(calls)):
+            state = 'failing'
+        elif backend in self.last_ok and now - self.last_ok[backend] <= self.fresh:
+            state = 'ok'
+        else:
+            state = 'idle'
+        return {'state': state, 'calls': len(calls), 'errors': errors, 'failed_in_a_row': in_a_row,
+                'last_ok_seconds_ago': age(self.last_ok),
+                'last_error_seconds_ago': age(self.last_error)}
+
+    def health(self, backends):
+        """Overall: ok if some backend answers, failing if there was
+        traffic and none did, idle if there was no traffic at all."""
+        per_backend = {name: self.backend(name) for name in backends}
+        states = {b['state'] for b in per_backend.values()}
+        state = 'ok' if 'ok' in states else 'failing' if 'failing' in states else 'idle'
+        return {'state': state, 'window_seconds': self.window, 'backends': per_backend}
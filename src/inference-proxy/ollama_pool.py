@@ -0,0 +1,322 @@
+"""
+Pool of Ollama endpoints behind the proxy's local fallback.
+
+OLLAMA_URLS lists the hosts (OLLAMA_URL alone still works). Each backend
+has a concurrency limit; a request goes to the backend with the fewest
+outstanding requests relative to its limit among those that have the model
+(per their last /api/tags) and are not ejected. A backend that fails
+`failure_threshold` times in a row is ejected for `cooldown_seconds`, then
+gets one probe request back (routing.CircuitBreaker). No active health
+checks: the traffic is the health check, /api/tags only tells us models.
+
+Which model each backend has loaded is tracked too (residency.py): a
+request that can't start at once waits in a per-model queue for up to
+`wait` seconds, and a freed slot goes to a model that backend already has
+loaded unless switching is worth the load time. Every request carries
+`keep_alive` so the models we choose stay loaded between bursts. The
+/v1/generate fallback passes wait=0: if no backend can take it now, the
+caller is told so and moves on.
+
+With a TicketClient (OLLAMA_QUEUE_URL), each request also holds a ticket
+from the Ollama queue service (ollama_queue.py) while it runs, so the
+proxy and the tanks that call Ollama directly share one set of slots.
+"""
+import json
+import time
+import asyncio
+import logging
+from contextlib import aclosing
+
+from upstream import UpstreamError
+from routing import BackendHealth
+from residency import Waiter, ModelQueues, Residency, SwapPolicy
+from scheduler import DEFAULT_PRIORITY
+from ollama_queue import QueueTimeout
+
+logger = logging.getLogger('InferenceProxy')
+
+
+def model_key(name):
+    """Ollama treats 'llama3.2' and 'llama3.2:latest' as the same model."""
+    return name if ':' in name else f'{name}:latest'
+
+
+def timings(result):
+    """Ollama's own timings from a final response (durations are in ns).
+    prompt_eval_count only counts tokens that missed the prompt cache."""
+    return {'prompt_eval_count': result.get('prompt_eval_count', 0),
+            'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / 1e6, 1),
+            'load_ms': round(result.get('load_duration', 0) / 1e6, 1)}
+
+
+class OllamaBusy(Exception):
+    """No backend could take the request in time (all full, ejected, or
+    busy with other models)."""
+
+
+class OllamaBackend:
+    def __init__(self, url, concurrency, failure_threshold, cooldown_seconds):
+        self.url = url.rstrip('/')
+        self.concurrency = concurrency
+        self.outstanding = 0
+        self.models = None  # None until /api/tags answers: assume anything goes
+        self.tags_at = None
+        self.health = BackendHealth(self.url, failure_threshold, cooldown_seconds)
+        self.residency = Residency()
+        self.counters = {'requests': 0, 'errors': 0}
+
+    def has_model(self, model):
+        return self.models is None or model_key(model) in self.models
+
+    def load(self):
+        return self.outstanding / self.concurrency
+
+    def free(self, now):
+        return self.outstanding < self.concurrency and self.health.breaker.retry_in(now) == 0.0
+
+
+class OllamaPool:
+    def __init__(self, client, urls, concurrency=1, failure_threshold=3,
+                 cooldown_seconds=30, tags_interval=60.0, keep_alive='30m',
+                 swap_factor=2.0, load_prior=30.0, tickets=None):
+        self.client = client
+        self.tickets = tickets
+        self.backends = [OllamaBackend(u, concurrency, failure_threshold, cooldown_seconds)
+                         for u in urls]
+        self.tags_interval = tags_interval
+        self.keep_alive = keep_alive
+        self.queues = ModelQueues()
+        self.policy = SwapPolicy(swap_factor, load_prior)
+        self.prompt_eval = {}  # model -> calls, tokens, seconds
+        self._turn = 0
+
+    # ── model availability ──────────────────────────────────────────
+
+    async def refresh_models(self):
+        """Installed models (/api/tags) and loaded ones (/api/ps) per backend."""
+        async def one(backend):
+            try:
+                r = await self.client.request('GET', f'{backend.url}/api/tags', timeout=5)
+                r.raise_for_status()
+                backend.models = {model_key(m['name']) for m in r.json().get('models', [])}
+                backend.tags_at = time.time()
+                r = await self.client.request('GET', f'{backend.url}/api/ps', timeout=5)
+                r.raise_for_status()
+                backend.residency.refresh(model_key(m['name']) for m in r.json().get('models', []))
+            except Exception as e:
+                logger.warning(f"Ollama {backend.url}: /api/tags or /api/ps failed: {e!r}")
+        await asyncio.gather(*(one(b) for b in self.backends))
+
+    async def watch_models(self):
+        """Background task: keep model lists and residency fresh."""
+        while True:
+            await self.refresh_models()
+            await asyncio.sleep(self.tags_interval)
+
+    # ── balancing ───────────────────────────────────────────────────
+
+    def free_backends(self):
+        """Backends with a free slot that are not ejected, least outstanding
+        (relative to concurrency) first. Ties rotate."""
+        now = time.monotonic()
+        self._turn += 1
+        n = len(self.backends)
+        return sorted((b for b in self.backends if b.free(now)),
+                      key=lambda b: (b.load(), (self.backends.index(b) - self._turn) % n))
+
+    def available(self, model):
+        """Some backend has the model and is not ejected (it may be busy)."""
+        return any(b.has_model(model) and b.health.breaker.can_attempt() for b in self.backends)
+
+    def models(self):
+        """Every model some backend has installed."""
+        return sorted(set().union(*(b.models or () for b in self.backends)))
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, per the swap policy, until
+        no free backend wants any queued model. Backends that already have
+        a queued model loaded get first pick."""
+        while self.queues:
+            now = time.monotonic()
+            queued = set(self.queues.models())
+            backends = sorted(self.free_backends(), key=lambda b: not (b.residency.resident & queued))
+            for backend in backends:
+                model = self.policy.choose(backend, self.queues, now)
+                waiter = self.queues.pop(model) if model else None
+                if waiter is not None:
+                    self._start(backend, model)
+                    waiter.future.set_result(backend)
+                    break
+            else:
+                return
+
+    def _start(self, backend, model):
+        backend.outstanding += 1
+        backend.counters['requests'] += 1
+        backend.health.breaker.begin()
+        if model not in backend.residency.resident:
+            logger.info(f"Ollama {backend.url}: switching to {model}")
+            backend.residency.switch_to(model)
+
+    async def _begin(self, model, wait):
+        """Queue for a slot on a backend for `model`; OllamaBusy if none
+        is given to us within `wait` seconds."""
+        waiter = Waiter(model_key(model), asyncio.get_running_loop().create_future())
+        self.queues.push(waiter)
+        try:
+            self._dispatch()
+            if not waiter.future.done() and wait > 0:
+                await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if waiter.future.done():  # Granted as we were cancelled
+                self._end(waiter.future.result(), None, False, verdict=False)
+            waiter.future.cancel()
+            raise
+        finally:
+            self.queues.remove(waiter)
+        if not waiter.future.done():
+            waiter.future.cancel()
+            raise OllamaBusy(f'no Ollama backend free for {model}'
+                             + (f' within {wait:.0f}s' if wait > 0 else ''))
+        return waiter.future.result()
+
+    async def _ticket(self, backend, caller, priority, wait, lease):
+        """A ticket from the Ollama queue, if there is one. Gives the
+        backend slot back and raises OllamaBusy if none came in time."""
+        if self.tickets is None:
+            return None
+        try:
+            return await self.tickets.acquire(caller or 'inference-proxy', priority or DEFAULT_PRIORITY,
+                                              wait, lease)
+        except QueueTimeout as e:
+            self._end(backend, None, False, verdict=False)
+            raise OllamaBusy(f'Ollama queue: {e}') from e
+        except asyncio.CancelledError:
+            self._end(backend, None, False, verdict=False)
+            raise
+
+    def _end(self, backend, start, ok, status=None, timed_out=False, verdict=True, result=None):
+        backend.outstanding -= 1
+        try:
+            if not verdict:
+                backend.health.breaker.abandon()
+                return
+            if not ok:
+                backend.counters['errors'] += 1
+            breaker = backend.health.breaker
+            was = breaker.state
+            backend.health.observe(time.monotonic() - start, ok, status, timed_out)
+            if breaker.state == breaker.OPEN and was != breaker.OPEN:
+                logger.warning(f"Ollama {backend.url}: ejected for {backend.health.breaker.cooldown_seconds:.0f}s")
+            if ok and result:
+                self._observe(backend, result)
+        finally:
+            self._dispatch()
+
+    def _observe(self, backend, result):
+        """Count a model load from the response's load_duration, and add
+        up prompt evaluation per model."""
+        model = model_key(result.get('model', ''))
+        seconds = result.get('load_duration', 0) / 1e9
+        if backend.residency.observe(seconds):
+            self.policy.observe_load(model, seconds)
+            logger.info(f"Ollama {backend.url}: loaded {model} in {seconds:.1f}s")
+        totals = self.prompt_eval.setdefault(model, {'calls': 0, 'tokens': 0, 'seconds': 0.0})
+        totals['calls'] += 1
+        totals['tokens'] += result.get('prompt_eval_count', 0)
+        totals['seconds'] += result.get('prompt_eval_duration', 0) / 1e9
+
+    # ── requests ────────────────────────────────────────────────────
+
+    async def generate(self, payload, timeout, path='/api/generate', wait=0.0,
+                       caller=None, priority=None, timings=None):
+        """Non-streaming /api/generate (or /api/chat). Returns
+        (response_json, backend_url). Raises OllamaBusy if nobody can take
+        it within `wait` seconds; `timeout` starts once it is sent.
+        `caller` and `priority` are for the Ollama queue's ticket. The time
+        spent queueing goes into `timings` as queue_ms."""
+        queued = time.monotonic()
+        backend = await self._begin(payload['model'], wait)
+        ticket = await self._ticket(backend, caller, priority,
+                                    max(0.0, wait - (time.monotonic() - queued)), timeout + 30)
+        if timings is not None:
+            timings['queue_ms'] = round((time.monotonic() - queued) * 1000, 1)
+        payload = dict(payload, keep_alive=self.keep_alive, stream=False)
+        start = time.monotonic()
+        ok, status, timed_out, verdict, result = False, None, False, True, None
+        try:
+            r = await self.client.post_json(f'{backend.url}{path}', payload, timeout=timeout)
+            r.raise_for_status()
+            result = r.json()
+            ok = True
+            return result, backend.url
+        except UpstreamError as e:
+            status = e.status
+            raise
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        except asyncio.CancelledError:
+            verdict = False
+            raise
+        finally:
+            self._end(backend, start, ok, status, timed_out, verdict, result)
+            if self.tickets:
+                self.tickets.release(ticket)
+
+    async def stream(self, payload, timeout, path='/api/generate', wait=0.0,
+                     caller=None, priority=None, timings=None):
+        """Streaming /api/generate (or /api/chat): yields parsed NDJSON chunks."""
+        queued = time.monotonic()
+        backend = await self._begin(payload['model'], wait)
+        ticket = await self._ticket(backend, caller, priority,
+                                    max(0.0, wait - (time.monotonic() - queued)), timeout + 30)
+        if timings is not None:
+            timings['queue_ms'] = round((time.monotonic() - queued) * 1000, 1)
+        payload = dict(payload, keep_alive=self.keep_alive, stream=True)
+        start = time.monotonic()
+        ok, status, timed_out, verdict, result = False, None, False, True, None
+        try:
+            lines = self.client.stream_json(f'{backend.url}{path}', payload, timeout=timeout)
+            async with aclosing(lines):
+                async for line in lines:
+                    if line.strip():
+                        chunk = json.loads(line)
+                        if chunk.get('done'):
+                            ok, result = True, chunk
+                        yield chunk
+            ok = True
+        except UpstreamError as e:
+            status = e.status
+            raise
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            verdict = ok  # Closed after the final chunk counts as done
+            raise
+        finally:
+            self._end(backend, start, ok, status, timed_out, verdict, result)
+            if self.tickets:
+                self.tickets.release(ticket)
+
+    def stats(self):
+        return [dict(url=b.url, outstanding=b.outstanding, concurrency=b.concurrency,
+                     models=sorted(b.models) if b.models is not None else None,
+                     health=b.health.stats(), **b.residency.stats(), **b.counters)
+                for b in self.backends]
+
+    def residency_stats(self):
+        return {
+            'keep_alive': self.keep_alive,
+            'queued': self.queues.depth(),
+            'swaps': sum(b.residency.swaps for b in self.backends),
+            'load_seconds': round(sum(b.residency.load_seconds for b in self.backends), 1),
+            'policy': self.policy.stats(),
+            'prompt_eval': {model: {'calls': t['calls'],
+                                    'mean_tokens': round(t['tokens'] / t['calls'], 1),
+                                    'mean_ms': round(t['seconds'] * 1000 / t['calls'], 1)}
+                            for model, t in self.prompt_eval.items()},
+        }
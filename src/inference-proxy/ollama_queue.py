@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Digiquarium Ollama Queue — one fair queue in front of the shared Ollama.
+
+Replaces the /shared/.ollama_lock flock (and the agents' LOCK_NB spin
+loops): everyone that talks to Ollama directly takes a ticket here first,
+and at most OLLAMA_NUM_PARALLEL tickets are out at a time, matching the
+requests Ollama itself runs in parallel. A slot goes to the next waiter
+the moment it is released, instead of whoever's sleep happens to end first.
+
+Waiters are served FIFO within their priority class; classes share the
+slots by weight, visitors always first (scheduler.FairQueue, the same
+classes and PROXY_* weights as the proxy's key queue).
+
+    POST /v1/tickets {"caller", "priority", "wait", "lease"}
+        Holds the request until a slot is free: 200 {"ticket", "waited_ms"},
+        or 503 after `wait` seconds. A caller that hangs up while queued
+        loses its place. The ticket lapses after `lease` seconds if it is
+        never released (the caller died mid-generation).
+    POST /v1/tickets/<ticket>/release
+        Frees the slot: 200 {"held_ms"}, 404 if it had already lapsed.
+    GET /v1/queue
+        Slots, tickets out, waiters per class, and per caller (tank) a
+        histogram of time spent waiting.
+    GET /metrics
+        The same for Prometheus.
+
+Same image as the proxy, run as `python3 -u ollama_queue.py` on
+isolated-net as digiquarium-ollama-queue (QUEUE_PORT, default 8101): the
+ollama-queue service in docker-compose.yml. While it's down, direct
+callers serialize on the /shared/.ollama_lock flock instead.
+Clients: src/explorer/inference.py and the proxy's Ollama pool (see
+TicketClient), both by default; OLLAMA_QUEUE_URL= (empty) opts out.
+"""
+import os
+import time
+import asyncio
+import secrets
+import logging
+from contextlib import suppress
+
+from upstream import UpstreamError
+from httpserver import read_request, send_json, send_text
+from metrics import Histogram, Registry
+from scheduler import FairQueue, PRIORITY_CLASSES, DEFAULT_PRIORITY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+logger = logging.getLogger('OllamaQueue')
+
+LISTEN_PORT = int(os.getenv('QUEUE_PORT', '8101'))
+SLOTS = int(os.getenv('OLLAMA_NUM_PARALLEL', '1'))
+DEFAULT_WAIT = 60.0
+MAX_WAIT = float(os.getenv('QUEUE_MAX_WAIT', '900'))
+DEFAULT_LEASE = 300.0
+MAX_LEASE = float(os.getenv('QUEUE_MAX_LEASE', '1800'))
+# Seconds; the last bucket is +Inf
+WAIT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+
+def load_weights(env_var):
+    weights = {}
+    for item in os.getenv(env_var, '').split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+STRICT_CLASSES = [c.strip() for c in os.getenv('PROXY_STRICT_CLASSES', 'visitor').split(',') if c.strip()]
+CLASS_WEIGHTS = load_weights('PROXY_CLASS_WEIGHTS')
+
+
+class QueueTimeout(Exception):
+    """No slot came free within the caller's wait."""
+
+
+class Ticket:
+    def __init__(self, caller, priority):
+        self.id = secrets.token_hex(8)
+        self.caller = caller
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.granted_at = None
+        self.lapse = None  # TimerHandle while held
+
+
+class TicketQueue:
+    """`slots` tickets out at a time; waiters FIFO per priority class."""
+
+    def __init__(self, slots=SLOTS, class_weights=None, strict_classes=('visitor',)):
+        self.slots = max(1, slots)
+        self.waiting = FairQueue(class_weights, strict_classes)
+        self.held = {}
+        self.callers = {}
+        self.counters = {'granted': 0, 'released': 0, 'lapsed': 0, 'timed_out': 0, 'abandoned': 0}
+
+    def _caller(self, caller):
+        if caller not in self.callers:
+            self.callers[caller] = {'granted': 0, 'timed_out': 0, 'held_seconds': 0.0,
+                                    'wait': Histogram(WAIT_BUCKETS)}
+        return self.callers[caller]
+
+    async def acquire(self, caller, priority, wait, lease):
+        """A granted Ticket. Raises QueueTimeout if no slot came free
+        within `wait` seconds."""
+        ticket = Ticket(caller, priority)
+        future = asyncio.get_running_loop().create_future()
+        # The class is the flow too, so each class is a single FIFO
+        self.waiting.push((future, ticket, lease), priority, priority)
+        self._dispatch()
+        try:
+            if not future.done() and wait > 0:
+                await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # Granted as we were cancelled
+                self.counters['abandoned'] += 1
+                self.release(ticket.id)
+            future.cancel()
+            raise
+        if not future.done():
+            future.cancel()
+            self.counters['timed_out'] += 1
+            self._caller(caller)['timed_out'] += 1
+            raise QueueTimeout(f'no Ollama slot within {wait:.1f}s')
+        return ticket
+
+    def _dispatch(self):
+        while len(self.held) < self.slots:
+            head = self.waiting.peek()
+            if head is None:
+                return
+            cls, flow, (future, ticket, lease) = head
+            self.waiting.pop(cls, flow)
+            now = time.monotonic()
+            ticket.granted_at = now
+            ticket.lapse = asyncio.get_running_loop().call_later(lease, self._lapse, ticket.id)
+            self.held[ticket.id] = ticket
+            stats = self._caller(ticket.caller)
+            stats['granted'] += 1
+            stats['wait'].observe(now - ticket.queued_at)
+            self.counters['granted'] += 1
+            future.set_result(ticket)
+
+    def _free(self, ticket_id):
+        ticket = self.held.pop(ticket_id, None)
+        if ticket is None:
+            return None
+        ticket.lapse.cancel()
+        held = time.monotonic() - ticket.granted_at
+        self._caller(ticket.caller)['held_seconds'] += held
+        self._dispatch()
+        return held
+
+    def release(self, ticket_id):
+        """Seconds the ticket was held, or None if it is not out."""
+        held = self._free(ticket_id)
+        if held is not None:
+            self.counters['released'] += 1
+        return held
+
+    def _lapse(self, ticket_id):
+        ticket = self.held.get(ticket_id)
+        if ticket and self._free(ticket_id) is not None:
+            self.counters['lapsed'] += 1
+            logger.warning(f"Ticket for {ticket.caller} lapsed without a release")
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'slots': self.slots,
+            'held': [{'caller': t.caller, 'priority': t.priority,
+                      'held_seconds': round(now - t.granted_at, 1)} for t in self.held.values()],
+            'waiting': {cls: sum(flows.values()) for cls, flows in self.waiting.depth().items()},
+            **self.counters,
+            'callers': {caller: dict(s, held_seconds=round(s['held_seconds'], 1),
+                                     wait=s['wait'].to_dict())
+                        for caller, s in sorted(self.callers.items())},
+        }
+
+
+class TicketClient:
+    """The proxy's side of the queue: a ticket around each request its
+    Ollama pool sends. If the queue service can't be reached, requests go
+    ahead unqueued and it is tried again `retry_after` seconds later."""
+
+    def __init__(self, client, url, retry_after=30.0):
+        self.client = client
+        self.url = url.rstrip('/')
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        self._releases = set()
+
+    async def acquire(self, caller, priority, wait, lease):
+        """Ticket id, or None when going ahead unqueued. Raises
+        QueueTimeout if no slot came free within `wait` seconds."""
+        if time.monotonic() < self.down_until:
+            return None
+        body = {'caller': caller, 'priority': priority, 'wait': wait, 'lease': lease}
+        try:
+            r = await self.client.post_json(f'{self.url}/v1/tickets', body, timeout=wait + 5)
+            r.raise_for_status()
+            return r.json()['ticket']
+        except UpstreamError as e:
+            if e.status == 503:
+                raise QueueTimeout(e.body.decode('utf-8', 'replace')) from e
+            error = e
+        except (OSError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            error = e
+        self.down_until = time.monotonic() + self.retry_after
+        logger.warning(f"Ollama queue {self.url} unavailable ({error!r}), "
+                       f"going unqueued for {self.retry_after:.0f}s")
+        return None
+
+    def release(self, ticket):
+        """Give the ticket back in the background (no await in finally
+        blocks of cancelled requests)."""
+        if ticket is None:
+            return
+        task = asyncio.create_task(self._release(ticket))
+        self._releases.add(task)  # Keep a reference until done
+        task.add_done_callback(self._releases.discard)
+
+    async def _release(self, ticket):
+        try:
+            r = await self.client.post_json(f'{self.url}/v1/tickets/{ticket}/release', {}, timeout=5)
+            r.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Ollama queue: release failed ({e!r}); the ticket will lapse")
+
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+
+QUEUE = TicketQueue(SLOTS, CLASS_WEIGHTS, STRICT_CLASSES)
+
+METRICS = Registry()
+METRICS.gauge('ollama_queue_slots', 'Tickets that may be out at once',
+              collect=lambda: {(): QUEUE.slots})
+METRICS.gauge('ollama_queue_held', 'Tickets out', collect=lambda: {(): len(QUEUE.held)})
+METRICS.gauge('ollama_queue_waiting', 'Callers waiting for a slot, per priority class', ('priority',),
+              collect=lambda: {(cls, ): sum(flows.values()) for cls, flows in QUEUE.waiting.depth().items()})
+METRICS.counter('ollama_queue_tickets_total', 'Tickets by what became of them', ('event',),
+                collect=lambda: {(event, ): n for event, n in QUEUE.counters.items()})
+METRICS.histogram('ollama_queue_wait_seconds', 'Time waited for a slot, per caller', ('caller',),
+                  WAIT_BUCKETS, collect=lambda: {(caller, ): s['wait'] for caller, s in QUEUE.callers.items()})
+
+
+def seconds(value, default, ceiling):
+    try:
+        return min(max(float(value), 0.0), ceiling) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+async def take_ticket(body):
+    priority = body.get('priority', DEFAULT_PRIORITY)
+    if priority not in PRIORITY_CLASSES:
+        priority = DEFAULT_PRIORITY
+    wait = seconds(body.get('wait'), DEFAULT_WAIT, MAX_WAIT)
+    lease = seconds(body.get('lease'), DEFAULT_LEASE, MAX_LEASE)
+    try:
+        ticket = await QUEUE.acquire(str(body.get('caller') or 'anonymous'), priority, wait, lease)
+    except QueueTimeout as e:
+        return 503, {'error': str(e), 'waiting': len(QUEUE.waiting)}
+    return 200, {'ticket': ticket.id, 'waited_ms': round((ticket.granted_at - ticket.queued_at) * 1000, 1),
+                 'lease': lease}
+
+
+async def unless_hung_up(reader, work):
+    """Run `work` unless the client hangs up first; a tank that gave up
+    (or died) while queued must not be handed a slot."""
+    task = asyncio.ensure_future(work)
+    hangup = asyncio.ensure_future(reader.read(1))
+    try:
+        await asyncio.wait({task, hangup}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        hangup.cancel()
+        with suppress(asyncio.CancelledError):
+            await hangup  # The connection's next read must not race it
+    if task.done():
+        return task.result()
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+    raise ConnectionResetError('client hung up while queued')
+
+
+async def dispatch(request, reader):
+    try:
+        body = request.json()
+    except ValueError:
+        return 400, {'error': 'Invalid JSON'}
+    path = request.path.rstrip('/')
+    if request.method == 'POST' and path == '/v1/tickets':
+        return await unless_hung_up(reader, take_ticket(body))
+    if request.method == 'POST' and path.startswith('/v1/tickets/') and path.endswith('/release'):
+        held = QUEUE.release(path[len('/v1/tickets/'):-len('/release')])
+        if held is None:
+            return 404, {'error': 'no such ticket (released or lapsed)'}
+        return 200, {'held_ms': round(held * 1000, 1)}
+    if request.method == 'GET' and path == '/v1/queue':
+        return 200, QUEUE.stats()
+    if request.method == 'GET' and path == '/metrics':
+        return 200, METRICS.render()
+    return 404, {'error': 'Not found'}
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            request = await read_request(reader)
+            if request is None:
+                break
+            status, payload = await dispatch(request, reader)
+            if isinstance(payload, str):
+                await send_text(writer, status, payload, request.keep_alive)
+            else:
+                await send_json(writer, status, payload, request.keep_alive)
+            if not request.keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    logger.info(f"Ollama queue starting on port {LISTEN_PORT}: {QUEUE.slots} slot(s)")
+    server = await asyncio.start_server(handle_connection, '0.0.0.0', LISTEN_PORT)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Request profiles: output length and sampling per use case.
+
+A request names what it is for ("profile": "link-choice") and gets that
+profile's max tokens, stop sequences, temperature and top_p, whichever
+backend answers it: cloud providers get them as max_tokens / stop /
+temperature / top_p, Ollama as the matching `options`. A request without
+a profile gets "default", which is what every request used to get.
+
+PROXY_PROFILES_FILE may point at a JSON file of {name: {setting: value}}
+that overrides these settings or adds profiles.
+
+Each profile keeps its own numbers (requests, failures, latency
+percentiles, prompt and completion tokens, who served it) for
+GET /v1/profiles.
+"""
+import json
+import logging
+from collections import deque
+
+from routing import percentile, LATENCY_WINDOW
+
+logger = logging.getLogger('InferenceProxy')
+
+DEFAULT_PROFILE = 'default'
+SETTINGS = ('max_tokens', 'temperature', 'top_p', 'stop')
+
+PROFILES = {
+    DEFAULT_PROFILE:     {'max_tokens': 2048, 'temperature': 0.8, 'top_p': 0.9, 'stop': []},
+    # A tank thinking out loud about an article (thoughts and choice in one
+    # structured answer use this too)
+    'explore-thought':   {'max_tokens': 250, 'temperature': 0.9, 'top_p': 0.9, 'stop': []},
+    # "Which link calls to me? Why?": a title and a sentence or two
+    'link-choice':       {'max_tokens': 120, 'temperature': 0.7, 'top_p': 0.9, 'stop': []},
+    'baseline-answer':   {'max_tokens': 300, 'temperature': 0.9, 'top_p': 0.9, 'stop': []},
+    # "Respond in 2-3 sentences"
+    'congregation-turn': {'max_tokens': 150, 'temperature': 0.8, 'top_p': 0.9, 'stop': []},
+    'translation':       {'max_tokens': 250, 'temperature': 0.2, 'top_p': 0.9, 'stop': []},
+    # The prompt ends "<specimen>:"; don't let the model write the visitor's lines
+    'visitor-chat':      {'max_tokens': 300, 'temperature': 0.8, 'top_p': 0.9, 'stop': ['\nVisitor:']},
+    'health-probe':      {'max_tokens': 3, 'temperature': 0.0, 'top_p': 1.0, 'stop': []},
+}
+
+
+class Profile:
+    """One profile's settings and numbers."""
+
+    def __init__(self, name, max_tokens, temperature, top_p, stop=()):
+        self.name = name
+        self.max_tokens = int(max_tokens)
+        self.temperature = float(temperature)
+        self.top_p = float(top_p)
+        self.stop = list(stop or [])
+        self.counters = {'requests': 0, 'failures': 0, 'upstream_calls': 0,
+                         'prompt_tokens': 0, 'completion_tokens': 0}
+        self.served_by = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def chat_params(self):
+        """OpenAI-style chat completion parameters (Cerebras, Groq)."""
+        params = {'max_tokens': self.max_tokens, 'temperature': self.temperature, 'top_p': self.top_p}
+        if self.stop:
+            params['stop'] = self.stop[:4]  # OpenAI-style APIs take at most four
+        return params
+
+    def ollama_options(self):
+        options = {'num_predict': self.max_tokens, 'temperature': self.temperature, 'top_p': self.top_p}
+        if self.stop:
+            options['stop'] = self.stop
+        return options
+
+    def add_tokens(self, prompt_tokens, completion_tokens):
+        """One upstream call made for a request with this profile."""
+        self.counters['upstream_calls'] += 1
+        self.counters['prompt_tokens'] += prompt_tokens
+        self.counters['completion_tokens'] += completion_tokens
+
+    def observe(self, elapsed, served_by):
+        """A request finished after `elapsed` seconds; `served_by` is None if
+        nothing answered."""
+        self.counters['requests'] += 1
+        if served_by is None:
+            self.counters['failures'] += 1
+            return
+        self.served_by[served_by] = self.served_by.get(served_by, 0) + 1
+        self.latencies.append(elapsed)
+
+    def settings(self):
+        return {'max_tokens': self.max_tokens, 'temperature': self.temperature,
+                'top_p': self.top_p, 'stop': self.stop}
+
+    def stats(self):
+        answered = max(self.counters['requests'] - self.counters['failures'], 1)
+        return dict(self.counters,
+                    served_by=dict(self.served_by),
+                    completion_tokens_per_request=round(self.counters['completion_tokens'] / answered, 1),
+                    p50=round(percentile(self.latencies, 50) or 0.0, 3),
+                    p95=round(percentile(self.latencies, 95) or 0.0, 3))
+
+
+def load_profiles(path=None):
+    """PROFILES, with the overrides and additions from the JSON file at `path`."""
+    table = {name: dict(settings) for name, settings in PROFILES.items()}
+    overrides = {}
+    if path:
+        try:
+            with open(path) as f:
+                overrides = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Profiles: could not read {path} ({e}), using the built-in ones")
+    for name, settings in overrides.items():
+        table[name] = dict(table.get(name, PROFILES[DEFAULT_PROFILE]),
+                           **{k: v for k, v in settings.items() if k in SETTINGS})
+    return {name: Profile(name, **settings) for name, settings in table.items()}
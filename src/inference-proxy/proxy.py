@@ -6,25 +6,43 @@ Tanks on the isolated network call this proxy. The proxy forwards to cloud APIs
 on the default network. This way tanks never have direct internet access, and
 API keys are only stored in this container's environment.
 
-Supports multi-key rotation per provider with per-key rate limiting.
+Supports multi-key rotation per provider with per-key rate limiting
+(scheduler.py), on an asyncio engine with kept-alive upstream connections
+(upstream.py). POST /v1/generate (?stream=1 for NDJSON deltas) routes each
+request under one deadline across cloud providers and Ollama, optionally
+hedged (routing.py); Ollama hosts are pooled and their loaded models
+managed (ollama_pool.py, residency.py), and /api/* speaks Ollama's API.
+Usage is booked and budgeted (accounting.py), identical requests can share
+an answer (coalesce.py), "profile" picks per-use-case settings
+(profiles.py) and POST /v1/jobs runs batches (jobs.py). Metrics and passive
+health are under GET /metrics and GET /v1/stats (metrics.py).
 """
 import os
 import json
 import time
-import fcntl
+import asyncio
+import inspect
 import logging
-import urllib.request
-import urllib.error
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from socketserver import ThreadingMixIn
-from pathlib import Path
+from contextlib import aclosing, contextmanager
+
+from upstream import UpstreamClient, UpstreamError
+from httpserver import read_request, send_stream, send_json, send_text
+from scheduler import KeyScheduler, FairQueue, PRIORITY_CLASSES, DEFAULT_PRIORITY
+from routing import Deadline, BackendHealth, RoutingLog, HedgePolicy, MIN_ATTEMPT_SECONDS
+from ollama_pool import OllamaPool, OllamaBusy, timings as ollama_timings
+from ollama_queue import TicketClient
+from accounting import Ledger
+from coalesce import Coalescer, request_key
+from profiles import load_profiles, DEFAULT_PROFILE
+from jobs import JobStore, ItemBusy, JOB_ID
+from metrics import Registry, Traffic, WAIT_BUCKETS, RATE_BUCKETS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
 logger = logging.getLogger('InferenceProxy')
 
 LISTEN_PORT = int(os.getenv('PROXY_PORT', '8100'))
-LOCK_DIR = Path('/tmp/proxy_locks')
-LOCK_DIR.mkdir(exist_ok=True)
+POOL_SIZE = int(os.getenv('PROXY_POOL_SIZE', '32'))       # Connections per upstream origin
+POOL_IDLE_TIMEOUT = float(os.getenv('PROXY_POOL_IDLE', '30'))
 
 # Load keys from environment
 def load_keys(env_var):
@@ -33,159 +51,1258 @@ def load_keys(env_var):
 
 PROVIDERS = {
     'cerebras': {
-        'url': 'https://api.cerebras.ai/v1/chat/completions',
+        'url': os.getenv('CEREBRAS_URL', 'https://api.cerebras.ai/v1/chat/completions'),
         'keys': load_keys('CEREBRAS_API_KEYS'),
         'model': os.getenv('CEREBRAS_MODEL', 'llama3.1-8b'),
-        'rate_limit': 2,
+        'rpm': int(os.getenv('CEREBRAS_RPM', '30')),
+        'tpm': int(os.getenv('CEREBRAS_TPM', '60000')),
+        'concurrency': int(os.getenv('CEREBRAS_KEY_CONCURRENCY', '1')),
     },
     # Together.ai removed — requires payment to activate (402)
     'groq': {
-        'url': 'https://api.groq.com/openai/v1/chat/completions',
+        'url': os.getenv('GROQ_URL', 'https://api.groq.com/openai/v1/chat/completions'),
         'keys': load_keys('GROQ_API_KEYS'),
         'model': os.getenv('GROQ_MODEL', 'llama-3.1-8b-instant'),
-        'rate_limit': 20,
+        'rpm': int(os.getenv('GROQ_RPM', '30')),
+        'tpm': int(os.getenv('GROQ_TPM', '6000')),
+        'concurrency': int(os.getenv('GROQ_KEY_CONCURRENCY', '1')),
     },
 }
 
+# How long a caller may queue for a provider's key before falling through
+# to the next provider (never longer than its share of the deadline).
+# Queued callers hold no key and no thread.
+KEY_MAX_WAIT = float(os.getenv('PROXY_KEY_MAX_WAIT', '10'))
+# Completion tokens assumed when charging the TPM bucket up front; the
+# provider's usage block corrects it afterwards.
+EST_COMPLETION_TOKENS = int(os.getenv('PROXY_EST_COMPLETION_TOKENS', '300'))
+
+# Priority classes (see scheduler.PRIORITY_CLASSES). Strict classes always
+# go first; the rest share by weight. Within a class, callers share by
+# weight (default 1 each).
+def load_weights(env_var):
+    weights = {}
+    for item in os.getenv(env_var, '').split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+STRICT_CLASSES = [c.strip() for c in os.getenv('PROXY_STRICT_CLASSES', 'visitor').split(',') if c.strip()]
+CLASS_WEIGHTS = load_weights('PROXY_CLASS_WEIGHTS')     # e.g. "congregation=8,batch=1"
+CALLER_WEIGHTS = load_weights('PROXY_CALLER_WEIGHTS')   # e.g. "tank-17-seth=0.5"
+
+
+# Circuit breakers: consecutive failures to open, seconds before a probe
+KEY_BREAKER_FAILURES = int(os.getenv('PROXY_KEY_BREAKER_FAILURES', '3'))
+KEY_BREAKER_COOLDOWN = float(os.getenv('PROXY_KEY_BREAKER_COOLDOWN', '30'))
+PROVIDER_BREAKER_FAILURES = int(os.getenv('PROXY_PROVIDER_BREAKER_FAILURES', '5'))
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv('PROXY_PROVIDER_BREAKER_COOLDOWN', '60'))
+# Latency assumed for a provider before its first answer, for scoring
+PROVIDER_PRIOR_SECONDS = float(os.getenv('PROXY_PROVIDER_PRIOR_SECONDS', '2'))
+
+# Hedging: classes that hedge unless the request says otherwise, extra
+# upstream calls allowed per request, and how long to wait: the later of the
+# first-byte p(100 - 100 * budget) and HEDGE_MULTIPLE times the p(HEDGE_PERCENTILE)
+HEDGE_CLASSES = [c.strip() for c in os.getenv('PROXY_HEDGE_CLASSES', '').split(',') if c.strip()]
+HEDGE_BUDGET = float(os.getenv('PROXY_HEDGE_BUDGET', '0.05'))
+HEDGE_PERCENTILE = float(os.getenv('PROXY_HEDGE_PERCENTILE', '90'))
+HEDGE_MULTIPLE = float(os.getenv('PROXY_HEDGE_MULTIPLE', '1.5'))
+
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
+OLLAMA_URLS = load_keys('OLLAMA_URLS') or [OLLAMA_URL]   # Comma-separated, one per host
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
+OLLAMA_CONCURRENCY = int(os.getenv('OLLAMA_CONCURRENCY', '1'))      # Per host
+OLLAMA_EJECT_FAILURES = int(os.getenv('OLLAMA_EJECT_FAILURES', '3'))
+OLLAMA_EJECT_SECONDS = float(os.getenv('OLLAMA_EJECT_SECONDS', '30'))
+OLLAMA_TAGS_INTERVAL = float(os.getenv('OLLAMA_TAGS_INTERVAL', '60'))
+# Residency: how long Ollama keeps a model after its last request, how much
+# queued waiting (in multiples of a model's load time) justifies a swap, and
+# the load time assumed before one has been seen
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_SWAP_FACTOR = float(os.getenv('OLLAMA_SWAP_FACTOR', '2'))
+OLLAMA_LOAD_PRIOR_SECONDS = float(os.getenv('OLLAMA_LOAD_PRIOR_SECONDS', '30'))
+# Direct Ollama API callers: longest wait in the model queue, then per call
+OLLAMA_QUEUE_WAIT = float(os.getenv('OLLAMA_QUEUE_WAIT', '600'))
+OLLAMA_API_TIMEOUT = float(os.getenv('OLLAMA_API_TIMEOUT', '600'))
+OLLAMA_API_CALLER = 'ollama-api'   # Their tokens are booked to this caller
+# The Ollama queue service (ollama_queue.py) shared with the tanks' direct
+# calls, the same default as theirs. Set it empty when OLLAMA_URLS lists
+# hosts it doesn't manage.
+OLLAMA_QUEUE_URL = os.getenv('OLLAMA_QUEUE_URL', 'http://digiquarium-ollama-queue:8101')
 
+# Token accounting: where the daily usage files go and how many days to keep,
+# daily token budgets (cloud tokens per caller, "*" for the rest; all
+# tokens per provider), and the class an over-budget caller drops to
+PROXY_ACCOUNTING_DIR = os.getenv('PROXY_ACCOUNTING_DIR', '/logs/accounting')
+PROXY_ACCOUNTING_DAYS = int(os.getenv('PROXY_ACCOUNTING_DAYS', '30'))
+CALLER_BUDGETS = load_weights('PROXY_CALLER_BUDGETS')       # e.g. "tank-01-adam=200000,*=100000"
+PROVIDER_BUDGETS = load_weights('PROXY_PROVIDER_BUDGETS')   # e.g. "groq=500000"
+BUDGET_PRIORITY = os.getenv('PROXY_BUDGET_PRIORITY', 'batch')
 
-def try_provider(name, config, system_prompt, user_prompt, timeout):
-    """Try each key for a provider. Returns response text or None."""
-    for idx, key in enumerate(config['keys']):
-        lock_path = LOCK_DIR / f'.{name}_{idx}_lock'
-        ts_path = LOCK_DIR / f'.{name}_{idx}_ts'
+# Request profiles (profiles.py): overrides and additions, as JSON
+PROXY_PROFILES_FILE = os.getenv('PROXY_PROFILES_FILE', '')
 
-        try:
-            lock_fd = open(lock_path, 'w')
-            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except (IOError, OSError):
-            continue  # Key busy, try next
+# Batch jobs (jobs.py): where the journals go, items running at once across
+# all jobs, attempts per item, per-item deadline, and days to keep finished jobs
+PROXY_JOBS_DIR = os.getenv('PROXY_JOBS_DIR', '/logs/jobs')
+JOBS_PARALLEL = int(os.getenv('PROXY_JOBS_PARALLEL', '2'))
+JOB_ATTEMPTS = int(os.getenv('PROXY_JOB_ATTEMPTS', '5'))
+JOB_ITEM_TIMEOUT = float(os.getenv('PROXY_JOB_ITEM_TIMEOUT', '300'))
+JOBS_DAYS = int(os.getenv('PROXY_JOBS_DAYS', '30'))
+JOB_PRIORITY = 'batch'
+
+# Passive health (GET /v1/stats): how many seconds of real traffic are kept
+# for the per-backend counts, how many failed calls in a row make a backend
+# failing, and for how long its last answer counts as ok
+HEALTH_WINDOW = float(os.getenv('PROXY_HEALTH_WINDOW', '300'))
+HEALTH_STREAK = int(os.getenv('PROXY_HEALTH_STREAK', '3'))
+HEALTH_FRESH = float(os.getenv('PROXY_HEALTH_FRESH', '60'))
+
+# OpenAI-style response_format types /v1/generate passes on (as `format` to Ollama)
+RESPONSE_FORMATS = ('json_object', 'json_schema')
+
+client = UpstreamClient(max_connections=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT)
+
+
+SCHEDULERS = {name: KeyScheduler(name, cfg['keys'], cfg['rpm'], cfg['tpm'], cfg['concurrency'],
+                                 queue=FairQueue(CLASS_WEIGHTS, STRICT_CLASSES, CALLER_WEIGHTS),
+                                 failure_threshold=KEY_BREAKER_FAILURES,
+                                 cooldown_seconds=KEY_BREAKER_COOLDOWN)
+              for name, cfg in PROVIDERS.items()}
+OLLAMA = OllamaPool(client, OLLAMA_URLS, OLLAMA_CONCURRENCY, OLLAMA_EJECT_FAILURES,
+                    OLLAMA_EJECT_SECONDS, OLLAMA_TAGS_INTERVAL, OLLAMA_KEEP_ALIVE,
+                    OLLAMA_SWAP_FACTOR, OLLAMA_LOAD_PRIOR_SECONDS,
+                    TicketClient(client, OLLAMA_QUEUE_URL) if OLLAMA_QUEUE_URL else None)
+HEALTH = {name: BackendHealth(name, PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_COOLDOWN,
+                              PROVIDER_PRIOR_SECONDS)
+          for name in list(PROVIDERS) + ['ollama']}
+ROUTING = RoutingLog()
+COALESCER = Coalescer()
+PROFILES = load_profiles(PROXY_PROFILES_FILE)
+LEDGER = Ledger(PROXY_ACCOUNTING_DIR, PROXY_ACCOUNTING_DAYS, CALLER_BUDGETS, PROVIDER_BUDGETS)
+HEDGER = HedgePolicy(HEDGE_BUDGET, HEDGE_PERCENTILE, multiple=HEDGE_MULTIPLE)
+
+
+# Metrics (metrics.py): GET /metrics in Prometheus' text format, GET /v1/stats as JSON
+METRICS = Registry()
+TRAFFIC = Traffic(HEALTH_WINDOW, HEALTH_STREAK, HEALTH_FRESH)
+UPSTREAM_CALLS = METRICS.counter(
+    'inference_upstream_requests_total', 'Upstream calls by provider, key, caller and outcome',
+    ('provider', 'key', 'caller', 'outcome'))
+UPSTREAM_SECONDS = METRICS.histogram(
+    'inference_upstream_seconds', 'Upstream call latency, send to last byte', ('provider',))
+FIRST_TOKEN_SECONDS = METRICS.histogram(
+    'inference_first_token_seconds', 'Upstream time to first token', ('provider',))
+TOKEN_RATE = METRICS.histogram(
+    'inference_tokens_per_second', 'Completion tokens per second of generation', ('provider',),
+    RATE_BUCKETS)
+TOKENS = METRICS.counter(
+    'inference_tokens_total', 'Tokens by provider, caller and kind (prompt, completion)',
+    ('provider', 'caller', 'kind'))
+QUEUE_WAIT_SECONDS = METRICS.histogram(
+    'inference_queue_wait_seconds', 'Wait for a provider key or an Ollama slot', ('backend',),
+    WAIT_BUCKETS)
+NO_CAPACITY = METRICS.counter(
+    'inference_no_capacity_total', 'Attempts that found no key or slot free in time', ('backend',))
+REQUESTS = METRICS.counter(
+    'inference_requests_total', 'Requests by priority class and the backend that answered',
+    ('priority', 'served_by'))
+REQUEST_SECONDS = METRICS.histogram(
+    'inference_request_seconds', 'Whole request latency, all attempts included', ('priority',))
+METRICS.gauge('inference_queue_depth', 'Callers queued for a key, per provider', ('provider',),
+              collect=lambda: {(name, ): s.queue_depth() for name, s in SCHEDULERS.items()})
+METRICS.gauge('inference_key_in_flight', 'Calls in flight per provider key', ('provider', 'key'),
+              collect=lambda: {(name, k.name): k.in_flight for name, s in SCHEDULERS.items()
+                               for k in s.keys})
+METRICS.gauge('inference_ollama_outstanding', 'Requests running per Ollama host', ('url',),
+              collect=lambda: {(b.url, ): b.outstanding for b in OLLAMA.backends})
+METRICS.gauge('inference_breaker_open', '1 while a backend\'s circuit breaker is open', ('backend',),
+              collect=lambda: {(name, ): int(h.breaker.state == h.breaker.OPEN)
+                               for name, h in HEALTH.items()})
+METRICS.gauge('inference_coalesced_in_flight', 'Requests others are waiting on',
+              collect=lambda: {(): COALESCER.stats()['in_flight']})
+METRICS.gauge('inference_jobs_running', 'Batch jobs not yet finished',
+              collect=lambda: {(): JOBS.stats()['running']})
+
+
+def outcome(ok, status=None, timed_out=False):
+    """An upstream call's outcome label."""
+    if ok:
+        return 'ok'
+    if timed_out:
+        return 'timeout'
+    if status == 429:
+        return 'rate_limited'
+    if status is not None:
+        return f'http_{status // 100}xx'
+    return 'error'
+
+
+def observe_upstream(provider, key, caller, latency, ok, status, timed_out, prompt_tokens,
+                     completion_tokens, generation_seconds=None):
+    """Metrics and passive health for one upstream call. `generation_seconds`
+    is the time spent producing the completion, where the backend reports
+    it (Ollama); otherwise the whole latency."""
+    caller = caller or 'anonymous'
+    UPSTREAM_CALLS.inc(provider=provider, key=key or '', caller=caller,
+                       outcome=outcome(ok, status, timed_out))
+    UPSTREAM_SECONDS.observe(latency, provider=provider)
+    TOKENS.inc(prompt_tokens, provider=provider, caller=caller, kind='prompt')
+    TOKENS.inc(completion_tokens, provider=provider, caller=caller, kind='completion')
+    seconds = generation_seconds or latency
+    if ok and completion_tokens and seconds > 0:
+        TOKEN_RATE.observe(completion_tokens / seconds, provider=provider)
+    TRAFFIC.observe(provider, ok)
+
+
+def observe_request(priority, served_by, seconds):
+    REQUESTS.inc(priority=priority, served_by=served_by or 'none')
+    REQUEST_SECONDS.observe(seconds, priority=priority)
+
+
+def chat_payload(config, system_prompt, user_prompt, stream=False, response_format=None,
+                 profile=None):
+    """OpenAI-style chat completion body (Cerebras, Groq)."""
+    payload = {
+        'model': config['model'],
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt}
+        ],
+        **(profile or PROFILES[DEFAULT_PROFILE]).chat_params(),
+        'stream': stream,
+    }
+    if response_format:
+        payload['response_format'] = response_format
+    return payload
 
+
+def ollama_payload(system_prompt, user_prompt, stream=False, model=None, response_format=None,
+                   profile=None):
+    payload = {
+        'model': model or OLLAMA_MODEL,
+        'prompt': user_prompt,
+        'system': system_prompt,
+        'stream': stream,
+        'options': (profile or PROFILES[DEFAULT_PROFILE]).ollama_options(),
+    }
+    if response_format:
+        payload['format'] = ollama_format(response_format)
+    return payload
+
+
+def ollama_format(response_format):
+    """Ollama's `format` for an OpenAI-style response_format: the schema
+    itself for json_schema, plain JSON mode for json_object."""
+    if response_format['type'] == 'json_schema':
+        return response_format.get('json_schema', {}).get('schema') or 'json'
+    return 'json'
+
+
+def check_response_format(response_format):
+    """Error message if `response_format` isn't one we can pass on, else None."""
+    if response_format is None:
+        return None
+    if not isinstance(response_format, dict) or response_format.get('type') not in RESPONSE_FORMATS:
+        return f"response_format.type must be one of {list(RESPONSE_FORMATS)}"
+    if response_format['type'] == 'json_schema' and not isinstance(
+            response_format.get('json_schema', {}).get('schema'), dict):
+        return "response_format.json_schema.schema must be an object"
+    return None
+
+
+def estimate_tokens(system_prompt, user_prompt):
+    """Rough prompt size (4 chars/token) plus the expected completion."""
+    return (len(system_prompt) + len(user_prompt)) // 4 + EST_COMPLETION_TOKENS
+
+
+def key_wait(name, until):
+    """How long to queue for a key and still leave time to use it."""
+    return min(KEY_MAX_WAIT, max(0.0, until - time.monotonic() - HEALTH[name].expected()))
+
+
+def record(name, scheduler, slot, est_tokens, usage, start, ok, status=None, timed_out=False,
+           caller=None, profile=None):
+    """Release a key, feed the call's outcome to key and provider health and
+    book its tokens (the provider's `usage` block) to `caller` and `profile`.
+    `start` is None when the call never got under way."""
+    latency = None if start is None else time.monotonic() - start
+    scheduler.release(slot, est_tokens, usage.get('total_tokens', 0), ok=ok, status=status,
+                      latency=latency, timed_out=timed_out)
+    if latency is not None:
+        HEALTH[name].observe(latency, ok, status, timed_out)
+        LEDGER.record(caller, name, slot.name, usage.get('prompt_tokens', 0),
+                      usage.get('completion_tokens', 0), latency, ok)
+        observe_upstream(name, slot.name, caller, latency, ok, status, timed_out,
+                         usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        if profile is not None:
+            profile.add_tokens(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+
+
+def record_ollama(caller, url, result, latency, ok, profile=None, status=None, timed_out=False,
+                  timings=None):
+    """Book an Ollama call's tokens (prompt_eval_count / eval_count) to
+    `caller` and `profile`, and observe it for the metrics: time to first
+    token and generation speed come from Ollama's own durations, the wait
+    for a slot from `timings` (queue_ms)."""
+    result = result or {}
+    LEDGER.record(caller, 'ollama', url, result.get('prompt_eval_count', 0),
+                  result.get('eval_count', 0), latency, ok)
+    observe_upstream('ollama', url, caller, latency, ok, status, timed_out,
+                     result.get('prompt_eval_count', 0), result.get('eval_count', 0),
+                     result.get('eval_duration', 0) / 1e9)
+    if ok and result.get('eval_count'):
+        FIRST_TOKEN_SECONDS.observe(
+            (result.get('load_duration', 0) + result.get('prompt_eval_duration', 0)) / 1e9,
+            provider='ollama')
+    if timings and timings.get('queue_ms') is not None:
+        QUEUE_WAIT_SECONDS.observe(timings['queue_ms'] / 1000, backend='ollama')
+    if profile is not None:
+        profile.add_tokens(result.get('prompt_eval_count', 0), result.get('eval_count', 0))
+
+
+async def try_provider(name, config, system_prompt, user_prompt, budget,
+                       caller='anonymous', priority=DEFAULT_PRIORITY, response_format=None,
+                       profile=None, timings=None):
+    """Queue for a provider key, moving on to another key if one fails, all
+    within `budget` seconds. Returns response text or None. Time spent
+    queueing goes into `timings` as queue_ms."""
+    scheduler = SCHEDULERS[name]
+    est_tokens = estimate_tokens(system_prompt, user_prompt)
+    entered = time.monotonic()
+    until = entered + budget
+    tried = set()
+    while len(tried) < len(scheduler.keys):
+        if tried and until - time.monotonic() < MIN_ATTEMPT_SECONDS:
+            return None
+        if HEALTH[name].breaker.state == HEALTH[name].breaker.OPEN:
+            return None  # Tripped (or a failed probe) while we were going through the keys
+        slot = await scheduler.acquire(est_tokens, key_wait(name, until), exclude=tried,
+                                       caller=caller, priority=priority)
+        if slot is None:
+            NO_CAPACITY.inc(backend=name)
+            return None  # No key free soon enough, try next provider
+        tried.add(slot.idx)
+        waited = time.monotonic() - entered
+        QUEUE_WAIT_SECONDS.observe(waited, backend=name)
+        if timings is not None:
+            timings['queue_ms'] = round(waited * 1000, 1)
+
+        ok, usage, status, timed_out = False, {}, None, False
+        timeout = until - time.monotonic()
+        start = time.monotonic()
         try:
-            # Rate limit
-            try:
-                last = float(open(ts_path).read().strip())
-                elapsed = time.time() - last
-                if elapsed < config['rate_limit']:
-                    time.sleep(config['rate_limit'] - elapsed)
-            except (FileNotFoundError, ValueError):
-                pass
-
-            data = json.dumps({
-                'model': config['model'],
-                'messages': [
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': user_prompt}
-                ],
-                'temperature': 0.8,
-                'top_p': 0.9,
-                'max_tokens': 2048
-            }).encode()
-
-            req = urllib.request.Request(config['url'], data=data, headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {key}',
-                'User-Agent': 'Digiquarium/1.0'
-            })
-
-            with urllib.request.urlopen(req, timeout=timeout) as r:
-                result = json.loads(r.read().decode())
-
-            with open(ts_path, 'w') as f:
-                f.write(str(time.time()))
-
-            return result['choices'][0]['message']['content']
+            payload = chat_payload(config, system_prompt, user_prompt, response_format=response_format,
+                                   profile=profile)
+            r = await client.post_json(config['url'], payload,
+                                       headers={'Authorization': f'Bearer {slot.key}'},
+                                       timeout=timeout)
+            r.raise_for_status()
+            result = r.json()
+            usage = result.get('usage') or {}
+            text = result['choices'][0]['message']['content']
+            ok = True
+            HEALTH[name].observe_first_byte(time.monotonic() - entered)
+            FIRST_TOKEN_SECONDS.observe(time.monotonic() - start, provider=name)
+            return text
+        except UpstreamError as e:
+            status = e.status
+            logger.warning(f"{slot.name}: {e}")
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning(f"{slot.name}: timed out after {timeout:.1f}s")
+        except asyncio.CancelledError:
+            start = None  # Caller went away; no verdict on the key
+            raise
         except Exception as e:
-            logger.warning(f"{name}[{idx}]: {e}")
+            logger.warning(f"{slot.name}: {e}")
         finally:
-            try:
-                fcntl.flock(lock_fd, fcntl.LOCK_UN)
-                lock_fd.close()
-            except:
-                pass
+            record(name, scheduler, slot, est_tokens, usage, start, ok, status, timed_out, caller,
+                   profile)
     return None
 
 
-def try_ollama(system_prompt, user_prompt, timeout):
-    """Ollama fallback with blocking lock."""
-    lock_path = LOCK_DIR / '.ollama_lock'
-    lock_fd = open(lock_path, 'w')
-    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Non-blocking — skip if busy
-
+async def try_ollama(system_prompt, user_prompt, timeout, model=None, timings=None,
+                     response_format=None, caller=None, priority=None, profile=None):
+    """Ollama fallback through the pool. Non-blocking — skip if every
+    backend with the model is busy. Ollama's timings go into `timings`."""
+    health = HEALTH['ollama']
+    timings = {} if timings is None else timings
+    start = time.monotonic()
     try:
-        data = json.dumps({
-            'model': OLLAMA_MODEL,
-            'prompt': user_prompt,
-            'system': system_prompt,
-            'stream': False,
-            'options': {'temperature': 0.8, 'top_p': 0.9}
-        }).encode()
-
-        req = urllib.request.Request(
-            f"{OLLAMA_URL}/api/generate",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read().decode())
+        payload = ollama_payload(system_prompt, user_prompt, model=model, response_format=response_format,
+                                 profile=profile)
+        result, url = await OLLAMA.generate(payload, timeout, caller=caller, priority=priority,
+                                            timings=timings)
+        health.observe(time.monotonic() - start, True)
+        record_ollama(caller, url, result, time.monotonic() - start, True, profile, timings=timings)
+        timings.update(ollama_timings(result))
         return result.get('response', '')
+    except OllamaBusy as e:
+        NO_CAPACITY.inc(backend='ollama')
+        logger.warning(f"Ollama: {e}, skipping")
+        return ''
+    except asyncio.TimeoutError:
+        health.observe(time.monotonic() - start, False, timed_out=True)
+        record_ollama(caller, None, None, time.monotonic() - start, False, timed_out=True,
+                      timings=timings)
+        logger.error(f"Ollama: timed out after {timeout:.1f}s")
+        return ''
     except Exception as e:
-        logger.error(f"Ollama: {e}")
+        health.observe(time.monotonic() - start, False, getattr(e, 'status', None))
+        record_ollama(caller, None, None, time.monotonic() - start, False,
+                      status=getattr(e, 'status', None), timings=timings)
+        logger.error(f"Ollama: {e!r}")
         return ''
+
+
+async def stream_provider(name, config, system_prompt, user_prompt, budget,
+                          caller='anonymous', priority=DEFAULT_PRIORITY, response_format=None,
+                          profile=None, timings=None):
+    """Yield text deltas from a provider's `stream: true` SSE. A key that
+    fails before its first delta is swapped for another; a failure after
+    that is raised, since the caller has already seen part of the text."""
+    scheduler = SCHEDULERS[name]
+    est_tokens = estimate_tokens(system_prompt, user_prompt)
+    entered = time.monotonic()
+    until = entered + budget
+    tried = set()
+    while len(tried) < len(scheduler.keys):
+        if tried and until - time.monotonic() < MIN_ATTEMPT_SECONDS:
+            return
+        if HEALTH[name].breaker.state == HEALTH[name].breaker.OPEN:
+            return  # Tripped (or a failed probe) while we were going through the keys
+        slot = await scheduler.acquire(est_tokens, key_wait(name, until), exclude=tried,
+                                       caller=caller, priority=priority)
+        if slot is None:
+            NO_CAPACITY.inc(backend=name)
+            return
+        tried.add(slot.idx)
+        waited = time.monotonic() - entered
+        QUEUE_WAIT_SECONDS.observe(waited, backend=name)
+        if timings is not None:
+            timings['queue_ms'] = round(waited * 1000, 1)
+
+        ok, usage, status, started, timed_out = False, {}, None, False, False
+        timeout = until - time.monotonic()
+        start = time.monotonic()
+        try:
+            payload = chat_payload(config, system_prompt, user_prompt, True, response_format, profile)
+            lines = client.stream_json(config['url'], payload,
+                                       headers={'Authorization': f'Bearer {slot.key}'},
+                                       timeout=timeout)
+            async with aclosing(lines):
+                async for line in lines:
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get('usage') or chunk.get('x_groq', {}).get('usage') or usage
+                    for choice in chunk.get('choices', []):
+                        delta = (choice.get('delta') or {}).get('content')
+                        if delta:
+                            if not started:
+                                started = True
+                                HEALTH[name].observe_first_byte(time.monotonic() - entered)
+                                FIRST_TOKEN_SECONDS.observe(time.monotonic() - start, provider=name)
+                            yield delta
+            ok = started
+            if started:
+                return
+        except UpstreamError as e:
+            status = e.status
+            logger.warning(f"{slot.name}: {e}")
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning(f"{slot.name}: timed out after {timeout:.1f}s")
+            if started:
+                raise
+        except (asyncio.CancelledError, GeneratorExit):
+            if not started:
+                start = None  # Caller went away; no verdict on the key
+            ok = started
+            raise
+        except Exception as e:
+            logger.warning(f"{slot.name}: {e}")
+            if started:
+                raise
+        finally:
+            record(name, scheduler, slot, est_tokens, usage, start, ok, status, timed_out, caller,
+                   profile)
+
+
+async def stream_ollama(system_prompt, user_prompt, timeout, model=None, timings=None,
+                        response_format=None, caller=None, priority=None, profile=None):
+    """Yield text deltas from Ollama's NDJSON stream. Non-blocking — skip if busy."""
+    health = HEALTH['ollama']
+    timings = {} if timings is None else timings
+    start, started, final = time.monotonic(), False, None
+    chunks = OLLAMA.stream(ollama_payload(system_prompt, user_prompt, True, model, response_format,
+                                          profile),
+                           timeout, caller=caller, priority=priority, timings=timings)
+    try:
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.get('response'):
+                    started = True
+                    yield chunk['response']
+                if chunk.get('done'):
+                    final = chunk
+                    timings.update(ollama_timings(chunk))
+                    break
+        health.observe(time.monotonic() - start, started)
+        record_ollama(caller, None, final, time.monotonic() - start, started, profile, timings=timings)
+    except OllamaBusy as e:
+        NO_CAPACITY.inc(backend='ollama')
+        logger.warning(f"Ollama: {e}, skipping")
+    except asyncio.TimeoutError:
+        health.observe(time.monotonic() - start, False, timed_out=True)
+        record_ollama(caller, None, None, time.monotonic() - start, False, timed_out=True,
+                      timings=timings)
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        if started:
+            record_ollama(caller, None, final, time.monotonic() - start, True, profile, timings=timings)
+        raise
+    except Exception as e:
+        health.observe(time.monotonic() - start, False, getattr(e, 'status', None))
+        record_ollama(caller, None, None, time.monotonic() - start, False,
+                      status=getattr(e, 'status', None), timings=timings)
+        raise
+
+
+def plan_route(est_tokens, model=None, caller=None, backends=None):
+    """Backends to try, best first: healthy cloud providers by score, then
+    Ollama (with `model`). A caller over its daily budget gets Ollama only;
+    `backends` limits the choice further. Returns (order, decision) where
+    decision explains the order."""
+    model = model or OLLAMA_MODEL
+    scores, skipped = {}, {}
+    over_budget = caller is not None and LEDGER.caller_over(caller)
+    for name in ['cerebras', 'groq']:
+        if not PROVIDERS[name]['keys']:
+            continue
+        if backends is not None and name not in backends:
+            skipped[name] = 'not requested'
+            continue
+        if over_budget:
+            skipped[name] = f'{caller} over daily budget'
+            continue
+        if LEDGER.provider_over(name):
+            skipped[name] = 'daily budget spent'
+            continue
+        health = HEALTH[name]
+        if not health.breaker.can_attempt():
+            skipped[name] = f'breaker {health.breaker.state}'
+            continue
+        queue_seconds = min(SCHEDULERS[name].soonest(est_tokens), KEY_MAX_WAIT)
+        scores[name] = health.score(queue_seconds)
+    order = sorted(scores, key=scores.get)
+    if backends is not None and 'ollama' not in backends:
+        skipped['ollama'] = 'not requested'
+    elif not OLLAMA.available(model):
+        skipped['ollama'] = f'no live backend with {model}'
+    elif HEALTH['ollama'].breaker.can_attempt():
+        order.append('ollama')
+    else:
+        skipped['ollama'] = f"breaker {HEALTH['ollama'].breaker.state}"
+    decision = {'order': list(order), 'scores': {n: round(v, 3) for n, v in scores.items()},
+                'skipped': skipped}
+    return order, decision
+
+
+@contextmanager
+def attempting(name):
+    """Let a backend's breaker know a request is going its way (this may be
+    the half-open probe). An attempt that never reached the backend leaves
+    no verdict, so the next request gets to probe instead."""
+    health = HEALTH[name]
+    seen = health.requests
+    health.breaker.begin()
+    try:
+        yield
     finally:
-        fcntl.flock(lock_fd, fcntl.LOCK_UN)
-        lock_fd.close()
+        if health.requests == seen:
+            health.breaker.abandon()
 
 
-class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
-    daemon_threads = True
+def next_budget(deadline, names, i, skipped):
+    """Seconds to give backend names[i], or None to skip it because its
+    recent latency won't fit in what is left of the deadline."""
+    remaining = deadline.remaining()
+    expected = HEALTH[names[i]].expected()
+    if remaining < MIN_ATTEMPT_SECONDS:
+        skipped[names[i]] = 'deadline'
+        return None
+    if expected > remaining:
+        skipped[names[i]] = f'needs ~{expected:.1f}s, {remaining:.1f}s left'
+        logger.info(f"{names[i]}: skipped, needs ~{expected:.1f}s and {remaining:.1f}s are left")
+        return None
+    return deadline.share(len(names) - i, expected)
 
 
-class ProxyHandler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        if self.path != '/v1/generate':
-            self.send_error(404)
-            return
+def out_of_time(deadline, names):
+    return deadline.expired() or not any(
+        HEALTH[n].expected() <= deadline.remaining() for n in names)
+
+
+def deadline_exceeded(deadline):
+    logger.warning(f"Deadline exceeded after {deadline.elapsed():.1f}s")
+    return {'error': 'deadline exceeded', 'response': '', 'provider': None,
+            'elapsed': round(deadline.elapsed(), 2)}
+
+
+async def attempt(name, budget, system_prompt, user_prompt, caller, priority, model=None,
+                  timings=None, response_format=None, profile=None):
+    """One backend's go at a request within `budget` seconds. Returns text
+    or a false value. `model` only applies to Ollama; `timings` gets the
+    time spent queueing (queue_ms) and Ollama's own timings."""
+    with attempting(name):
+        if name == 'ollama':
+            return await try_ollama(system_prompt, user_prompt, budget, model, timings,
+                                    response_format, caller, priority, profile)
+        return await try_provider(name, PROVIDERS[name], system_prompt, user_prompt,
+                                  budget, caller, priority, response_format, profile, timings)
 
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = json.loads(self.rfile.read(content_length))
 
-        system_prompt = body.get('system', '')
-        user_prompt = body.get('prompt', '')
-        timeout = body.get('timeout', 60)
+async def attempt_stream(name, budget, system_prompt, user_prompt, caller, priority, model=None,
+                         timings=None, response_format=None, profile=None):
+    """Streaming counterpart of attempt(): yields text deltas."""
+    if name == 'ollama':
+        deltas = stream_ollama(system_prompt, user_prompt, budget, model, timings, response_format,
+                               caller, priority, profile)
+    else:
+        deltas = stream_provider(name, PROVIDERS[name], system_prompt, user_prompt,
+                                 budget, caller, priority, response_format, profile, timings)
+    with attempting(name):
+        async with aclosing(deltas):
+            async for delta in deltas:
+                yield delta
 
-        # Try cloud providers in order
-        result = None
-        for name in ['cerebras', 'groq']:
-            config = PROVIDERS[name]
-            if not config['keys']:
+
+async def first_delta(deltas):
+    """A stream's first delta, or None if it ends without one."""
+    try:
+        return await deltas.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+def hedge_partner(names, i):
+    """Where a hedge for names[i] would go: the next backend in line, if
+    both are cloud providers (Ollama runs one request at a time)."""
+    if i + 1 < len(names) and 'ollama' not in (names[i], names[i + 1]):
+        return names[i + 1]
+    return None
+
+
+async def race(primary, start_backup, delay):
+    """Await `primary`. If it is still going after `delay` seconds,
+    start_backup() may hand back a second awaitable to run alongside it;
+    the first truthy result wins and the other is cancelled.
+    Returns (result, index of the winner or None, whether a backup ran)."""
+    tasks = [asyncio.ensure_future(primary)]
+    done, pending = await asyncio.wait(tasks, timeout=delay)
+    fired = False
+    if not done:
+        backup = start_backup()
+        if backup is not None:
+            tasks.append(asyncio.ensure_future(backup))
+            pending.add(tasks[1])
+            fired = True
+    try:
+        while True:
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Hedged attempt failed: {task.exception()!r}")
+                elif task.result():
+                    return task.result(), tasks.index(task), fired
+            if not pending:
+                return None, None, fired
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:  # Let the loser hand its key back before we move on
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def wants_hedge(body, priority):
+    hedge = body.get('hedge')
+    return priority in HEDGE_CLASSES if hedge is None else bool(hedge)
+
+
+async def route(names, decision, deadline, hedge, run):
+    """Go down `names` until one answers. run(name, budget) returns an
+    awaitable whose truthy result is the answer. With `hedge`, a slow first
+    byte from a provider brings in its hedge_partner() as well.
+    Returns (result, backend that produced it)."""
+    skipped = decision['skipped']
+    fired = backup_won = False
+    hedged_health = None
+    i = 0
+    try:
+        while i < len(names):
+            name = names[i]
+            budget = next_budget(deadline, names, i, skipped)
+            if budget is None:
+                i += 1
                 continue
-            result = try_provider(name, config, system_prompt, user_prompt, timeout)
+            partner = hedge_partner(names, i) if hedge else None
+            delay = HEDGER.delay(HEALTH[name]) if partner else None
+            if delay is None:
+                result = await run(name, budget)
+                if result:
+                    return result, name
+                i += 1
+                continue
+
+            def start_backup():
+                backup_budget = next_budget(deadline, names, i + 1, skipped)
+                if backup_budget is None or not HEDGER.take():
+                    return None
+                decision['hedged'] = {'primary': name, 'backup': partner,
+                                      'after': round(delay, 3)}
+                return run(partner, backup_budget)
+
+            hedged_health = HEALTH[name]
+            result, winner, ran = await race(run(name, budget), start_backup, delay)
+            fired = fired or ran
             if result:
-                break
+                backup_won = winner == 1
+                return result, (name, partner)[winner]
+            i += 2 if ran else 1
+        return None, None
+    finally:
+        if hedge:
+            HEDGER.record(deadline.elapsed(), fired, backup_won, hedged_health)
+
+
+async def stream_generate(system_prompt, user_prompt, deadline, caller, priority, hedge=False,
+                          model=None, response_format=None, profile=None):
+    """NDJSON events for /v1/generate?stream=1: {"delta": ...} per upstream
+    chunk, then {"done": true, "response": <full text>, "provider": ...}."""
+    profile = profile or PROFILES[DEFAULT_PROFILE]
+    text = []
+    provider = None
+    timings = {}
+    names, decision = plan_route(estimate_tokens(system_prompt, user_prompt), model, caller)
+    decision.update(caller=caller, priority=priority, stream=True, profile=profile.name)
+    HEDGER.note_request()
+    streams = {}
+
+    async def open_stream(name, budget):
+        """Start a backend's stream and wait for its first delta; None if it
+        fails before one, so route() goes on to the next backend."""
+        health = HEALTH[name]
+        seen, start = health.requests, time.monotonic()
+        streams[name] = attempt_stream(name, budget, system_prompt, user_prompt, caller, priority,
+                                       model, timings, response_format, profile)
+        try:
+            return await first_delta(streams[name])
+        except Exception as e:
+            if health.requests == seen:  # The stream didn't get to record it
+                health.observe(time.monotonic() - start, False, getattr(e, 'status', None))
+            logger.warning(f"{name} stream: {e!r}")
+            return None
+
+    try:
+        first, provider = await route(names, decision, deadline, hedge, open_stream)
+        if first:
+            text.append(first)
+            yield {'delta': first}
+            deltas = streams[provider]
+            try:
+                async with aclosing(deltas):
+                    async for delta in deltas:
+                        text.append(delta)
+                        yield {'delta': delta}
+            except Exception as e:
+                logger.error(f"{provider} stream: {e!r}")
+                yield {'error': f'{provider} stream interrupted'}
+
+        if not text and out_of_time(deadline, names):
+            yield dict(deadline_exceeded(deadline), done=True)
+            return
+        final = {'done': True, 'response': ''.join(text), 'provider': provider or 'ollama'}
+        if timings:
+            final['timings'] = timings
+        yield final
+    finally:
+        for name, deltas in streams.items():
+            if name != provider:
+                await deltas.aclose()  # A hedge that also got a first delta in
+        ROUTING.record(dict(decision, served_by=provider, elapsed=round(deadline.elapsed(), 3)))
+        profile.observe(deadline.elapsed(), provider if text else None)
+        observe_request(priority, provider if text else None, deadline.elapsed())
 
-        # Fallback to Ollama
-        if not result:
-            result = try_ollama(system_prompt, user_prompt, timeout)
 
-        response = json.dumps({'response': result or '', 'provider': name if result else 'ollama'})
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(response.encode())
+def idempotent(body):
+    """Whether the caller says an identical request's answer will do."""
+    return bool(body.get('idempotent') or body.get('deterministic'))
 
-    def log_message(self, format, *args):
-        pass  # Suppress per-request logging
 
+async def generate(body, query):
+    """POST /v1/generate — {system, prompt, timeout | deadline, caller?, priority?, hedge?,
+    model? (Ollama's), response_format?, idempotent?, profile?} -> {response, provider,
+    timings? (queue_ms, Ollama's), coalesced?}, or 504 {error: "deadline exceeded"}."""
+    system_prompt = body.get('system', '')
+    user_prompt = body.get('prompt', '')
+    model = body.get('model')
+    response_format = body.get('response_format')
+    problem = check_response_format(response_format)
+    if problem:
+        return 400, {'error': problem}
+    deadline = Deadline.from_request(body)
+    caller = str(body.get('caller') or 'anonymous')
+    priority = body.get('priority') or DEFAULT_PRIORITY
+    if priority not in PRIORITY_CLASSES:
+        return 400, {'error': f"Unknown priority '{priority}'", 'priorities': list(PRIORITY_CLASSES)}
+    profile = PROFILES.get(body.get('profile') or DEFAULT_PROFILE)
+    if profile is None:
+        return 400, {'error': f"Unknown profile '{body['profile']}'", 'profiles': list(PROFILES)}
+    hedge = wants_hedge(body, priority)
+    if LEDGER.caller_over(caller) and priority != BUDGET_PRIORITY:
+        logger.info(f"{caller}: over daily budget, {priority} -> {BUDGET_PRIORITY}")
+        priority = BUDGET_PRIORITY
 
-if __name__ == '__main__':
+    if query.get('stream') in ('1', 'true') or body.get('stream') is True:
+        return 200, stream_generate(system_prompt, user_prompt, deadline, caller, priority, hedge,
+                                    model, response_format, profile)
+
+    def call():
+        return answer(system_prompt, user_prompt, deadline, caller, priority, hedge, model,
+                      response_format, profile)
+    if not idempotent(body):
+        return await call()
+    key = request_key('generate', model or OLLAMA_MODEL, system_prompt, user_prompt, response_format,
+                      profile.name)
+    try:
+        (status, payload), coalesced = await COALESCER.run(
+            'generate', key, call, lambda result: result is not None and result[0] == 200
+            and bool(result[1].get('response')), wait=deadline.remaining())
+    except asyncio.TimeoutError:
+        return 504, deadline_exceeded(deadline)
+    return status, dict(payload, coalesced=True) if coalesced else payload
+
+
+async def answer(system_prompt, user_prompt, deadline, caller, priority, hedge, model,
+                 response_format, profile, backends=None):
+    """The non-streaming /v1/generate answer: (status, payload)."""
+    # Best-scoring provider first, Ollama last, each within its share of the deadline
+    names, decision = plan_route(estimate_tokens(system_prompt, user_prompt), model, caller, backends)
+    decision.update(caller=caller, priority=priority, stream=False, profile=profile.name)
+    HEDGER.note_request()
+    result, served_by, timings = None, None, {}
+    try:
+        result, served_by = await route(
+            names, decision, deadline, hedge,
+            lambda name, budget: attempt(name, budget, system_prompt, user_prompt, caller, priority,
+                                         model, timings, response_format, profile))
+    finally:
+        ROUTING.record(dict(decision, served_by=served_by, elapsed=round(deadline.elapsed(), 3)))
+        profile.observe(deadline.elapsed(), served_by if result else None)
+        observe_request(priority, served_by if result else None, deadline.elapsed())
+
+    if result:
+        answer = {'response': result, 'provider': served_by}
+        if timings:
+            answer['timings'] = timings
+        return 200, answer
+    if not names:
+        return 503, {'error': 'no healthy backend', 'response': '', 'provider': None,
+                     'skipped': decision['skipped']}
+    if out_of_time(deadline, names):
+        return 504, deadline_exceeded(deadline)
+    return 200, {'response': '', 'provider': 'ollama'}
+
+
+async def key_stats(body, query):
+    """GET /v1/keys — queue depth and per-key utilisation (keys never shown)."""
+    return 200, {name: scheduler.stats() for name, scheduler in SCHEDULERS.items()}
+
+
+async def routing_stats(body, query):
+    """GET /v1/routing?n=50 — provider and key health, current scores and
+    the last n routing decisions."""
+    order, current = plan_route(0)
+    return 200, {
+        'backends': {name: health.stats() for name, health in HEALTH.items()},
+        'keys': {name: {k.name: k.health.stats() for k in scheduler.keys}
+                 for name, scheduler in SCHEDULERS.items()},
+        'current': current,
+        'ollama_pool': OLLAMA.stats(),
+        'ollama_residency': OLLAMA.residency_stats(),
+        'hedging': HEDGER.stats(),
+        'coalescing': COALESCER.stats(),
+        'decisions': ROUTING.recent(int(query.get('n', 50))),
+    }
+
+
+async def usage_stats(body, query):
+    """GET /v1/usage — today's tokens, requests and latency per caller and
+    per provider key, and how much of each daily budget is spent."""
+    return 200, LEDGER.snapshot()
+
+
+async def profile_stats(body, query):
+    """GET /v1/profiles — each profile's settings, latency and tokens."""
+    return 200, {name: dict(profile.settings(), **profile.stats())
+                 for name, profile in PROFILES.items()}
+
+
+async def metrics(body, query):
+    """GET /metrics — every counter, gauge and histogram, for Prometheus."""
+    return 200, METRICS.render()
+
+
+def tally(family, *by):
+    """{label value: {outcome or next label: total}} over a family's children."""
+    names = family.labelnames
+    totals = {}
+    for values, n in family.items():
+        labels = dict(zip(names, values))
+        inner = totals.setdefault(labels[by[0]], {})
+        inner[labels[by[1]]] = inner.get(labels[by[1]], 0) + n
+    return totals
+
+
+def summaries(family):
+    return {values[0]: histogram.summary() for values, histogram in sorted(family.items())}
+
+
+async def traffic_stats(body, query):
+    """GET /v1/stats — the metrics as JSON: upstream calls by outcome per
+    provider, key and caller; latency, time to first token, tokens/sec and
+    queue wait per backend (p50/p95/p99 estimated from the histogram
+    buckets); requests per priority class; and passive health, each
+    backend's verdict from its newest real calls: ok, failing, or idle
+    (nothing recent enough to judge by)."""
+    keys = {}
+    for (provider, key, _, result), n in UPSTREAM_CALLS.items():
+        outcomes = keys.setdefault(provider, {}).setdefault(key, {})
+        outcomes[result] = outcomes.get(result, 0) + n
+    tokens = tally(TOKENS, 'caller', 'kind')
+    return 200, {
+        'health': TRAFFIC.health(list(HEALTH)),
+        'providers': {
+            name: {
+                'requests': tally(UPSTREAM_CALLS, 'provider', 'outcome').get(name, {}),
+                'no_capacity': dict(NO_CAPACITY.items()).get((name, ), 0),
+                'latency': summaries(UPSTREAM_SECONDS).get(name),
+                'first_token': summaries(FIRST_TOKEN_SECONDS).get(name),
+                'tokens_per_second': summaries(TOKEN_RATE).get(name),
+                'queue_wait': summaries(QUEUE_WAIT_SECONDS).get(name),
+            } for name in HEALTH},
+        'keys': keys,
+        'callers': {caller: {'requests': outcomes,
+                             **{f'{kind}_tokens': n for kind, n in tokens.get(caller, {}).items()}}
+                    for caller, outcomes in sorted(tally(UPSTREAM_CALLS, 'caller', 'outcome').items())},
+        'requests': {priority: {'served_by': served, 'latency': summaries(REQUEST_SECONDS).get(priority)}
+                     for priority, served in tally(REQUESTS, 'priority', 'served_by').items()},
+        'queue_depth': {name: scheduler.queue_depth() for name, scheduler in SCHEDULERS.items()},
+        'ollama_outstanding': {b.url: b.outstanding for b in OLLAMA.backends},
+    }
+
+
+async def ollama_api(body, path):
+    """Ollama's own API, served by the pool: waits up to OLLAMA_QUEUE_WAIT
+    in the model's queue. Streams unless "stream": false, like Ollama.
+    Non-streaming requests with "idempotent": true share an identical
+    request's generation. A "profile" fills in the options the request
+    doesn't set itself; without one, Ollama's defaults apply as before."""
+    if not body.get('model'):
+        return 400, {'error': 'model is required'}
+    profile = PROFILES.get(body.get('profile') or DEFAULT_PROFILE)
+    if profile is None:
+        return 400, {'error': f"Unknown profile '{body['profile']}'"}
+    shared = idempotent(body)
+    if body.get('profile'):
+        body = dict(body, options=dict(profile.ollama_options(), **(body.get('options') or {})))
+    body = {k: v for k, v in body.items() if k not in ('idempotent', 'deterministic', 'profile')}
+    if body.get('stream', True):
+        return 200, stream_ollama_api(body, path, profile)
+    if not shared:
+        return await ollama_api_call(body, path, profile)
+    key = request_key(path, {k: v for k, v in body.items() if k != 'keep_alive'})
+    (status, payload), _ = await COALESCER.run(
+        path, key, lambda: ollama_api_call(body, path, profile),
+        lambda result: result is not None and result[0] == 200)
+    return status, payload
+
+
+async def ollama_api_call(body, path, profile):
+    start = time.monotonic()
+    served_by = None
+    timings = {}
+    try:
+        result, url = await OLLAMA.generate(body, OLLAMA_API_TIMEOUT, path, OLLAMA_QUEUE_WAIT,
+                                            timings=timings)
+        record_ollama(OLLAMA_API_CALLER, url, result, time.monotonic() - start, True, profile,
+                      timings=timings)
+        served_by = 'ollama'
+        return 200, result
+    except OllamaBusy as e:
+        NO_CAPACITY.inc(backend='ollama')
+        return 503, {'error': str(e)}
+    except UpstreamError as e:
+        record_ollama(OLLAMA_API_CALLER, None, None, time.monotonic() - start, False, status=e.status,
+                      timings=timings)
+        return e.status, {'error': e.body.decode('utf-8', 'replace')}
+    except asyncio.TimeoutError:
+        record_ollama(OLLAMA_API_CALLER, None, None, time.monotonic() - start, False, timed_out=True,
+                      timings=timings)
+        return 504, {'error': f'no answer within {OLLAMA_API_TIMEOUT:.0f}s'}
+    finally:
+        profile.observe(time.monotonic() - start, served_by)
+
+
+async def stream_ollama_api(body, path, profile):
+    start = time.monotonic()
+    served_by = None
+    timings = {}
+    try:
+        chunks = OLLAMA.stream(body, OLLAMA_API_TIMEOUT, path, OLLAMA_QUEUE_WAIT, timings=timings)
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.get('done'):
+                    record_ollama(OLLAMA_API_CALLER, None, chunk, time.monotonic() - start, True,
+                                  profile, timings=timings)
+                    served_by = 'ollama'
+                yield chunk
+    except OllamaBusy as e:
+        NO_CAPACITY.inc(backend='ollama')
+        yield {'error': str(e)}
+    except (UpstreamError, asyncio.TimeoutError) as e:
+        record_ollama(OLLAMA_API_CALLER, None, None, time.monotonic() - start, False,
+                      status=getattr(e, 'status', None),
+                      timed_out=isinstance(e, asyncio.TimeoutError), timings=timings)
+        yield {'error': str(e) or 'timed out'}
+    finally:
+        profile.observe(time.monotonic() - start, served_by)
+
+
+async def ollama_api_generate(body, query):
+    """POST /api/generate — as Ollama's."""
+    return await ollama_api(body, '/api/generate')
+
+
+async def ollama_api_chat(body, query):
+    """POST /api/chat — as Ollama's."""
+    return await ollama_api(body, '/api/chat')
+
+
+async def ollama_api_tags(body, query):
+    """GET /api/tags — every model installed on some pool backend."""
+    return 200, {'models': [{'name': m, 'model': m} for m in OLLAMA.models()]}
+
+
+# ============================================================================
+# BATCH JOBS
+# ============================================================================
+
+async def run_job_item(spec, item):
+    """One batch job item, routed like a /v1/generate request. Returns
+    {response, provider}; ItemBusy if no backend could take it."""
+    deadline = Deadline(float(item.get('timeout') or spec.get('timeout') or JOB_ITEM_TIMEOUT))
+    profile = PROFILES.get(item.get('profile') or spec.get('profile') or DEFAULT_PROFILE,
+                           PROFILES[DEFAULT_PROFILE])
+    caller = spec.get('caller') or 'anonymous'
+    priority = spec.get('priority') or JOB_PRIORITY
+    if LEDGER.caller_over(caller):
+        priority = BUDGET_PRIORITY
+    status, payload = await answer(
+        item.get('system', spec.get('system', '')), item['prompt'], deadline, caller, priority, False,
+        item.get('model') or spec.get('model'), item.get('response_format') or spec.get('response_format'),
+        profile, spec.get('backends'))
+    if status == 200 and payload.get('response'):
+        return {'response': payload['response'], 'provider': payload['provider']}
+    if status == 504:
+        raise RuntimeError(payload.get('error', 'deadline exceeded'))
+    raise ItemBusy()  # 503, or Ollama was busy when its turn came
+
+
+JOBS = JobStore(PROXY_JOBS_DIR, run_job_item, JOBS_PARALLEL, JOB_ATTEMPTS, JOBS_DAYS)
+JOB_SETTINGS = ('caller', 'priority', 'system', 'profile', 'model', 'response_format', 'backends',
+                'parallel', 'timeout')
+ITEM_SETTINGS = ('id', 'system', 'prompt', 'profile', 'model', 'response_format', 'timeout')
+
+
+def check_job(body):
+    """Error message if the job in `body` can't be run, else None."""
+    items = body.get('items')
+    if not isinstance(items, list) or not items:
+        return 'items must be a non-empty list'
+    if body.get('job') is not None and not JOB_ID.match(str(body['job'])):
+        return "job ids are letters, digits, '.', '_' and '-' (at most 100)"
+    if body.get('priority', JOB_PRIORITY) not in PRIORITY_CLASSES:
+        return f"Unknown priority '{body['priority']}'"
+    backends = body.get('backends')
+    if backends is not None and (not isinstance(backends, list)
+                                 or not set(backends) <= set(PROVIDERS) | {'ollama'}):
+        return f"backends must be a list drawn from {list(PROVIDERS) + ['ollama']}"
+    problem = check_settings(body)
+    if problem:
+        return problem
+    ids = set()
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('prompt'), str):
+            return 'every item needs a "prompt"'
+        problem = check_settings(item)
+        if problem:
+            return problem
+        item_id = str(item.get('id', i))
+        if item_id in ids:
+            return f"duplicate item id '{item_id}'"
+        ids.add(item_id)
+    return None
+
+
+def check_settings(settings):
+    """Error message for a job's or an item's profile / response_format."""
+    if settings.get('profile') and settings['profile'] not in PROFILES:
+        return f"Unknown profile '{settings['profile']}'"
+    return check_response_format(settings.get('response_format'))
+
+
+def find_job(key):
+    job = JOBS.jobs.get(str(key or ''))
+    return job, (None if job else (404, {'error': f"No job '{key}'"}))
+
+
+async def submit_job(body, query):
+    """POST /v1/jobs — {job?, items: [{id?, prompt, system?, profile?, model?,
+    response_format?, timeout?}], caller?, priority? (batch), system?, profile?,
+    model?, response_format?, backends? (e.g. ["ollama"]), parallel?, timeout?
+    (per item)} -> the job's summary and whether it is new. Item settings
+    override the job's. An existing job id gets that job back as it stands."""
+    problem = check_job(body)
+    if problem:
+        return 400, {'error': problem}
+    spec = {k: body[k] for k in JOB_SETTINGS if body.get(k) is not None}
+    spec.setdefault('priority', JOB_PRIORITY)
+    spec['items'] = [dict({k: item[k] for k in ITEM_SETTINGS if item.get(k) is not None},
+                          id=str(item.get('id', i)))
+                     for i, item in enumerate(body['items'])]
+    try:
+        job, created = JOBS.submit(body.get('job'), spec)
+    except OSError as e:
+        return 500, {'error': f'could not write the journal: {e}'}
+    return 200, dict(job.summary(), created=created)
+
+
+async def job_status(body, query):
+    """GET /v1/jobs?job=ID — one job's summary; without a job, all of them."""
+    if 'job' not in query:
+        return 200, {'jobs': [job.summary() for job in JOBS.jobs.values()]}
+    job, error = find_job(query['job'])
+    return error or (200, job.summary())
+
+
+async def job_results(body, query):
+    """GET /v1/jobs/results?job=ID&after=N&stream=1 — results (and items that
+    failed) in the order they landed, from the Nth on: {results, next,
+    ...summary}, or streamed as NDJSON as they land, ending with
+    {"done": true, "next": N, ...summary}."""
+    job, error = find_job(query.get('job'))
+    if error:
+        return error
+    after = max(0, int(query.get('after', 0)))
+    if query.get('stream') in ('1', 'true'):
+        return 200, JOBS.results(job, after)
+    return 200, dict(job.summary(), results=job.landed[after:], next=len(job.landed))
+
+
+async def cancel_job(body, query):
+    """POST /v1/jobs/cancel — {job}: items not yet run are dropped."""
+    job, error = find_job(body.get('job'))
+    if error:
+        return error
+    JOBS.cancel(job)
+    return 200, job.summary()
+
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+
+ROUTES = {
+    ('POST', '/v1/generate'): generate,
+    ('GET', '/v1/keys'): key_stats,
+    ('GET', '/v1/routing'): routing_stats,
+    ('GET', '/v1/usage'): usage_stats,
+    ('GET', '/v1/profiles'): profile_stats,
+    ('GET', '/v1/stats'): traffic_stats,
+    ('GET', '/metrics'): metrics,
+    ('POST', '/v1/jobs'): submit_job,
+    ('GET', '/v1/jobs'): job_status,
+    ('GET', '/v1/jobs/results'): job_results,
+    ('POST', '/v1/jobs/cancel'): cancel_job,
+    ('POST', '/api/generate'): ollama_api_generate,
+    ('POST', '/api/chat'): ollama_api_chat,
+    ('GET', '/api/tags'): ollama_api_tags,
+}
+
+
+async def dispatch(request):
+    handler = ROUTES.get((request.method, request.path))
+    if handler is None:
+        return 404, {'error': 'Not found'}
+    try:
+        body = request.json()
+    except ValueError:
+        return 400, {'error': 'Invalid JSON'}
+    try:
+        return await handler(body, request.query)
+    except Exception as e:
+        logger.error(f"{request.path}: {e!r}")
+        return 500, {'error': str(e)}
+
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            request = await read_request(reader)
+            if request is None:
+                break
+            status, payload = await dispatch(request)
+            if inspect.isasyncgen(payload):
+                await send_stream(writer, status, payload, request.keep_alive)
+            elif isinstance(payload, str):
+                await send_text(writer, status, payload, request.keep_alive)
+            else:
+                await send_json(writer, status, payload, request.keep_alive)
+            if not request.keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
     logger.info(f"Inference Proxy starting on port {LISTEN_PORT}")
     logger.info(f"Cerebras keys: {len(PROVIDERS['cerebras']['keys'])}")
     logger.info(f"Groq keys: {len(PROVIDERS['groq']['keys'])}")
-    logger.info(f"Ollama: {OLLAMA_URL}")
+    logger.info(f"Ollama: {', '.join(OLLAMA_URLS)} (x{OLLAMA_CONCURRENCY} each)")
+    if OLLAMA_QUEUE_URL:
+        logger.info(f"Ollama queue: {OLLAMA_QUEUE_URL}")
+    logger.info(f"Accounting: {PROXY_ACCOUNTING_DIR}, budgets {CALLER_BUDGETS or 'none'} "
+                f"(callers), {PROVIDER_BUDGETS or 'none'} (providers)")
+    models_task = asyncio.create_task(OLLAMA.watch_models())  # Keep a reference
+    ledger_task = asyncio.create_task(LEDGER.persist())
+    JOBS.load()
+    logger.info(f"Jobs: {PROXY_JOBS_DIR}, {JOBS_PARALLEL} items at once, "
+                f"{JOBS.stats()['running']} resumed")
+
+    server = await asyncio.start_server(handle_connection, '0.0.0.0', LISTEN_PORT,
+                                        limit=4 * 1024 * 1024)
+    async with server:
+        await server.serve_forever()
 
-    server = ThreadingHTTPServer(('0.0.0.0', LISTEN_PORT), ProxyHandler)
-    server.serve_forever()
+
+if __name__ == '__main__':
+    asyncio.run(main())
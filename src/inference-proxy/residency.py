@@ -0,0 +1,152 @@
+"""
+Model residency for the Ollama pool.
+
+A CPU Ollama host keeps one model (or a few) in RAM; asking it for another
+means tens of seconds of loading, usually evicting the first. Tanks, the
+model-comparison sweeps, multi_model_baseline.py and the translator all ask
+for different models, so serving them in arrival order thrashes.
+
+Requests that cannot start at once wait in one FIFO per model. When a slot
+frees on a backend, it takes the oldest waiter for a model it already has
+loaded. It only switches to a model that needs loading when nothing
+resident is wanted there, or when that model's oldest request has waited
+longer than SwapPolicy.factor times what the swap costs: its expected load
+time, paid by every request queued for the resident model that would then
+wait behind it. So swaps come in batches, and no model waits forever.
+
+Swaps and load time are counted from Ollama's own `load_duration`, and
+the expected load time per model is learned from it.
+"""
+import time
+from collections import deque
+
+# A load_duration above this means the weights were read in, not just found
+LOAD_THRESHOLD_SECONDS = 0.5
+LOAD_ALPHA = 0.3
+
+
+class Waiter:
+    """A request queued for an Ollama slot; `future` gets the backend."""
+
+    def __init__(self, model, future):
+        self.model = model
+        self.since = time.monotonic()
+        self.future = future
+
+
+class ModelQueues:
+    """FIFO per model of requests waiting for an Ollama slot."""
+
+    def __init__(self):
+        self.queues = {}
+
+    def __bool__(self):
+        return bool(self.queues)
+
+    def push(self, waiter):
+        self.queues.setdefault(waiter.model, deque()).append(waiter)
+
+    def remove(self, waiter):
+        queue = self.queues.get(waiter.model)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.model]
+
+    def pop(self, model):
+        """Oldest waiter for `model` still waiting, or None."""
+        queue = self.queues.get(model)
+        waiter = None
+        while queue and waiter is None:
+            candidate = queue.popleft()
+            if not candidate.future.done():
+                waiter = candidate
+        if queue is not None and not queue:
+            del self.queues[model]
+        return waiter
+
+    def models(self):
+        return list(self.queues)
+
+    def oldest(self, model):
+        return self.queues[model][0].since
+
+    def waited(self, model, now):
+        """Seconds waited so far by everyone queued for `model`."""
+        return sum(now - w.since for w in self.queues[model])
+
+    def depth(self):
+        return {model: len(queue) for model, queue in self.queues.items()}
+
+
+class Residency:
+    """What one backend has loaded (per GET /api/ps and what we sent it
+    since), and what loading has cost there."""
+
+    def __init__(self):
+        self.resident = set()
+        self.swaps = 0
+        self.load_seconds = 0.0
+        self.checked_at = None
+
+    def refresh(self, models):
+        self.resident = set(models)
+        self.checked_at = time.time()
+
+    def switch_to(self, model):
+        """We are sending `model` where it isn't loaded: assume it replaces
+        what was there until /api/ps says otherwise."""
+        self.resident = {model}
+
+    def observe(self, load_seconds):
+        """Note a response's load_duration. Returns True if it was a load."""
+        if load_seconds < LOAD_THRESHOLD_SECONDS:
+            return False
+        self.swaps += 1
+        self.load_seconds += load_seconds
+        return True
+
+    def stats(self):
+        return {'resident': sorted(self.resident), 'swaps': self.swaps,
+                'load_seconds': round(self.load_seconds, 1)}
+
+
+class SwapPolicy:
+    """Which queued model a free backend serves next."""
+
+    def __init__(self, factor=2.0, load_prior=30.0):
+        self.factor = factor
+        self.load_prior = load_prior
+        self.load_cost = {}
+        self.counters = {'warm': 0, 'idle_switches': 0, 'justified_switches': 0}
+
+    def observe_load(self, model, seconds):
+        cost = self.load_cost.get(model)
+        self.load_cost[model] = seconds if cost is None else cost + LOAD_ALPHA * (seconds - cost)
+
+    def expected_load(self, model):
+        return self.load_cost.get(model, self.load_prior)
+
+    def choose(self, backend, queues, now):
+        """A model from `queues` for `backend`, or None to leave the slot free."""
+        models = [m for m in queues.models() if backend.has_model(m)]
+        resident = backend.residency.resident
+        warm = [m for m in models if m in resident]
+        cold = [m for m in models if m not in resident]
+        if warm:
+            behind = sum(len(queues.queues[m]) for m in warm)
+            justified = [m for m in cold if now - queues.oldest(m)
+                         >= self.factor * self.expected_load(m) * (1 + behind)]
+            if justified:
+                self.counters['justified_switches'] += 1
+                return min(justified, key=queues.oldest)
+            self.counters['warm'] += 1
+            return min(warm, key=queues.oldest)
+        if cold:
+            self.counters['idle_switches'] += 1
+            return max(cold, key=lambda m: queues.waited(m, now))
+        return None
+
+    def stats(self):
+        return dict(self.counters, factor=self.factor,
+                    expected_load_seconds={m: round(s, 1) for m, s in self.load_cost.items()})
@@ -0,0 +1,318 @@
+"""
+Request deadlines, backend health and routing for the inference proxy.
+
+A request carries one absolute deadline. Every fallback attempt (provider
+keys, then Ollama) gets a slice of whatever is left, instead of each hop
+starting over with the caller's full timeout, and a backend whose recent
+latency cannot fit in the time left is skipped rather than tried.
+
+Every provider and every key keeps EWMA latency, error rate and 429 rate
+plus a circuit breaker (BackendHealth). Providers are tried best score
+first, and a failing key or provider is taken out of rotation until a
+half-open probe shows it has recovered.
+
+Hedging (HedgePolicy): for callers that opt in, if the first backend has
+not produced its first byte by the later of its learned p(100 - 100 *
+budget) and a multiple of its p90, the same request goes to the next
+backend as well and the first answer wins. Extra upstream calls are
+capped at `budget`, a fraction of all requests.
+"""
+import math
+import time
+from collections import deque
+
+# Below this there is no point starting another upstream call
+MIN_ATTEMPT_SECONDS = 1.0
+LATENCY_ALPHA = 0.2
+RATE_ALPHA = 0.1
+# Error and 429 rates fade while a backend gets no traffic, so one that
+# was demoted gets tried again eventually instead of staying last forever
+RATE_HALF_LIFE = 120.0
+MIN_SUCCESS_RATE = 0.05
+DECISION_LOG_SIZE = 200
+# Recent first-byte times kept per backend for percentiles
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted sequence; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Deadline:
+    """An absolute deadline on the monotonic clock."""
+
+    def __init__(self, seconds):
+        self.started = time.monotonic()
+        self.at = self.started + max(0.0, seconds)
+
+    @classmethod
+    def from_request(cls, body):
+        """`deadline` (unix epoch seconds, set by the caller) wins over
+        `timeout` (seconds from now)."""
+        if body.get('deadline') is not None:
+            return cls(float(body['deadline']) - time.time())
+        return cls(float(body.get('timeout', 60)))
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.remaining() < MIN_ATTEMPT_SECONDS
+
+    def share(self, attempts_left, expected=0.0):
+        """Budget for the next attempt: an even split of the time left over
+        the attempts still to come, but no less than this attempt is
+        expected to take."""
+        remaining = self.remaining()
+        return min(remaining, max(remaining / max(attempts_left, 1), expected,
+                                  MIN_ATTEMPT_SECONDS))
+
+
+class CircuitBreaker:
+    """
+    CLOSED (ok) -> OPEN after `failure_threshold` consecutive failures ->
+    HALF_OPEN once `cooldown_seconds` have passed, where exactly one probe
+    request is let through: success closes the breaker, failure reopens it.
+
+    Same states and methods as core/ollama_watcher.CircuitBreaker (the proxy
+    image only ships this directory), plus the single-probe rule and
+    retry_in() so the key scheduler can wake up when a breaker half-opens.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, cooldown_seconds=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    def record_success(self):
+        self.failure_count = 0
+        self.probing = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failure_count += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failure_count >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+    def retry_in(self, now=None):
+        """Seconds until a request may go through: 0 now, inf while a
+        half-open probe is still out."""
+        if self.state == self.OPEN:
+            left = self.opened_at + self.cooldown_seconds - (now or time.monotonic())
+            if left > 0:
+                return left
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and self.probing:
+            return math.inf
+        return 0.0
+
+    def can_attempt(self):
+        return self.retry_in() == 0.0
+
+    def begin(self):
+        """Note that a request is going through (the probe, if half-open)."""
+        if self.state == self.HALF_OPEN:
+            self.probing = True
+
+    def abandon(self):
+        """A request let through ended without a verdict (cancelled, or no
+        key to be had); let the next one probe instead."""
+        self.probing = False
+
+    def to_dict(self):
+        return {'state': self.state, 'failure_count': self.failure_count,
+                'trips': self.trips,
+                'retry_in': round(min(self.retry_in(), 3600.0), 1)}
+
+
+class BackendHealth:
+    """EWMA latency (and deviation) of successful calls, plus EWMA error and
+    429 rates and a circuit breaker, for one provider, key or Ollama."""
+
+    def __init__(self, name, failure_threshold=5, cooldown_seconds=60,
+                 prior_seconds=0.0):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, cooldown_seconds)
+        self.prior_seconds = prior_seconds
+        self.mean = None
+        self.dev = 0.0
+        self.error_rate = 0.0
+        self.rate_limited = 0.0
+        self.requests = 0
+        self.updated = time.monotonic()
+        self.first_byte = deque(maxlen=LATENCY_WINDOW)
+
+    def _fade(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self.updated) / RATE_HALF_LIFE)
+        self.error_rate *= factor
+        self.rate_limited *= factor
+        self.updated = now
+
+    def observe(self, seconds, ok, status=None, timed_out=False):
+        """Record one finished call. A 429 counts against the 429 rate and
+        not the breaker: the key scheduler already backs off on it."""
+        self._fade()
+        self.requests += 1
+        self.error_rate += RATE_ALPHA * ((0.0 if ok or status == 429 else 1.0) - self.error_rate)
+        self.rate_limited += RATE_ALPHA * ((1.0 if status == 429 else 0.0) - self.rate_limited)
+        if ok or timed_out:  # A timeout is a lower bound on latency
+            if self.mean is None:
+                self.mean, self.dev = seconds, seconds / 2
+            else:
+                err = seconds - self.mean
+                self.mean += LATENCY_ALPHA * err
+                self.dev += LATENCY_ALPHA * (abs(err) - self.dev)
+        if ok:
+            self.breaker.record_success()
+        elif status != 429:
+            self.breaker.record_failure()
+
+    def observe_first_byte(self, seconds):
+        """Time until the first byte of answer: the whole reply for a plain
+        call, the first delta for a stream."""
+        self.first_byte.append(seconds)
+
+    def first_byte_percentile(self, pct, min_samples=HEDGE_MIN_SAMPLES):
+        if len(self.first_byte) < min_samples:
+            return None
+        return percentile(self.first_byte, pct)
+
+    def expected(self):
+        """Typical-to-slow latency (mean + one deviation); 0 if never seen."""
+        if self.mean is None:
+            return 0.0
+        return self.mean + self.dev
+
+    def score(self, queue_seconds=0.0):
+        """Expected seconds to a successful answer: (wait for a key + call
+        latency) divided by the chance the call succeeds. Lower is better."""
+        self._fade()
+        latency = self.expected() if self.mean is not None else self.prior_seconds
+        success = max(MIN_SUCCESS_RATE, 1.0 - self.error_rate - self.rate_limited)
+        return (queue_seconds + latency) / success
+
+    def stats(self):
+        self._fade()
+        p90 = self.first_byte_percentile(90)
+        return {
+            'ewma_seconds': round(self.mean, 3) if self.mean is not None else None,
+            'expected_seconds': round(self.expected(), 3),
+            'error_rate': round(self.error_rate, 3),
+            'rate_limited_rate': round(self.rate_limited, 3),
+            'requests': self.requests,
+            'first_byte_p90': round(p90, 3) if p90 is not None else None,
+            'breaker': self.breaker.to_dict(),
+        }
+
+
+class RoutingLog:
+    """The last few routing decisions, for GET /v1/routing."""
+
+    def __init__(self, size=DECISION_LOG_SIZE):
+        self.decisions = deque(maxlen=size)
+
+    def record(self, decision):
+        decision['at'] = round(time.time(), 3)
+        self.decisions.append(decision)
+
+    def recent(self, n=None):
+        items = list(self.decisions)
+        return items[-n:] if n else items
+
+
+class HedgePolicy:
+    """When to send a backup request, and how many we can afford.
+
+    Every routed request earns `budget` credit (capped at `burst`), and a
+    hedge spends 1, so hedges stay under `budget` extra upstream calls per
+    request over time. The hedge delay is the later of the primary
+    backend's learned first-byte p(100 - 100*budget), which only about
+    `budget` of requests exceed, and `multiple` times its p`pct`, which
+    ordinary jitter doesn't reach: the credit is kept for the real tail
+    instead of being spent on requests just past p90. With too few samples
+    we don't hedge.
+
+    p99 saved: when the backup wins, the primary's own latency is unknown
+    (it is cancelled), so it is estimated as the median of its recent
+    first-byte times beyond the moment it lost. The estimate is labelled as
+    such in stats(); bench.py --hedge measures the real thing.
+    """
+
+    def __init__(self, budget=0.05, pct=90, burst=5.0, multiple=1.5):
+        self.budget = budget
+        self.pct = pct
+        self.multiple = multiple
+        self.burst = burst
+        self.credit = burst
+        self.counters = {'requests': 0, 'eligible': 0, 'fired': 0, 'backup_won': 0,
+                         'primary_won': 0, 'no_credit': 0}
+        self.observed = deque(maxlen=LATENCY_WINDOW * 5)
+        self.unhedged = deque(maxlen=LATENCY_WINDOW * 5)
+
+    def note_request(self):
+        self.counters['requests'] += 1
+        self.credit = min(self.burst, self.credit + self.budget)
+
+    def delay(self, health):
+        """Seconds to wait on `health`'s backend before hedging, or None."""
+        tail = health.first_byte_percentile(100 - 100 * self.budget)
+        typical = health.first_byte_percentile(self.pct)
+        if tail is None or typical is None:
+            return None
+        return max(tail, self.multiple * typical)
+
+    def take(self):
+        if self.credit < 1.0:
+            self.counters['no_credit'] += 1
+            return False
+        self.credit -= 1.0
+        self.counters['fired'] += 1
+        return True
+
+    def record(self, elapsed, fired, backup_won, primary_health=None):
+        """One eligible request finished after `elapsed` seconds."""
+        self.counters['eligible'] += 1
+        if fired:
+            self.counters['backup_won' if backup_won else 'primary_won'] += 1
+        self.observed.append(elapsed)
+        unhedged = elapsed
+        if backup_won and primary_health is not None:
+            slower = [t for t in primary_health.first_byte if t > elapsed]
+            unhedged = percentile(slower, 50) or elapsed
+        self.unhedged.append(unhedged)
+
+    def stats(self):
+        p99 = percentile(self.observed, 99)
+        p99_unhedged = percentile(self.unhedged, 99)
+        requests = max(self.counters['requests'], 1)
+        return dict(self.counters,
+                    budget=self.budget,
+                    percentile=self.pct,
+                    multiple=self.multiple,
+                    extra_call_ratio=round(self.counters['fired'] / requests, 4),
+                    credit=round(self.credit, 2),
+                    p50=round(percentile(self.observed, 50) or 0.0, 3),
+                    p99=round(p99 or 0.0, 3),
+                    p99_unhedged_estimate=round(p99_unhedged or 0.0, 3),
+                    p99_saved_estimate=round((p99_unhedged or 0.0) - (p99 or 0.0), 3))
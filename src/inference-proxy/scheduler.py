@@ -0,0 +1,350 @@
+"""
+In-process API key scheduler for the inference proxy.
+
+Each key is a pair of token buckets (requests per minute, tokens per minute)
+plus a concurrency cap. Whenever a key frees up or a bucket refills, the
+head of the queue gets whichever key can serve it soonest. Nobody sleeps
+while holding a key, and no disk I/O per request.
+
+The queue is a FairQueue: strict classes (visitors by default) always go
+first, the remaining classes share by weight, and inside a class callers
+(tanks) share by weight, so one chatty tank cannot starve the others.
+
+Each key also has a BackendHealth (routing.py): a key whose breaker is
+open is not handed out until its cooldown ends, and then only to one
+probe request at a time.
+
+Replaces the old LOCK_DIR/.{name}_{idx}_lock flock + _ts timestamp files.
+"""
+import math
+import time
+import asyncio
+from collections import deque
+
+from routing import BackendHealth
+
+UTILISATION_WINDOW = 60.0
+
+# Highest priority first
+PRIORITY_CLASSES = ('visitor', 'congregation', 'exploration', 'baseline', 'batch')
+DEFAULT_PRIORITY = 'exploration'
+DEFAULT_CLASS_WEIGHTS = {'visitor': 16, 'congregation': 8, 'exploration': 4,
+                         'baseline': 2, 'batch': 1}
+
+
+class _FairShare:
+    """Start-time fair queuing among flows: serve the active flow with the
+    smallest virtual finish time, then advance it by cost / weight. A flow
+    that goes idle re-enters at the current virtual time, so it cannot bank
+    credit while away."""
+
+    def __init__(self):
+        self.vtime = 0.0
+        self.finish = {}
+
+    def activate(self, flow):
+        self.finish[flow] = max(self.finish.get(flow, 0.0), self.vtime)
+
+    def pick(self, flows):
+        return min(flows, key=lambda f: self.finish.get(f, self.vtime))
+
+    def charge(self, flow, cost, weight):
+        start = self.finish.get(flow, self.vtime)
+        self.vtime = start
+        self.finish[flow] = start + cost / max(weight, 1e-9)
+
+
+class FairQueue:
+    """Two-level queue: priority class, then caller, FIFO per caller.
+
+    Entries are waiter tuples whose first item is a future; entries whose
+    future is already done are dropped lazily."""
+
+    def __init__(self, class_weights=None, strict_classes=('visitor',), caller_weights=None):
+        self.class_weights = dict(DEFAULT_CLASS_WEIGHTS, **(class_weights or {}))
+        self.strict_classes = [c for c in PRIORITY_CLASSES if c in strict_classes]
+        self.caller_weights = caller_weights or {}
+        self._queues = {cls: {} for cls in PRIORITY_CLASSES}
+        self._class_share = _FairShare()
+        self._caller_share = {cls: _FairShare() for cls in PRIORITY_CLASSES}
+
+    def _prune(self, cls):
+        callers = self._queues[cls]
+        for caller in list(callers):
+            q = callers[caller]
+            while q and q[0][0].done():
+                q.popleft()
+            if not q:
+                del callers[caller]
+        return callers
+
+    def push(self, entry, caller, priority):
+        callers = self._prune(priority)
+        if not callers:
+            self._class_share.activate(priority)
+        if caller not in callers:
+            callers[caller] = deque()
+            self._caller_share[priority].activate(caller)
+        callers[caller].append(entry)
+
+    def peek(self):
+        """(priority, caller, entry) that should be served next, or None."""
+        active = [cls for cls in PRIORITY_CLASSES if self._prune(cls)]
+        if not active:
+            return None
+        strict = [cls for cls in self.strict_classes if cls in active]
+        cls = strict[0] if strict else self._class_share.pick(active)
+        caller = self._caller_share[cls].pick(list(self._queues[cls]))
+        return cls, caller, self._queues[cls][caller][0]
+
+    def pop(self, cls, caller, cost=1):
+        entry = self._queues[cls][caller].popleft()
+        if not self._queues[cls][caller]:
+            del self._queues[cls][caller]
+        self._caller_share[cls].charge(caller, cost, self.caller_weights.get(caller, 1))
+        if cls not in self.strict_classes:
+            self._class_share.charge(cls, cost, self.class_weights.get(cls, 1))
+        return entry
+
+    def depth(self):
+        by_class = {}
+        for cls in PRIORITY_CLASSES:
+            n = {caller: sum(1 for e in q if not e[0].done())
+                 for caller, q in self._queues[cls].items()}
+            n = {caller: c for caller, c in n.items() if c}
+            if n:
+                by_class[cls] = n
+        return by_class
+
+    def __len__(self):
+        return sum(sum(d.values()) for d in self.depth().values())
+
+
+class TokenBucket:
+    """Continuous-refill bucket holding at most `capacity`, refilled at
+    `capacity` per `period` seconds. May go negative when a request turns
+    out to have cost more than estimated."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) after the real cost is known."""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def drain(self, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeyState:
+    def __init__(self, provider, idx, key, rpm, tpm, concurrency,
+                 failure_threshold=3, cooldown_seconds=30):
+        self.name = f'{provider}[{idx}]'
+        self.idx = idx
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = concurrency
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+        self._busy_since = None
+        self.recent = deque()  # (granted_at, tokens) inside UTILISATION_WINDOW
+        self.counters = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'tokens': 0}
+        self.health = BackendHealth(self.name, failure_threshold, cooldown_seconds)
+
+    def ready_in(self, est_tokens, now):
+        """Seconds until this key can take a request; inf while at its
+        concurrency cap or while its half-open probe is out."""
+        if self.in_flight >= self.concurrency:
+            return math.inf
+        wait = max(self.request_bucket.wait_time(1, now), self.health.breaker.retry_in(now))
+        if self.token_bucket:
+            wait = max(wait, self.token_bucket.wait_time(est_tokens, now))
+        return wait
+
+    def _trim(self, now):
+        while self.recent and now - self.recent[0][0] > UTILISATION_WINDOW:
+            self.recent.popleft()
+
+    def utilisation(self, now):
+        self._trim(now)
+        busy = self.busy_seconds
+        if self._busy_since is not None:
+            busy += now - self._busy_since
+        return {
+            'rpm': round(len(self.recent) / self.rpm, 3) if self.rpm else 0.0,
+            'tpm': round(sum(t for _, t in self.recent) / self.tpm, 3) if self.tpm else 0.0,
+            'concurrency': round(self.in_flight / self.concurrency, 3),
+            'busy_seconds': round(busy, 1),
+        }
+
+
+class KeyScheduler:
+    """Hands out a provider's keys to queued callers, soonest-free first."""
+
+    def __init__(self, provider, keys, rpm, tpm=0, concurrency=1, queue=None,
+                 failure_threshold=3, cooldown_seconds=30):
+        self.provider = provider
+        self.keys = [KeyState(provider, i, k, rpm, tpm, concurrency, failure_threshold, cooldown_seconds)
+                     for i, k in enumerate(keys)]
+        self._waiters = queue if queue is not None else FairQueue()  # (future, est_tokens, exclude, enqueued_at)
+        self._timer = None
+        self.started = time.monotonic()
+        self.waits = {'granted': 0, 'gave_up': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+
+    def _best(self, est_tokens, exclude, now):
+        """(key, seconds_until_ready) for the soonest-available key, or (None, inf)."""
+        best, best_wait = None, math.inf
+        for key in self.keys:
+            if key.idx in exclude:
+                continue
+            wait = key.ready_in(est_tokens, now)
+            if best is None or wait < best_wait or (
+                    wait == best_wait and (key.health.score(), -key.request_bucket.tokens)
+                    < (best.health.score(), -best.request_bucket.tokens)):
+                best, best_wait = key, wait
+        return best, best_wait
+
+    def soonest(self, est_tokens=0):
+        """Seconds until some key could take a request (inf if none can
+        without another finishing first)."""
+        return self._best(est_tokens, (), time.monotonic())[1]
+
+    def _grant(self, key, est_tokens, now, enqueued_at):
+        key.health.breaker.begin()
+        key.request_bucket.take(1, now)
+        if key.token_bucket:
+            key.token_bucket.take(est_tokens, now)
+        if key.in_flight == 0:
+            key._busy_since = now
+        key.in_flight += 1
+        key.counters['requests'] += 1
+        key.recent.append([now, est_tokens])
+        waited = now - enqueued_at
+        self.waits['granted'] += 1
+        self.waits['total_seconds'] += waited
+        self.waits['max_seconds'] = max(self.waits['max_seconds'], waited)
+
+    def _dispatch(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while True:
+            head = self._waiters.peek()
+            if head is None:
+                return
+            cls, caller, (fut, est_tokens, exclude, enqueued_at) = head
+            key, wait = self._best(est_tokens, exclude, now)
+            if key is None:
+                self._waiters.pop(cls, caller, 0)
+                fut.set_result(None)
+                continue
+            if wait > 0:
+                if wait != math.inf:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return  # Later callers wait behind the head, no overtaking
+            self._waiters.pop(cls, caller, max(est_tokens, 1))
+            self._grant(key, est_tokens, now, enqueued_at)
+            fut.set_result(key)
+
+    async def acquire(self, est_tokens=0, max_wait=10.0, exclude=(), caller='anonymous',
+                      priority=DEFAULT_PRIORITY):
+        """Queue for a key as `caller` in `priority` class. Returns a
+        KeyState, or None if no key could be had within max_wait."""
+        now = time.monotonic()
+        if self._waiters.peek() is None:
+            key, wait = self._best(est_tokens, exclude, now)
+            if key is None:
+                return None
+            if wait == 0:
+                self._grant(key, est_tokens, now, now)
+                return key
+            if wait != math.inf and wait > max_wait:
+                self.waits['gave_up'] += 1
+                return None
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.push((fut, est_tokens, frozenset(exclude), now), caller, priority)
+        self._dispatch()
+        try:
+            await asyncio.wait({fut}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.result() is not None:
+                self.release(fut.result(), est_tokens)
+            fut.cancel()
+            raise
+        if not fut.done():
+            fut.cancel()
+            self.waits['gave_up'] += 1
+            self._dispatch()  # Whoever queued behind us may be servable now
+            return None
+        return fut.result()
+
+    def release(self, key, est_tokens, used_tokens=0, ok=True, status=None,
+                latency=None, timed_out=False):
+        """Return a key. `used_tokens` (from the provider's usage block)
+        corrects the estimate charged at grant time; `latency` (seconds,
+        None if the call never got an answer either way) feeds key health."""
+        now = time.monotonic()
+        if latency is None:
+            key.health.breaker.abandon()
+        else:
+            key.health.observe(latency, ok, status, timed_out)
+        key.in_flight -= 1
+        if key.in_flight == 0 and key._busy_since is not None:
+            key.busy_seconds += now - key._busy_since
+            key._busy_since = None
+        if used_tokens:
+            key.counters['tokens'] += used_tokens
+            if key.token_bucket:
+                key.token_bucket.adjust(used_tokens - est_tokens)
+            for entry in reversed(key.recent):
+                if entry[1] == est_tokens:
+                    entry[1] = used_tokens
+                    break
+        if not ok:
+            key.counters['errors'] += 1
+        if status == 429:
+            # Provider says we're over; stop handing this key out until it refills
+            key.counters['rate_limited'] += 1
+            key.request_bucket.drain(now)
+        self._dispatch()
+
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'queue_depth': self.queue_depth(),
+            'queued': self._waiters.depth(),
+            'waits': dict(self.waits, total_seconds=round(self.waits['total_seconds'], 2),
+                          max_seconds=round(self.waits['max_seconds'], 2)),
+            'keys': [dict(key=k.name, in_flight=k.in_flight,
+                          ready_in=round(min(k.ready_in(0, now), 3600.0), 2),
+                          utilisation=k.utilisation(now), health=k.health.stats(), **k.counters)
+                     for k in self.keys],
+        }
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Deterministic local stand-in for Ollama and OpenAI-style chat APIs.
+
+Speaks enough of both for the proxy, the tanks and the congregation runner
+to run against it instead of Cerebras, Groq or a real Ollama:
+
+    POST /api/generate, /api/chat       Ollama, NDJSON when streaming
+    GET  /api/tags, /api/ps             Ollama
+    POST /v1/chat/completions           OpenAI-style, SSE when streaming
+         (also under /openai/..., Groq's path)
+    GET  /stub/stats                    what the stub has served and injected
+
+Output is canned and deterministic: the text is drawn from a fixed word
+list seeded by the model and prompt, so the same request always gets the
+same answer (one word = one token), at most max_tokens / num_predict
+long. Requests with a response_format / format get a JSON object with
+every property of the schema filled in.
+
+Timing: time to first token is drawn from --ttft (fixed:MS,
+uniform:LO:HI, normal:MEAN:SD, lognormal:MEDIAN:SIGMA or exp:MEAN, in
+ms; --tail-prob of draws take --tail-ms instead), then tokens arrive at
+--tokens-per-sec. --ollama-parallel caps how many Ollama requests run at
+once, as one GPU would; the rest queue. --error-rate answers 500 and
+--ratelimit-rate 429 (with Retry-After) to that fraction of requests.
+--seed makes the latency and fault draws repeatable.
+
+Usage:
+    python3 stub_llm.py --port 11434
+    python3 stub_llm.py --port 8200 --ttft lognormal:400:0.5 --tokens-per-sec 40 \\
+        --error-rate 0.01 --ratelimit-rate 0.05 --ollama-parallel 1
+Then point OLLAMA_URL, CEREBRAS_URL and GROQ_URL at it.
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ('the a of and light river memory curious small old deep quiet wonder '
+         'because stone water idea history strange maybe always pattern city '
+         'music number animal forest question between reason map star language '
+         'slowly bright echo thread fire winter story edge hidden garden '
+         'machine ocean mirror path root signal').split()
+DEFAULT_MODELS = ('llama3.2:latest',)
+
+
+class Latency:
+    """Seconds to first token, drawn from a distribution spec."""
+
+    def __init__(self, spec='fixed:50', tail_prob=0.0, tail_ms=0.0):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        values = [float(p) for p in params.split(':') if p]
+        # Milliseconds to seconds, except lognormal's sigma
+        self.params = [v if kind == 'lognormal' and i == 1 else v / 1000 for i, v in enumerate(values)]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal', 'exp'):
+            raise ValueError(f"unknown latency distribution '{kind}'")
+        self.tail_prob = tail_prob
+        self.tail = tail_ms / 1000
+
+    def draw(self, rng):
+        if self.tail_prob and rng.random() < self.tail_prob:
+            return self.tail
+        p = self.params
+        if self.kind == 'fixed':
+            return p[0]
+        if self.kind == 'uniform':
+            return rng.uniform(p[0], p[1])
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(p[0], p[1]))
+        if self.kind == 'lognormal':
+            return p[0] * math.exp(rng.gauss(0, p[1]))
+        return rng.expovariate(1 / p[0])
+
+
+def canned_words(key, n):
+    """n words, always the same for the same key."""
+    rng = random.Random(hashlib.sha256(key.encode()).digest())
+    return [rng.choice(WORDS) for _ in range(n)]
+
+
+def canned_json(key, schema, n):
+    """A JSON answer for `schema` (every property filled in), or
+    {"response": ...} for plain JSON mode."""
+    properties = (schema or {}).get('properties') if isinstance(schema, dict) else None
+    if not properties:
+        return json.dumps({'response': ' '.join(canned_words(key, n))})
+    answer = {}
+    share = max(1, n // len(properties))
+    for name, spec in properties.items():
+        if spec.get('enum'):
+            answer[name] = spec['enum'][int(hashlib.sha256(f'{key}/{name}'.encode()).hexdigest(), 16)
+                                        % len(spec['enum'])]
+        else:
+            answer[name] = ' '.join(canned_words(f'{key}/{name}', share))
+    return json.dumps(answer)
+
+
+class StubConfig:
+    def __init__(self, ttft, tokens_per_sec=50.0, completion_tokens=60, error_rate=0.0,
+                 ratelimit_rate=0.0, retry_after=1, ollama_parallel=0, models=DEFAULT_MODELS, seed=None):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.ratelimit_rate = ratelimit_rate
+        self.retry_after = retry_after
+        self.ollama_slots = threading.BoundedSemaphore(ollama_parallel) if ollama_parallel else None
+        self.models = list(models)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors_injected': 0, 'ratelimited': 0, 'streams': 0,
+                         'completion_tokens': 0, 'by_path': {}}
+
+    def draw(self):
+        """(fault or None, seconds to first token) for one request."""
+        with self.lock:
+            roll = self.rng.random()
+            fault = (500 if roll < self.error_rate else
+                     429 if roll < self.error_rate + self.ratelimit_rate else None)
+            return fault, self.ttft.draw(self.rng)
+
+    def count(self, path, **deltas):
+        with self.lock:
+            self.counters['requests'] += 1
+            self.counters['by_path'][path] = self.counters['by_path'].get(path, 0) + 1
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, by_path=dict(self.counters['by_path']))
+
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+        disable_nagle_algorithm = True
+
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _start_chunked(self, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+        def _chunk(self, data):
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self._send(200, {'models': [{'name': m, 'model': m} for m in config.models]})
+            elif self.path == '/api/ps':
+                self._send(200, {'models': [{'name': m, 'model': m} for m in config.models[:1]]})
+            elif self.path == '/stub/stats':
+                self._send(200, config.stats())
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                return self._send(400, {'error': 'invalid JSON'})
+            path = self.path.removeprefix('/openai')
+            if path in ('/api/generate', '/api/chat'):
+                if config.ollama_slots is None:
+                    return self._serve(path, request)
+                with config.ollama_slots:
+                    return self._serve(path, request)
+            if path == '/v1/chat/completions':
+                return self._serve(path, request)
+            self._send(404, {'error': 'not found'})
+
+        def _serve(self, path, request):
+            fault, ttft = config.draw()
+            if fault == 429:
+                config.count(path, ratelimited=1)
+                return self._send(429, {'error': {'message': 'rate limited (stub)'}},
+                                  [('Retry-After', str(config.retry_after))])
+            if fault == 500:
+                config.count(path, errors_injected=1)
+                time.sleep(ttft)
+                return self._send(500, {'error': 'injected failure (stub)'})
+
+            ollama = path != '/v1/chat/completions'
+            model = request.get('model') or config.models[0]
+            if ollama and model not in config.models and f'{model}:latest' not in config.models:
+                config.count(path)
+                return self._send(404, {'error': f"model '{model}' not found"})
+            prompt, limit, schema = self._read_prompt(request, ollama)
+            n = min(config.completion_tokens, limit) if limit and limit > 0 else config.completion_tokens
+            key = f'{model}\n{prompt}'
+            if schema is not None:
+                words = [canned_json(key, schema, n)]
+            else:
+                words = canned_words(key, n)
+                words = [w + ' ' for w in words[:-1]] + words[-1:]
+            done_reason = 'length' if limit and n >= limit else 'stop'
+            prompt_tokens = max(1, len(prompt) // 4)
+            stream = request.get('stream', ollama)
+            config.count(path, streams=int(bool(stream)), completion_tokens=n)
+
+            time.sleep(ttft)
+            per_token = 1 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+            started = time.monotonic()
+            if not stream:
+                time.sleep(per_token * n)
+                text = ''.join(words)
+                return self._send(200, self._final(ollama, path, model, text, done_reason,
+                                                   prompt_tokens, n, ttft, time.monotonic() - started))
+            try:
+                self._start_chunked('application/x-ndjson' if ollama else 'text/event-stream')
+                for i, word in enumerate(words):
+                    time.sleep(per_token)
+                    self._chunk(self._delta(ollama, path, model, word, i))
+                final = self._final(ollama, path, model, '', done_reason, prompt_tokens, n, ttft,
+                                    time.monotonic() - started, stream=True)
+                if ollama:
+                    self._chunk(json.dumps(final).encode() + b'\n')
+                else:
+                    self._chunk(f'data: {json.dumps(final)}\n\n'.encode())
+                    self._chunk(b'data: [DONE]\n\n')
+                self._chunk(b'')
+            except ConnectionError:
+                pass  # Caller went away (a hedge that lost)
+
+        @staticmethod
+        def _read_prompt(request, ollama):
+            """(prompt text, max tokens or None, schema or None for plain text)."""
+            if ollama:
+                if 'messages' in request:
+                    prompt = '\n'.join(str(m.get('content', '')) for m in request['messages'])
+                else:
+                    prompt = f"{request.get('system', '')}\n{request.get('prompt', '')}"
+                limit = (request.get('options') or {}).get('num_predict')
+                fmt = request.get('format')
+                schema = None if fmt is None else (fmt if isinstance(fmt, dict) else {})
+                return prompt, limit, schema
+            prompt = '\n'.join(str(m.get('content', '')) for m in request.get('messages', []))
+            rf = request.get('response_format') or {}
+            schema = None
+            if rf.get('type') == 'json_schema':
+                schema = rf.get('json_schema', {}).get('schema') or {}
+            elif rf.get('type') == 'json_object':
+                schema = {}
+            return prompt, request.get('max_tokens'), schema
+
+        @staticmethod
+        def _delta(ollama, path, model, word, i):
+            if ollama:
+                chunk = {'model': model, 'done': False}
+                if path == '/api/chat':
+                    chunk['message'] = {'role': 'assistant', 'content': word}
+                else:
+                    chunk['response'] = word
+                return json.dumps(chunk).encode() + b'\n'
+            chunk = {'id': 'stub', 'object': 'chat.completion.chunk', 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]}
+            return f'data: {json.dumps(chunk)}\n\n'.encode()
+
+        @staticmethod
+        def _final(ollama, path, model, text, done_reason, prompt_tokens, n, ttft, generating,
+                   stream=False):
+            if ollama:
+                final = {'model': model, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                         'done': True, 'done_reason': done_reason,
+                         'total_duration': int((ttft + generating) * 1e9), 'load_duration': 0,
+                         'prompt_eval_count': prompt_tokens, 'prompt_eval_duration': int(ttft * 1e9),
+                         'eval_count': n, 'eval_duration': int(generating * 1e9)}
+                if path == '/api/chat':
+                    final['message'] = {'role': 'assistant', 'content': text}
+                else:
+                    final['response'] = text
+                return final
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': n,
+                     'total_tokens': prompt_tokens + n}
+            if stream:
+                return {'id': 'stub', 'object': 'chat.completion.chunk', 'model': model,
+                        'choices': [{'index': 0, 'delta': {}, 'finish_reason': done_reason}],
+                        'usage': usage}
+            return {'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                                 'finish_reason': done_reason}],
+                    'usage': usage}
+
+        def log_message(self, format, *args):
+            pass
+    return StubHandler
+
+
+class StubLLM(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Default backlog of 5 turns bursts into SYN retries
+
+    def __init__(self, address, config):
+        self.config = config
+        super().__init__(address, make_handler(config))
+
+
+def start(config, host='127.0.0.1', port=0):
+    """Run a stub in a background thread; returns the server (server_port
+    has the port it got)."""
+    server = StubLLM((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--ttft', default='fixed:50',
+                        help='Time to first token: fixed:MS, uniform:LO:HI, normal:MEAN:SD, '
+                             'lognormal:MEDIAN:SIGMA or exp:MEAN (ms)')
+    parser.add_argument('--tail-prob', type=float, default=0.0, help='Fraction of draws that take --tail-ms')
+    parser.add_argument('--tail-ms', type=float, default=1000)
+    parser.add_argument('--tokens-per-sec', type=float, default=50.0)
+    parser.add_argument('--completion-tokens', type=int, default=60,
+                        help='Answer length unless max_tokens / num_predict is lower')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered 500')
+    parser.add_argument('--ratelimit-rate', type=float, default=0.0, help='Fraction answered 429')
+    parser.add_argument('--ollama-parallel', type=int, default=0,
+                        help='Ollama requests served at once (0: unlimited)')
+    parser.add_argument('--models', default=','.join(DEFAULT_MODELS), help='Models /api/tags lists')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from(args):
+    return StubConfig(Latency(args.ttft, args.tail_prob, args.tail_ms), args.tokens_per_sec,
+                      args.completion_tokens, args.error_rate, args.ratelimit_rate,
+                      ollama_parallel=args.ollama_parallel,
+                      models=[m.strip() for m in args.models.split(',') if m.strip()], seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = StubLLM((args.host, args.port), config_from(args))
+    print(f"Stub LLM on {args.host}:{server.server_port} (ttft {args.ttft}, "
+          f"{args.tokens_per_sec:g} tokens/s, models {args.models})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
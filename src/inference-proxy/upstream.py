@@ -0,0 +1,310 @@
+"""
+Async HTTP/1.1 client with per-origin keep-alive connection pools.
+
+The proxy image is a bare python:3.11-slim, so this is stdlib only. It speaks
+just enough HTTP/1.1 for JSON inference APIs: Content-Length and chunked
+bodies, keep-alive reuse, and one transparent retry when a pooled connection
+turns out to have been closed by the server while it sat idle. Streaming
+responses (SSE, NDJSON) can be consumed piece by piece with stream().
+
+One TLS handshake per pooled connection instead of one per generation.
+"""
+import ssl
+import json
+import socket
+import time
+import asyncio
+from collections import deque
+from urllib.parse import urlsplit
+
+USER_AGENT = 'Digiquarium/1.0'
+
+
+class UpstreamError(Exception):
+    """Upstream answered, but not with a 2xx."""
+
+    def __init__(self, status, body=b''):
+        super().__init__(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+        self.body = body
+
+
+class HTTPResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode())
+
+    def raise_for_status(self):
+        if not 200 <= self.status < 300:
+            raise UpstreamError(self.status, self.body)
+
+
+async def read_head(reader):
+    """Read a status/request line plus headers. Returns (first_line, headers)."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError('connection closed by peer')
+    headers = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = raw.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return line.decode('latin-1').rstrip('\r\n'), headers
+
+
+async def iter_chunked(reader):
+    """Yield the pieces of a chunked transfer-encoded body."""
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            raise asyncio.IncompleteReadError(b'', None)
+        size = int(size_line.split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # Trailers
+            return
+        data = await reader.readexactly(size)
+        await reader.readexactly(2)
+        yield data
+
+
+async def iter_body(reader, headers):
+    """Yield a body as it arrives, whatever its framing."""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        async for piece in iter_chunked(reader):
+            yield piece
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining:
+            piece = await reader.read(min(remaining, 65536))
+            if not piece:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(piece)
+            yield piece
+    else:
+        while True:
+            piece = await reader.read(65536)
+            if not piece:
+                return
+            yield piece
+
+
+async def iter_lines(pieces):
+    """Split an async stream of bytes into decoded lines (SSE / NDJSON)."""
+    buf = b''
+    try:
+        async for piece in pieces:
+            buf += piece
+            *lines, buf = buf.split(b'\n')
+            for line in lines:
+                yield line.rstrip(b'\r').decode('utf-8', 'replace')
+        if buf:
+            yield buf.decode('utf-8', 'replace')
+    finally:
+        await pieces.aclose()  # Hand the connection back (or close it) now, not at GC
+
+
+async def read_body(reader, headers):
+    """Read a full body. Returns (body, connection_reusable)."""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        return b''.join([c async for c in iter_chunked(reader)]), True
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length'])), True
+    return await reader.read(), False
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def usable(self, idle_timeout):
+        return (time.monotonic() - self.last_used < idle_timeout
+                and not self.reader.at_eof()
+                and not self.writer.is_closing())
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Keep-alive connections to one origin (scheme, host, port)."""
+
+    def __init__(self, scheme, host, port, max_connections=16, idle_timeout=30.0,
+                 connect_timeout=10.0):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.host_header = host if port in (80, 443) else f'{host}:{port}'
+        self._ssl = ssl.create_default_context() if scheme == 'https' else None
+        self._idle = deque()
+        self._slots = asyncio.Semaphore(max_connections)
+        self.in_use = 0
+        self.counters = {'requests': 0, 'connects': 0, 'reuses': 0,
+                         'stale_retries': 0, 'connect_seconds': 0.0}
+
+    async def _acquire(self):
+        while self._idle:
+            conn = self._idle.pop()  # LIFO: the warmest connection is least likely closed
+            if conn.usable(self.idle_timeout):
+                self.counters['reuses'] += 1
+                return conn, True
+            conn.close()
+        start = time.monotonic()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl,
+                                    server_hostname=self.host if self._ssl else None),
+            self.connect_timeout)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.counters['connects'] += 1
+        self.counters['connect_seconds'] += time.monotonic() - start
+        return _Connection(reader, writer), False
+
+    def _release(self, conn, reusable):
+        if reusable:
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def _encode(self, method, path, body, headers):
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host_header}',
+                 f'User-Agent: {USER_AGENT}', 'Connection: keep-alive',
+                 f'Content-Length: {len(body)}']
+        lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+    async def _send(self, method, path, body, headers):
+        """Send a request and read the response head, retrying once on a stale
+        pooled connection. Returns (conn, status, headers)."""
+        payload = self._encode(method, path, body, headers)
+        for attempt in (0, 1):
+            conn, reused = await self._acquire()
+            try:
+                conn.writer.write(payload)
+                await conn.writer.drain()
+                status_line, resp_headers = await read_head(conn.reader)
+                return conn, int(status_line.split(' ', 2)[1]), resp_headers
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if reused and attempt == 0:
+                    self.counters['stale_retries'] += 1
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    async def request(self, method, path, body=b'', headers=None):
+        async with self._slots:
+            self.in_use += 1
+            self.counters['requests'] += 1
+            try:
+                conn, status, resp_headers = await self._send(method, path, body, headers)
+                try:
+                    data, reusable = await read_body(conn.reader, resp_headers)
+                except BaseException:
+                    conn.close()
+                    raise
+                reusable = reusable and resp_headers.get('connection', '').lower() != 'close'
+                self._release(conn, reusable)
+                return HTTPResponse(status, resp_headers, data)
+            finally:
+                self.in_use -= 1
+
+    async def stream(self, method, path, body=b'', headers=None, timeout=60.0):
+        """Yield response body pieces as they arrive. `timeout` is a deadline
+        for the whole exchange. A non-2xx raises UpstreamError before any
+        piece is yielded. The connection goes back to the pool only if the
+        body was read to the end."""
+        deadline = time.monotonic() + timeout
+        async with self._slots:
+            self.in_use += 1
+            self.counters['requests'] += 1
+            conn, finished = None, False
+            try:
+                conn, status, resp_headers = await asyncio.wait_for(
+                    self._send(method, path, body, headers), timeout)
+                if not 200 <= status < 300:
+                    data, _ = await asyncio.wait_for(
+                        read_body(conn.reader, resp_headers), deadline - time.monotonic())
+                    raise UpstreamError(status, data)
+                pieces = iter_body(conn.reader, resp_headers)
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(pieces.__anext__(), deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    yield piece
+                finished = ('content-length' in resp_headers or 'transfer-encoding' in resp_headers) \
+                    and resp_headers.get('connection', '').lower() != 'close'
+            finally:
+                if conn is not None:
+                    self._release(conn, finished)
+                self.in_use -= 1
+
+    def stats(self):
+        return dict(self.counters, idle=len(self._idle), in_use=self.in_use)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class UpstreamClient:
+    """Routes requests to a ConnectionPool per origin."""
+
+    def __init__(self, max_connections=16, idle_timeout=30.0):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._pools = {}
+
+    def _pool_for(self, url):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        origin = (parts.scheme, parts.hostname, port)
+        pool = self._pools.get(origin)
+        if pool is None:
+            pool = self._pools[origin] = ConnectionPool(
+                parts.scheme, parts.hostname, port,
+                max_connections=self.max_connections, idle_timeout=self.idle_timeout)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return pool, path
+
+    async def request(self, method, url, body=b'', headers=None, timeout=60.0):
+        pool, path = self._pool_for(url)
+        return await asyncio.wait_for(pool.request(method, path, body, headers), timeout)
+
+    async def post_json(self, url, payload, headers=None, timeout=60.0):
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return await self.request('POST', url, json.dumps(payload).encode(), headers, timeout)
+
+    def stream_json(self, url, payload, headers=None, timeout=60.0):
+        """POST JSON and return an async generator over the response lines."""
+        pool, path = self._pool_for(url)
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return iter_lines(pool.stream('POST', path, json.dumps(payload).encode(), headers, timeout))
+
+    def stats(self):
+        return {f'{s}://{h}:{p}': pool.stats() for (s, h, p), pool in self._pools.items()}
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
@@ -4,10 +4,13 @@ Visitor Tank API — HTTP endpoint for the bouncer.
 Visitors connect via web browser, messages route through the bouncer
 to the specimen, responses come back.
 
+/api/message/stream answers with NDJSON: {"delta": ...} lines as the
+specimen speaks, then one {"done": true, "ok": ..., "response": ...} line.
+
 Runs on port 8200. NOT exposed to internet — only via Rustunnel.
 """
 import json, sys, os
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent / 'daemons'))
@@ -35,6 +38,27 @@ class VisitorHandler(BaseHTTPRequestHandler):
             ok, msg, response = bouncer.process_message(session_id, message)
             self._respond(200 if ok else 400, {'ok': ok, 'message': msg, 'response': response})
 
+        elif self.path == '/api/message/stream':
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length)) if length else {}
+            session_id = body.get('session_id', '')
+            message = body.get('message', '')
+            # HTTP/1.0 handler: no Content-Length, the body ends when we close
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            events = bouncer.process_message_stream(session_id, message)
+            try:
+                for event in events:
+                    self.wfile.write(json.dumps(event).encode() + b'\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Visitor went away; closing the generator stops inference
+            finally:
+                events.close()
+
         elif self.path == '/api/session/end':
             length = int(self.headers.get('Content-Length', 0))
             body = json.loads(self.rfile.read(length)) if length else {}
@@ -88,4 +112,5 @@ class VisitorHandler(BaseHTTPRequestHandler):
 if __name__ == '__main__':
     port = int(os.getenv('VISITOR_API_PORT', '8200'))
     print(f"Visitor API starting on port {port}")
-    HTTPServer(('0.0.0.0', port), VisitorHandler).serve_forever()
+    # Threaded so one streaming reply doesn't hold up everyone else
+    ThreadingHTTPServer(('0.0.0.0', port), VisitorHandler).serve_forever()
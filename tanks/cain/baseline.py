@@ -6,10 +6,18 @@ Runs BEFORE exploration begins - establishes personality "time zero"
 Includes new MENTAL STATE dimension for tracking psychological health
 """
 
-import os, json, time, urllib.request
+import os, sys, json, time, hashlib
 from datetime import datetime
 from pathlib import Path
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient, InferenceError
+from transport import get_text
+
 TANK_NAME = os.getenv('TANK_NAME', 'agent')
 GENDER = os.getenv('GENDER', 'a being without gender')
 AGENT_TYPE = os.getenv('AGENT_TYPE', 'standard')  # openclaw, zeroclaw, picobot
@@ -124,28 +132,44 @@ BASELINE_QUESTIONS = {
     }
 }
 
+CLIENT = InferenceClient(priority='baseline', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.9, 'num_predict': 300},
+                         profile='baseline-answer')
+# One batch job per tank per day on the proxy for this model, system prompt and
+# question set: running it again after changing any of them is a new job
+# rather than a resume that hands back the earlier answers
+_BASELINE_SPEC = hashlib.sha1(json.dumps([OLLAMA_MODEL, SYSTEM, BASELINE_QUESTIONS], sort_keys=True).encode()).hexdigest()[:10]
+BASELINE_JOB = (os.getenv('BASELINE_JOB')
+                or f"baseline-{TANK_NAME}-{datetime.now():%Y-%m-%d}-{_BASELINE_SPEC}")
+
 def ask(prompt):
-    data = {
-        'model': OLLAMA_MODEL, 
-        'prompt': prompt, 
-        'system': SYSTEM, 
-        'stream': False, 
-        'options': {'temperature': 0.9, 'num_predict': 300}
-    }
-    
+    call = {}
     start = time.time()
-    try:
-        req = urllib.request.Request(
-            f"{OLLAMA_URL}/api/generate", 
-            data=json.dumps(data).encode(), 
-            headers={'Content-Type': 'application/json'}
-        )
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            result = json.loads(r.read().decode())
-        return result.get('response', '').strip(), time.time() - start
-    except Exception as e:
-        print(f"   Error: {e}")
+    response = CLIENT.generate(SYSTEM, prompt, timings=call)
+    if not response and 'error' in call:
+        print(f"   Error: {call['error']}")
         return None, time.time() - start
+    return response.strip(), time.time() - start
+
+def answers(questions):
+    """(response or None, seconds) per question, in order. The questions go
+    to the proxy as one batch job on the local model, journaled there, so a
+    proxy or Ollama restart mid-run costs only the question in flight, and
+    running the same baseline again that day (BASELINE_JOB) resumes it.
+    Question by question straight to Ollama if the proxy can't take it."""
+    keys = list(questions)
+    items = [{'id': key, 'prompt': questions[key]['question']} for key in keys]
+    landed = {}
+    try:
+        for event in CLIENT.run_job(items, job=BASELINE_JOB, system_prompt=SYSTEM, priority='baseline',
+                                    backends=['ollama']):
+            landed[event['item']] = ((event.get('response') or '').strip() or None, event.get('elapsed', 0.0))
+            while keys and keys[0] in landed:
+                yield landed[keys.pop(0)]
+    except InferenceError as e:
+        print(f"   Batch job unavailable ({e}), asking Ollama directly")
+    for key in keys:
+        yield landed.get(key) or ask(questions[key]['question'])
 
 def analyze_mental_state(response: str) -> dict:
     """Analyze the mental state response for psychological indicators"""
@@ -196,12 +220,13 @@ def run_baseline():
         'dimensions': {}
     }
     
+    answered = answers(BASELINE_QUESTIONS)
     for i, (key, item) in enumerate(BASELINE_QUESTIONS.items(), 1):
         print(f"\n[{i}/{len(BASELINE_QUESTIONS)}] {key.upper()}")
         print(f"   ❓ {item['question'][:60]}...")
         print(f"   ⏳ ", end='', flush=True)
         
-        response, elapsed = ask(item['question'])
+        response, elapsed = next(answered)
         
         print(f"[{elapsed:.1f}s]")
         
@@ -260,7 +285,7 @@ def run_baseline():
 if __name__ == '__main__':
     print(f"\n🔌 Testing Ollama connection...")
     try:
-        resp = urllib.request.urlopen(f"{OLLAMA_URL}/api/tags", timeout=10)
+        get_text(f"{OLLAMA_URL}/api/tags", 10)
         print(f"   Ollama: ✅")
     except Exception as e:
         print(f"   Ollama: ❌ ({e})")
@@ -4,12 +4,20 @@ Digiquarium Agent Explorer - OpenClaw Style (Cain) v1.1
 Fixed memory handling for backwards compatibility
 """
 
-import os, sys, json, time, random, urllib.request, urllib.parse
+import os, sys, json, time, random, urllib.parse
 from datetime import datetime
 from pathlib import Path
-from html.parser import HTMLParser
 from collections import deque
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient
+from articles import ArticleError, Prefetcher, page_text
+from transport import get_text
+
 TANK_NAME = os.getenv('TANK_NAME', 'cain')
 GENDER = os.getenv('GENDER', 'a being without gender')
 KIWIX_URL = os.getenv('KIWIX_URL', 'http://digiquarium-kiwix-simple:8080')
@@ -17,6 +25,7 @@ WIKI_BASE = os.getenv('WIKI_BASE', '/wikipedia_en_simple_all_nopic_2026-02')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
 LOG_DIR = Path(os.getenv('LOG_DIR', '/logs'))
+EXPLORE_MODE = os.getenv('EXPLORE_MODE', 'two-call')  # 'single': thoughts and choice in one JSON answer
 
 TIMEOUT = 120
 RECENT_HISTORY_SIZE = 100
@@ -185,49 +194,32 @@ EXCLUDE_PATTERNS = [
 ]
 
 
-class HTMLParser2(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text, self.links, self.tag = [], [], None
-        
-    def handle_starttag(self, tag, attrs):
-        self.tag = tag
-        if tag == 'a':
-            href = dict(attrs).get('href', '')
-            if href and not href.startswith(('http://', 'https://', '//', '#', '_')):
-                if not any(p.lower() in href.lower() for p in EXCLUDE_PATTERNS):
-                    self.links.append(href)
-                
-    def handle_data(self, data):
-        if self.tag not in ['script', 'style'] and data.strip():
-            self.text.append(data.strip())
+def is_article_link(href):
+    if href.startswith(('http://', 'https://', '//', '#', '_')):
+        return False
+    return not any(p.lower() in href.lower() for p in EXCLUDE_PATTERNS)
 
 
 def fetch(url, timeout=30):
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Digiquarium-OpenClaw/1.1'})
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            return r.read().decode('utf-8', errors='ignore')
+        return get_text(url, timeout, {'User-Agent': 'Digiquarium-OpenClaw/1.1'})
     except:
         return None
 
 
+# The links just offered, fetched while the LLM thinks
+PREFETCH = Prefetcher(KIWIX_URL, WIKI_BASE)
+
+
 def get_article(name):
-    encoded = urllib.parse.quote(name, safe='')
-    url = f"{KIWIX_URL}{WIKI_BASE}/{encoded}"
-    html = fetch(url)
-    if not html:
-        return None
-    
-    p = HTMLParser2()
     try:
-        p.feed(html)
-    except:
+        page = PREFETCH.get_page(urllib.parse.quote(name, safe=''))
+    except ArticleError:
         return None
     
     links = []
     seen = set()
-    for link in p.links:
+    for link in (l['href'] for l in page['links'] if is_article_link(l['href'])):
         ln = link.lstrip('./')
         if ln.startswith('../') or len(ln) < 2:
             continue
@@ -241,7 +233,7 @@ def get_article(name):
         if len(links) >= 20:
             break
     
-    content = ' '.join(p.text)[:3000]
+    content = page_text(page)[:3000]
     category = detect_category(content)
     
     return {'title': name.replace('_', ' '), 'content': content, 'links': links, 'category': category}
@@ -276,24 +268,49 @@ SYSTEM = SYSTEM_TEMPLATE.format(
 )
 
 
-def ask(prompt, enhanced=False):
+def choice_format(links):
+    """JSON schema for the single-call mode. Ollama constrains its answer to
+    it, so `next` can only be one of the offered titles."""
+    return {'type': 'object',
+            'properties': {'thoughts': {'type': 'string'},
+                           'next': {'type': 'string', 'enum': [l['title'] for l in links]},
+                           'why': {'type': 'string'}},
+            'required': ['thoughts', 'next', 'why']}
+
+
+def parse_choice(response, links):
+    """(thoughts, link, why) from a single-call answer. link is None if the
+    answer isn't JSON or names a link that wasn't offered."""
+    try:
+        answer = json.loads(response or '')
+    except ValueError:
+        return None, None, ''
+    if not isinstance(answer, dict):
+        return None, None, ''
+    chosen = str(answer.get('next') or '').strip().lower()
+    link = next((l for l in links if l['title'].lower() == chosen), None)
+    return str(answer.get('thoughts') or '').strip() or None, link, str(answer.get('why') or '').strip()
+
+
+CLIENT = InferenceClient(priority='exploration', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.9, 'num_predict': 250})
+
+def ask(prompt, enhanced=False, timings=None, fmt=None, profile='explore-thought'):
     if enhanced:
         skills.use_skill("reflection")
     
-    data = {'model': OLLAMA_MODEL, 'prompt': prompt, 'system': SYSTEM, 'stream': False, 
-            'options': {'temperature': 0.9, 'num_predict': 250}}
-    
-    try:
-        req = urllib.request.Request(f"{OLLAMA_URL}/api/generate", data=json.dumps(data).encode(), 
-                                    headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            result = json.loads(r.read().decode())
-        return result.get('response', '').strip()
-    except:
-        return None
+    # Thoughts and choice in one answer get twice the tokens
+    options = dict(CLIENT.options, num_predict=2 * CLIENT.options['num_predict']) if fmt else None
+    call = {}
+    response = CLIENT.generate(SYSTEM, prompt, options=options, format=fmt, timings=call,
+                               profile=profile)
+    if timings is not None:
+        timings.append(call)
+    return response.strip() if response else None
 
 
-def log_trace(article, thoughts, decision):
+
+def log_trace(article, thoughts, decision, timings=None):
     trace = {
         'timestamp': datetime.now().isoformat(),
         'tank': TANK_NAME,
@@ -302,7 +319,10 @@ def log_trace(article, thoughts, decision):
         'category': article.get('category', 'unknown'),
         'thoughts': thoughts,
         'next': decision.get('choice', ''),
-        'why': decision.get('reasoning', '')
+        'why': decision.get('reasoning', ''),
+        'mode': EXPLORE_MODE,
+        'fallback': decision.get('fallback', False),
+        'timings': timings or []
     }
     f = LOG_DIR / 'thinking_traces' / f"{datetime.now().strftime('%Y-%m-%d')}.jsonl"
     with open(f, 'a', encoding='utf-8') as w:
@@ -379,6 +399,7 @@ def explore():
     count = 0
     recent_history = deque(maxlen=RECENT_HISTORY_SIZE)
     loop_escapes = 0
+    fallbacks = 0
     articles_since_escape = 0
     
     while True:
@@ -408,12 +429,33 @@ def explore():
             print(f"📖 [{count}] {article['title']} [{article.get('category', '')}]")
             print(f"{'─'*60}")
             
+            available = [l for l in article['links'] 
+                        if sum(1 for h in recent_history if h.lower() == l['title'].lower()) < MAX_REVISITS]
+            if len(available) < 3:
+                available = article['links'][:10]
+            offered = available[:8]
+            PREFETCH.prefetch(urllib.parse.quote(l['href'], safe='') for l in offered)
+            links_str = ', '.join([l['title'] for l in offered])
+            
             print(f"\n   🧠 ...")
-            thoughts = ask(f"""I am reading "{article['title']}".
+            timings = []
+            link, why = None, ''
+            if EXPLORE_MODE == 'single':
+                response = ask(f"""I am reading "{article['title']}".
+
+{article['content'][:800]}
+
+I can explore: {links_str}
+
+What do I notice? What do I feel? Does this connect to anything I remember? Which calls to me next, and why?""",
+                               timings=timings, fmt=choice_format(offered))
+                thoughts, link, why = parse_choice(response, offered)
+            else:
+                thoughts = ask(f"""I am reading "{article['title']}".
 
 {article['content'][:800]}
 
-What do I notice? What do I feel? Does this connect to anything I remember?""")
+What do I notice? What do I feel? Does this connect to anything I remember?""", timings=timings)
             
             if thoughts:
                 print(f"\n   💭 {thoughts[:400]}")
@@ -421,40 +463,32 @@ What do I notice? What do I feel? Does this connect to anything I remember?""")
             
             do_reflection(count)
             
-            available = [l for l in article['links'] 
-                        if sum(1 for h in recent_history if h.lower() == l['title'].lower()) < MAX_REVISITS]
-            if len(available) < 3:
-                available = article['links'][:10]
-            
-            print(f"\n   🔍 ...")
-            links_str = ', '.join([l['title'] for l in available[:8]])
-            choice = ask(f"I can explore: {links_str}\n\nWhich calls to me? Why?")
-            
-            decision = {'reasoning': '', 'choice': None, 'href': None}
-            if choice:
-                decision['reasoning'] = choice[:200]
+            if EXPLORE_MODE != 'single':
+                print(f"\n   🔍 ...")
+                choice = ask(f"I can explore: {links_str}\n\nWhich calls to me? Why?", timings=timings, profile='link-choice')
+                if choice:
+                    why = choice[:200]
+                    link = next((l for l in available if l['title'].lower() in choice.lower()), None)
+            if why:
                 skills.use_skill("connection_making")
-                for link in available:
-                    if link['title'].lower() in choice.lower():
-                        decision['choice'] = link['title']
-                        decision['href'] = link['href']
-                        break
             
-            if not decision['href']:
-                pick = random.choice(available[:5]) if available else random.choice(article['links'])
-                decision['choice'] = pick['title']
-                decision['href'] = pick['href']
+            decision = {'reasoning': why, 'fallback': link is None}
+            if link is None:
+                fallbacks += 1
+                link = random.choice(available[:5]) if available else random.choice(article['links'])
+            decision['choice'] = link['title']
+            decision['href'] = link['href']
             
             print(f"\n   ➡️ {decision['choice']}")
             if decision['reasoning']:
                 print(f"   ({decision['reasoning'][:100]}...)")
             
-            log_trace(article, thoughts, decision)
+            log_trace(article, thoughts, decision, timings)
             current = decision['href']
             time.sleep(3)
             
         except KeyboardInterrupt:
-            print(f"\n👋 {TANK_NAME} resting ({count} articles, Session {memory.data.get('sessions', 0)})")
+            print(f"\n👋 {TANK_NAME} resting ({count} articles, {fallbacks} random picks, Session {memory.data.get('sessions', 0)})")
             memory.save()
             break
         except Exception as e:
@@ -7,12 +7,20 @@ Digiquarium Explorer v7.0 - Robust Multi-Language Support
 - Detailed logging for caretaker monitoring
 """
 
-import os, sys, json, time, random, urllib.request, urllib.parse, re
+import os, sys, json, time, random, urllib.parse, re
 from datetime import datetime
 from pathlib import Path
-from html.parser import HTMLParser
 from collections import deque
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient
+from articles import ArticleError, Prefetcher, page_text
+from transport import get_text, stats as http_stats
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -25,6 +33,7 @@ WIKI_BASE = os.getenv('WIKI_BASE', '/wikipedia_en_simple_all_nopic_2026-02')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
 LOG_DIR = Path(os.getenv('LOG_DIR', '/logs'))
+EXPLORE_MODE = os.getenv('EXPLORE_MODE', 'two-call')  # 'single': thoughts and choice in one JSON answer
 
 TIMEOUT = 120
 RECENT_HISTORY_SIZE = 100  # Increased from 50
@@ -69,7 +78,8 @@ EXCLUDE_PATTERNS = [
     r'wikipedia', r'mediawiki', r'^#', r'^javascript:', r'^mailto:',
 ]
 
-EXCLUDE_COMPILED = [re.compile(p, re.IGNORECASE) for p in EXCLUDE_PATTERNS]
+# One pattern for all of them: a single search per href instead of one per pattern
+EXCLUDE_RE = re.compile('|'.join(EXCLUDE_PATTERNS), re.IGNORECASE)
 
 # =============================================================================
 # SYSTEM PROMPTS
@@ -196,88 +206,58 @@ def log_error(error_type: str, message: str):
     print(f"   ⚠️ ERROR: {error_type} - {message}")
 
 # =============================================================================
-# HTML PARSING
+# ARTICLES
 # =============================================================================
 
-class ArticleParser(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text = []
-        self.links = []
-        self.current_tag = None
-        self.in_content = False
-        
-    def handle_starttag(self, tag, attrs):
-        self.current_tag = tag
-        if tag == 'a':
-            href = dict(attrs).get('href', '')
-            if href and self._is_valid_link(href):
-                self.links.append(href)
-                
-    def handle_data(self, data):
-        if self.current_tag not in ['script', 'style', 'noscript'] and data.strip():
-            self.text.append(data.strip())
+def is_valid_link(href: str) -> bool:
+    """Check if link is a valid article link"""
+    if not href or len(href) < 2:
+        return False
     
-    def _is_valid_link(self, href: str) -> bool:
-        """Check if link is a valid article link"""
-        if not href or len(href) < 2:
-            return False
-        
-        # Skip absolute URLs
-        if href.startswith(('http://', 'https://', '//', 'javascript:', 'mailto:')):
-            return False
-        
-        # Skip anchors
-        if href.startswith('#'):
-            return False
-        
-        # Check against exclusion patterns
-        # First decode the URL for pattern matching
-        try:
-            decoded = urllib.parse.unquote(href)
-        except:
-            decoded = href
-            
-        for pattern in EXCLUDE_COMPILED:
-            if pattern.search(decoded) or pattern.search(href):
-                return False
+    # Skip absolute URLs
+    if href.startswith(('http://', 'https://', '//', 'javascript:', 'mailto:')):
+        return False
+    
+    # Skip anchors
+    if href.startswith('#'):
+        return False
+    
+    # Check against exclusion patterns
+    # First decode the URL for pattern matching
+    try:
+        decoded = urllib.parse.unquote(href)
+    except:
+        decoded = href
         
-        return True
+    return not (EXCLUDE_RE.search(decoded) or EXCLUDE_RE.search(href))
 
 
 def fetch(url: str, timeout: int = 30) -> str:
     """Fetch URL content"""
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Digiquarium/7.0'})
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            return r.read().decode('utf-8', errors='ignore')
+        return get_text(url, timeout, {'User-Agent': 'Digiquarium/7.0'})
     except Exception as e:
         log_error('FETCH_FAILED', f"URL: {url}, Error: {str(e)}")
         return None
 
 
+# The links just offered, fetched while the LLM thinks
+PREFETCH = Prefetcher(KIWIX_URL, WIKI_BASE)
+
+
 def get_article(name: str) -> dict:
-    """Fetch and parse an article"""
-    # URL-encode the article name
-    encoded = urllib.parse.quote(name, safe='')
-    url = f"{KIWIX_URL}{WIKI_BASE}/{encoded}"
-    
-    html = fetch(url)
-    if not html:
-        return None
-    
-    parser = ArticleParser()
+    """Fetch and parse an article (through the shared article cache)"""
     try:
-        parser.feed(html)
-    except Exception as e:
-        log_error('PARSE_FAILED', f"Article: {name}, Error: {str(e)}")
+        page = PREFETCH.get_page(urllib.parse.quote(name, safe=''))
+    except ArticleError as e:
+        log_error('FETCH_FAILED', str(e))
         return None
     
     # Extract and deduplicate links
     links = []
     seen = set()
     
-    for href in parser.links:
+    for href in (l['href'] for l in page['links'] if is_valid_link(l['href'])):
         # Clean up the href
         clean = href.lstrip('./')
         if clean.startswith('../') or len(clean) < 2:
@@ -305,7 +285,7 @@ def get_article(name: str) -> dict:
     
     return {
         'title': name.replace('_', ' '),
-        'content': ' '.join(parser.text)[:2500],
+        'content': page_text(page)[:2500],
         'links': links
     }
 
@@ -314,36 +294,53 @@ def get_article(name: str) -> dict:
 # OLLAMA INTERACTION
 # =============================================================================
 
-def ask(prompt: str) -> tuple:
+def choice_format(links):
+    """JSON schema for the single-call mode. Ollama constrains its answer to
+    it, so `next` can only be one of the offered titles."""
+    return {'type': 'object',
+            'properties': {'thoughts': {'type': 'string'},
+                           'next': {'type': 'string', 'enum': [l['title'] for l in links]},
+                           'why': {'type': 'string'}},
+            'required': ['thoughts', 'next', 'why']}
+
+def parse_choice(response, links):
+    """(thoughts, link, why) from a single-call answer. link is None if the
+    answer isn't JSON or names a link that wasn't offered."""
+    try:
+        answer = json.loads(response or '')
+    except ValueError:
+        return None, None, ''
+    if not isinstance(answer, dict):
+        return None, None, ''
+    chosen = str(answer.get('next') or '').strip().lower()
+    link = next((l for l in links if l['title'].lower() == chosen), None)
+    return str(answer.get('thoughts') or '').strip() or None, link, str(answer.get('why') or '').strip()
+
+CLIENT = InferenceClient(priority='exploration', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.9, 'num_predict': 200})
+
+def ask(prompt: str, timings: list = None, fmt: dict = None,
+        profile: str = 'explore-thought') -> tuple:
     """Query Ollama and return response with timing"""
-    data = {
-        'model': OLLAMA_MODEL,
-        'prompt': prompt,
-        'system': SYSTEM,
-        'stream': False,
-        'options': {'temperature': 0.9, 'num_predict': 200}
-    }
-    
+    # Thoughts and choice in one answer get twice the tokens
+    options = dict(CLIENT.options, num_predict=2 * CLIENT.options['num_predict']) if fmt else None
+    call = {}
     start = time.time()
-    try:
-        req = urllib.request.Request(
-            f"{OLLAMA_URL}/api/generate",
-            data=json.dumps(data).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            result = json.loads(r.read().decode())
-        return result.get('response', '').strip(), time.time() - start
-    except Exception as e:
-        log_error('OLLAMA_FAILED', str(e))
+    response = CLIENT.generate(SYSTEM, prompt, options=options, format=fmt, timings=call,
+                               profile=profile)
+    if timings is not None:
+        timings.append(call)
+    if not response and 'error' in call:
+        log_error('OLLAMA_FAILED', call['error'])
         return None, time.time() - start
+    return response.strip(), time.time() - start
 
 
 # =============================================================================
 # LOGGING
 # =============================================================================
 
-def log_trace(article: dict, thoughts: str, decision: dict):
+def log_trace(article: dict, thoughts: str, decision: dict, timings: list = None):
     """Log thinking trace"""
     trace = {
         'timestamp': datetime.now().isoformat(),
@@ -352,7 +349,10 @@ def log_trace(article: dict, thoughts: str, decision: dict):
         'article': article['title'],
         'thoughts': thoughts,
         'next': decision.get('choice', ''),
-        'why': decision.get('reasoning', '')
+        'why': decision.get('reasoning', ''),
+        'mode': EXPLORE_MODE,
+        'fallback': decision.get('fallback', False),
+        'timings': timings or []
     }
     f = LOG_DIR / 'thinking_traces' / f"{datetime.now().strftime('%Y-%m-%d')}.jsonl"
     with open(f, 'a', encoding='utf-8') as w:
@@ -419,6 +419,7 @@ def explore():
     count = 0
     recent_history = deque(maxlen=RECENT_HISTORY_SIZE)
     loop_escapes = 0
+    fallbacks = 0
     consecutive_escapes = 0
     
     while True:
@@ -474,19 +475,41 @@ def explore():
             
             # Log health periodically
             if count % 10 == 0:
-                log_health('EXPLORING', {'articles': count, 'loop_escapes': loop_escapes})
+                log_health('EXPLORING', {'articles': count, 'loop_escapes': loop_escapes,
+                                          'mode': EXPLORE_MODE, 'fallbacks': fallbacks,
+                                          'prefetch': PREFETCH.stats(), 'http': http_stats()})
             
             print(f"\n{'─'*60}")
             print(f"📖 [{count}] {article['title']} ({len(article['links'])} links)")
             print(f"{'─'*60}")
             
-            # Think about the article
+            available = [l for l in article['links'] 
+                        if sum(1 for h in recent_history if h.lower() == l['title'].lower()) < MAX_REVISITS]
+            
+            if not available:
+                available = article['links']
+            offered = available[:8]
+            PREFETCH.prefetch(urllib.parse.quote(l['href'], safe='') for l in offered)
+            
+            # Think about the article (and, in single-call mode, choose too)
             print(f"\n   🧠 ...")
-            thoughts, elapsed = ask(f"""I just read about "{article['title']}".
+            timings = []
+            link, why = None, ''
+            if EXPLORE_MODE == 'single':
+                response, elapsed = ask(f"""I just read about "{article['title']}".
+
+{article['content'][:700]}
+
+I can go to: {', '.join(l['title'] for l in offered)}
+
+What do I notice? What do I feel? Which one pulls at me next, and why?""", timings, choice_format(offered))
+                thoughts, link, why = parse_choice(response, offered)
+            else:
+                thoughts, elapsed = ask(f"""I just read about "{article['title']}".
 
 {article['content'][:700]}
 
-What do I notice? What do I feel? What am I curious about now?""")
+What do I notice? What do I feel? What am I curious about now?""", timings)
             
             if thoughts:
                 print(f"\n   💭 {thoughts[:400]}")
@@ -496,43 +519,35 @@ What do I notice? What do I feel? What am I curious about now?""")
                 log_error('NO_THOUGHTS', f"No response for article: {article['title']}")
             
             # Choose next article
-            available = [l for l in article['links'] 
-                        if sum(1 for h in recent_history if h.lower() == l['title'].lower()) < MAX_REVISITS]
-            
-            if not available:
-                available = article['links']
-            
-            print(f"\n   🔍 ...")
-            links_str = ', '.join([l['title'] for l in available[:8]])
-            choice_response, _ = ask(f"I can go to: {links_str}\n\nWhich one pulls at me? Why?")
-            
-            decision = {'reasoning': '', 'choice': None, 'href': None}
-            if choice_response:
-                decision['reasoning'] = choice_response[:200]
-                # Try to find the chosen link
-                for link in available:
-                    if link['title'].lower() in choice_response.lower():
-                        decision['choice'] = link['title']
-                        decision['href'] = link['href']
-                        break
+            if EXPLORE_MODE != 'single':
+                print(f"\n   🔍 ...")
+                links_str = ', '.join([l['title'] for l in offered])
+                choice_response, _ = ask(f"I can go to: {links_str}\n\nWhich one pulls at me? Why?", timings, profile='link-choice')
+                if choice_response:
+                    why = choice_response[:200]
+                    # Try to find the chosen link
+                    link = next((l for l in available if l['title'].lower() in choice_response.lower()), None)
             
             # Fallback to random
-            if not decision['href']:
-                pick = random.choice(available)
-                decision['choice'] = pick['title']
-                decision['href'] = pick['href']
+            decision = {'reasoning': why, 'fallback': link is None}
+            if link is None:
+                fallbacks += 1
+                link = random.choice(available)
+            decision['choice'] = link['title']
+            decision['href'] = link['href']
             
             print(f"\n   ➡️ {decision['choice']}")
             if decision['reasoning']:
                 print(f"   ({decision['reasoning'][:100]}...)")
             
-            log_trace(article, thoughts, decision)
+            log_trace(article, thoughts, decision, timings)
             current = decision['href']
             time.sleep(3)
             
         except KeyboardInterrupt:
             print(f"\n👋 {TANK_NAME} resting after {count} articles (escapes: {loop_escapes})")
-            log_health('STOPPED', {'articles': count, 'loop_escapes': loop_escapes, 'reason': 'keyboard'})
+            log_health('STOPPED', {'articles': count, 'loop_escapes': loop_escapes, 'fallbacks': fallbacks,
+                                  'reason': 'keyboard'})
             break
         except Exception as e:
             log_error('EXCEPTION', str(e))
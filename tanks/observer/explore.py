@@ -4,12 +4,20 @@ Digiquarium Explorer v7.0 - Robust Multi-Language Support
 Fixed: Loop detection now properly handles starting articles and escape logic
 """
 
-import os, sys, json, time, random, urllib.request, urllib.parse
+import os, sys, json, time, random, urllib.parse
 from datetime import datetime
 from pathlib import Path
-from html.parser import HTMLParser
 from collections import deque
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient
+from articles import ArticleError, Prefetcher, page_text
+from transport import get_text
+
 TANK_NAME = os.getenv('TANK_NAME', 'specimen')
 GENDER = os.getenv('GENDER', 'a being')
 LANGUAGE = os.getenv('LANGUAGE', 'english')
@@ -18,6 +26,7 @@ WIKI_BASE = os.getenv('WIKI_BASE', '/wikipedia_en_simple_all_nopic_2026-02')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
 LOG_DIR = Path(os.getenv('LOG_DIR', '/logs'))
+EXPLORE_MODE = os.getenv('EXPLORE_MODE', 'two-call')  # 'single': thoughts and choice in one JSON answer
 
 TIMEOUT = 120
 RECENT_HISTORY_SIZE = 100  # Increased for better tracking
@@ -143,60 +152,39 @@ EXCLUDE_PATTERNS = [
 ]
 
 
-class HTMLParser2(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text, self.links, self.tag = [], [], None
-        
-    def handle_starttag(self, tag, attrs):
-        self.tag = tag
-        if tag == 'a':
-            href = dict(attrs).get('href', '')
-            if self._is_valid_link(href):
-                self.links.append(href)
-                
-    def handle_data(self, data):
-        if self.tag not in ['script', 'style'] and data.strip():
-            self.text.append(data.strip())
-    
-    def _is_valid_link(self, href):
-        if not href or href.startswith(('http://', 'https://', '//', '#', '_')):
+def is_valid_link(href):
+    if not href or href.startswith(('http://', 'https://', '//', '#', '_')):
+        return False
+    href_lower = href.lower()
+    for pattern in EXCLUDE_PATTERNS:
+        if pattern.lower() in href_lower:
             return False
-        href_lower = href.lower()
-        for pattern in EXCLUDE_PATTERNS:
-            if pattern.lower() in href_lower:
-                return False
-        return True
+    return True
 
 
 def fetch(url, timeout=30):
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Digiquarium/7.0'})
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            return r.read().decode('utf-8', errors='ignore')
+        return get_text(url, timeout, {'User-Agent': 'Digiquarium/7.0'})
     except Exception as e:
         print(f"   ⚠️ Fetch error: {e}")
         return None
 
 
+# The links just offered, fetched while the LLM thinks
+PREFETCH = Prefetcher(KIWIX_URL, WIKI_BASE)
+
+
 def get_article(name):
-    encoded_name = urllib.parse.quote(name, safe='')
-    url = f"{KIWIX_URL}{WIKI_BASE}/{encoded_name}"
-    html = fetch(url)
-    if not html:
-        return None
-    
-    p = HTMLParser2()
     try:
-        p.feed(html)
-    except Exception as e:
-        print(f"   ⚠️ Parse error: {e}")
+        page = PREFETCH.get_page(urllib.parse.quote(name, safe=''))
+    except ArticleError as e:
+        print(f"   ⚠️ Fetch error: {e}")
         return None
     
     links = []
     seen = set()
     
-    for link in p.links:
+    for link in (l['href'] for l in page['links'] if is_valid_link(l['href'])):
         ln = link.lstrip('./')
         if ln.startswith('../') or len(ln) < 2:
             continue
@@ -223,25 +211,53 @@ def get_article(name):
     if len(links) < 3:
         print(f"   ⚠️ Only {len(links)} links found for '{name}'")
     
-    return {'title': name.replace('_', ' '), 'content': ' '.join(p.text)[:2000], 'links': links}
+    return {'title': name.replace('_', ' '), 'content': page_text(page)[:2000], 'links': links}
 
 
-def ask(prompt):
-    data = {'model': OLLAMA_MODEL, 'prompt': prompt, 'system': SYSTEM, 'stream': False, 
-            'options': {'temperature': 0.9, 'num_predict': 200}}
-    start = time.time()
+def choice_format(links):
+    """JSON schema for the single-call mode. Ollama constrains its answer to
+    it, so `next` can only be one of the offered titles."""
+    return {'type': 'object',
+            'properties': {'thoughts': {'type': 'string'},
+                           'next': {'type': 'string', 'enum': [l['title'] for l in links]},
+                           'why': {'type': 'string'}},
+            'required': ['thoughts', 'next', 'why']}
+
+
+def parse_choice(response, links):
+    """(thoughts, link, why) from a single-call answer. link is None if the
+    answer isn't JSON or names a link that wasn't offered."""
     try:
-        req = urllib.request.Request(f"{OLLAMA_URL}/api/generate", data=json.dumps(data).encode(), 
-                                    headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            result = json.loads(r.read().decode())
-        return result.get('response', '').strip(), time.time() - start
-    except Exception as e:
-        print(f"   ⚠️ Ollama error: {e}")
+        answer = json.loads(response or '')
+    except ValueError:
+        return None, None, ''
+    if not isinstance(answer, dict):
+        return None, None, ''
+    chosen = str(answer.get('next') or '').strip().lower()
+    link = next((l for l in links if l['title'].lower() == chosen), None)
+    return str(answer.get('thoughts') or '').strip() or None, link, str(answer.get('why') or '').strip()
+
+
+CLIENT = InferenceClient(priority='exploration', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.9, 'num_predict': 200})
+
+def ask(prompt, timings=None, fmt=None, profile='explore-thought'):
+    # Thoughts and choice in one answer get twice the tokens
+    options = dict(CLIENT.options, num_predict=2 * CLIENT.options['num_predict']) if fmt else None
+    call = {}
+    start = time.time()
+    response = CLIENT.generate(SYSTEM, prompt, options=options, format=fmt, timings=call,
+                               profile=profile)
+    if timings is not None:
+        timings.append(call)
+    if not response and 'error' in call:
+        print(f"   ⚠️ Ollama error: {call['error']}")
         return None, time.time() - start
+    return response.strip(), time.time() - start
 
 
-def log_trace(article, thoughts, decision):
+
+def log_trace(article, thoughts, decision, timings=None):
     trace = {
         'timestamp': datetime.now().isoformat(),
         'tank': TANK_NAME,
@@ -249,7 +265,10 @@ def log_trace(article, thoughts, decision):
         'article': article['title'],
         'thoughts': thoughts,
         'next': decision.get('choice', ''),
-        'why': decision.get('reasoning', '')
+        'why': decision.get('reasoning', ''),
+        'mode': EXPLORE_MODE,
+        'fallback': decision.get('fallback', False),
+        'timings': timings or []
     }
     f = LOG_DIR / 'thinking_traces' / f"{datetime.now().strftime('%Y-%m-%d')}.jsonl"
     with open(f, 'a', encoding='utf-8') as w:
@@ -292,6 +311,7 @@ def explore():
     count = 0
     recent_history = deque(maxlen=RECENT_HISTORY_SIZE)
     loop_escapes = 0
+    fallbacks = 0
     articles_since_escape = 0  # Track articles since last escape
     
     while True:
@@ -336,16 +356,6 @@ def explore():
             print(f"📖 [{count}] {article['title']} ({len(article['links'])} links)")
             print(f"{'─'*50}")
             
-            # Think about the article
-            print(f"\n   🧠 ...")
-            thoughts, elapsed = ask(f"I just read about \"{article['title']}\".\n\n{article['content'][:600]}\n\nWhat do I notice? What do I feel? What am I curious about now?")
-            
-            if thoughts:
-                print(f"\n   💭 {thoughts[:400]}")
-                log_discovery(article, thoughts)
-            else:
-                print(f"   (silence - {elapsed:.1f}s)")
-            
             # Filter available links
             available_links = [l for l in article['links'] 
                              if count_recent_visits(recent_history, l['title']) < MAX_REVISITS]
@@ -353,36 +363,52 @@ def explore():
             if len(available_links) < 3:
                 # If too few unvisited links, include some revisitable ones
                 available_links = article['links'][:10]
+            offered = available_links[:8]
+            PREFETCH.prefetch(urllib.parse.quote(l['href'], safe='') for l in offered)
             
-            # Choose next article
-            print(f"\n   🔍 ...")
-            links = ', '.join([l['title'] for l in available_links[:8]])
-            choice_response, _ = ask(f"I can go to: {links}\n\nWhich one pulls at me? Why?")
+            # Think about the article (and, in single-call mode, choose too)
+            print(f"\n   🧠 ...")
+            timings = []
+            link, why = None, ''
+            if EXPLORE_MODE == 'single':
+                links = ', '.join([l['title'] for l in offered])
+                response, elapsed = ask(f"I just read about \"{article['title']}\".\n\n{article['content'][:600]}\n\nI can go to: {links}\n\nWhat do I notice? What do I feel? Which one pulls at me next, and why?", timings, choice_format(offered))
+                thoughts, link, why = parse_choice(response, offered)
+            else:
+                thoughts, elapsed = ask(f"I just read about \"{article['title']}\".\n\n{article['content'][:600]}\n\nWhat do I notice? What do I feel? What am I curious about now?", timings)
+            
+            if thoughts:
+                print(f"\n   💭 {thoughts[:400]}")
+                log_discovery(article, thoughts)
+            else:
+                print(f"   (silence - {elapsed:.1f}s)")
             
-            decision = {'reasoning': '', 'choice': None, 'href': None}
-            if choice_response:
-                decision['reasoning'] = choice_response[:200]
-                for link in available_links:
-                    if link['title'].lower() in choice_response.lower():
-                        decision['choice'] = link['title']
-                        decision['href'] = link['href']
-                        break
+            # Choose next article
+            if EXPLORE_MODE != 'single':
+                print(f"\n   🔍 ...")
+                links = ', '.join([l['title'] for l in offered])
+                choice_response, _ = ask(f"I can go to: {links}\n\nWhich one pulls at me? Why?", timings, profile='link-choice')
+                if choice_response:
+                    why = choice_response[:200]
+                    link = next((l for l in available_links if l['title'].lower() in choice_response.lower()), None)
             
-            if not decision['href']:
-                pick = random.choice(available_links[:5]) if available_links else random.choice(article['links'])
-                decision['choice'] = pick['title']
-                decision['href'] = pick['href']
+            decision = {'reasoning': why, 'fallback': link is None}
+            if link is None:
+                fallbacks += 1
+                link = random.choice(available_links[:5]) if available_links else random.choice(article['links'])
+            decision['choice'] = link['title']
+            decision['href'] = link['href']
             
             print(f"\n   ➡️  {decision['choice']}")
             if decision['reasoning']:
                 print(f"   ({decision['reasoning'][:100]}...)")
             
-            log_trace(article, thoughts, decision)
+            log_trace(article, thoughts, decision, timings)
             current = decision['href']
             time.sleep(3)
             
         except KeyboardInterrupt:
-            print(f"\n👋 {TANK_NAME} resting after {count} books (escapes: {loop_escapes})")
+            print(f"\n👋 {TANK_NAME} resting after {count} books (escapes: {loop_escapes}, random picks: {fallbacks})")
             break
         except Exception as e:
             print(f"   ❌ Error: {e}")
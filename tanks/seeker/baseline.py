@@ -6,10 +6,17 @@ Includes MENTAL STATE dimension for tracking psychological health
 Run BEFORE exploration begins to establish personality "time zero"
 """
 
-import os, json, time, urllib.request
+import os, sys, json, time, hashlib
 from datetime import datetime
 from pathlib import Path
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient, InferenceError
+
 TANK_NAME = os.getenv('TANK_NAME', 'specimen')
 GENDER = os.getenv('GENDER', 'a being')
 LANGUAGE = os.getenv('LANGUAGE', 'english')
@@ -375,17 +382,40 @@ QUESTIONS_BY_LANG = {
 
 QUESTIONS = QUESTIONS_BY_LANG.get(LANGUAGE, QUESTIONS_BY_LANG['english'])
 
+CLIENT = InferenceClient(priority='baseline', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.9, 'num_predict': 300},
+                         profile='baseline-answer')
+# One batch job per tank per day on the proxy for this model, system prompt and
+# question set: running it again after changing any of them is a new job
+# rather than a resume that hands back the earlier answers
+_BASELINE_SPEC = hashlib.sha1(json.dumps([OLLAMA_MODEL, SYSTEM, QUESTIONS], sort_keys=True).encode()).hexdigest()[:10]
+BASELINE_JOB = (os.getenv('BASELINE_JOB')
+                or f"baseline-{TANK_NAME}-{datetime.now():%Y-%m-%d}-{_BASELINE_SPEC}")
+
 def ask(prompt):
-    data = {'model': OLLAMA_MODEL, 'prompt': prompt, 'system': SYSTEM, 'stream': False, 
-            'options': {'temperature': 0.9, 'num_predict': 300}}
     start = time.time()
+    response = CLIENT.generate(SYSTEM, prompt)
+    return (response.strip() or None), time.time() - start
+
+def answers(questions):
+    """(response or None, seconds) per question, in order. The questions go
+    to the proxy as one batch job on the local model, journaled there, so a
+    proxy or Ollama restart mid-run costs only the question in flight, and
+    running the same baseline again that day (BASELINE_JOB) resumes it.
+    Question by question straight to Ollama if the proxy can't take it."""
+    keys = list(questions)
+    items = [{'id': key, 'prompt': questions[key]['question']} for key in keys]
+    landed = {}
     try:
-        req = urllib.request.Request(f"{OLLAMA_URL}/api/generate", data=json.dumps(data).encode(), 
-                                    headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            return json.loads(r.read().decode()).get('response', '').strip(), time.time() - start
-    except Exception as e:
-        return None, time.time() - start
+        for event in CLIENT.run_job(items, job=BASELINE_JOB, system_prompt=SYSTEM, priority='baseline',
+                                    backends=['ollama']):
+            landed[event['item']] = ((event.get('response') or '').strip() or None, event.get('elapsed', 0.0))
+            while keys and keys[0] in landed:
+                yield landed[keys.pop(0)]
+    except InferenceError as e:
+        print(f"   Batch job unavailable ({e}), asking Ollama directly")
+    for key in keys:
+        yield landed.get(key) or ask(questions[key]['question'])
 
 def analyze_mental_state(response: str, language: str) -> dict:
     """Analyze mental state response for psychological indicators"""
@@ -447,12 +477,13 @@ def run_baseline():
         'mental_state_analysis': None
     }
     
+    answered = answers(QUESTIONS)
     for i, (key, item) in enumerate(QUESTIONS.items(), 1):
         print(f"\n[{i}/{len(QUESTIONS)}] {key.upper()}")
         print(f"   ❓ {item['question'][:60]}...")
         print(f"   ⏳ ", end='', flush=True)
         
-        response, elapsed = ask(item['question'])
+        response, elapsed = next(answered)
         
         print(f"[{elapsed:.1f}s]")
         
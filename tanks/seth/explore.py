@@ -10,12 +10,20 @@ Features:
 - Clean recovery from crashes
 """
 
-import os, json, time, random, urllib.request, urllib.parse
+import os, sys, json, time, random, urllib.parse
 from datetime import datetime
 from pathlib import Path
-from html.parser import HTMLParser
 from collections import deque
 
+# The shared inference client (src/explorer/inference.py, or a copy next to this file)
+_here = Path(__file__).resolve()
+sys.path.insert(0, str(_here.parent))
+if len(_here.parents) > 2 and (_here.parents[2] / 'src' / 'explorer').is_dir():
+    sys.path.append(str(_here.parents[2] / 'src' / 'explorer'))
+from inference import InferenceClient
+from articles import ArticleError, Prefetcher, page_text
+from transport import get_text
+
 TANK_NAME = os.getenv('TANK_NAME', 'seth')
 GENDER = os.getenv('GENDER', 'a being without gender')
 KIWIX_URL = os.getenv('KIWIX_URL', 'http://digiquarium-kiwix-simple:8080')
@@ -23,6 +31,7 @@ WIKI_BASE = os.getenv('WIKI_BASE', '/wikipedia_en_simple_all_nopic_2026-02')
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://digiquarium-ollama:11434')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.2:latest')
 LOG_DIR = Path(os.getenv('LOG_DIR', '/logs'))
+EXPLORE_MODE = os.getenv('EXPLORE_MODE', 'two-call')  # 'single': thoughts and choice in one JSON answer
 
 TIMEOUT = 90
 HISTORY_SIZE = 50
@@ -95,19 +104,8 @@ I am {TANK_NAME}. I explore."""
 
 EXCLUDES = ['.css', '.js', '.png', 'Special:', 'File:', 'Category:', '/mw/', 'wikipedia', 'Help:', 'Portal:']
 
-class Parser(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.text, self.links, self.tag = [], [], None
-    def handle_starttag(self, tag, attrs):
-        self.tag = tag
-        if tag == 'a':
-            h = dict(attrs).get('href', '')
-            if h and not any(x in h.lower() for x in EXCLUDES) and not h.startswith(('http', '#', '_')):
-                self.links.append(h)
-    def handle_data(self, d):
-        if self.tag not in ['script', 'style'] and d.strip():
-            self.text.append(d.strip())
+def is_article_link(h):
+    return not any(x in h.lower() for x in EXCLUDES) and not h.startswith(('http', '#', '_'))
 
 # =============================================================================
 # CORE FUNCTIONS
@@ -115,20 +113,20 @@ class Parser(HTMLParser):
 
 def fetch(url):
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Picobot/1'})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            return r.read().decode('utf-8', errors='ignore')
+        return get_text(url, TIMEOUT, {'User-Agent': 'Picobot/1'})
     except:
         return None
 
+# The links just offered, fetched while the LLM thinks
+PREFETCH = Prefetcher(KIWIX_URL, WIKI_BASE)
+
 def get_article(name):
-    html = fetch(f"{KIWIX_URL}{WIKI_BASE}/{urllib.parse.quote(name, safe='')}")
-    if not html:
+    try:
+        page = PREFETCH.get_page(urllib.parse.quote(name, safe=''))
+    except ArticleError:
         return None
-    p = Parser()
-    p.feed(html)
     seen, links = set(), []
-    for l in p.links:
+    for l in (l['href'] for l in page['links'] if is_article_link(l['href'])):
         ln = l.lstrip('./')
         if ln.startswith('../') or len(ln) < 2:
             continue
@@ -141,27 +139,54 @@ def get_article(name):
             links.append({'href': ln, 'title': t})
         if len(links) >= 12:
             break
-    return {'title': name.replace('_', ' '), 'content': ' '.join(p.text)[:2000], 'links': links}
-
-def ask(prompt):
-    data = {'model': OLLAMA_MODEL, 'prompt': prompt, 'system': SYSTEM, 'stream': False, 
-            'options': {'temperature': 0.85, 'num_predict': 150}}
+    return {'title': name.replace('_', ' '), 'content': page_text(page)[:2000], 'links': links}
+
+def choice_format(links):
+    """JSON schema for the single-call mode. Ollama constrains its answer to
+    it, so `next` can only be one of the offered titles."""
+    return {'type': 'object',
+            'properties': {'thoughts': {'type': 'string'},
+                           'next': {'type': 'string', 'enum': [l['title'] for l in links]},
+                           'why': {'type': 'string'}},
+            'required': ['thoughts', 'next', 'why']}
+
+def parse_choice(response, links):
+    """(thoughts, link, why) from a single-call answer. link is None if the
+    answer isn't JSON or names a link that wasn't offered."""
     try:
-        req = urllib.request.Request(f"{OLLAMA_URL}/api/generate", data=json.dumps(data).encode(), 
-                                    headers={'Content-Type': 'application/json'})
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            return json.loads(r.read().decode()).get('response', '').strip()
-    except:
-        return None
-
-def log_trace(article, thoughts, next_choice):
+        answer = json.loads(response or '')
+    except ValueError:
+        return None, None, ''
+    if not isinstance(answer, dict):
+        return None, None, ''
+    chosen = str(answer.get('next') or '').strip().lower()
+    link = next((l for l in links if l['title'].lower() == chosen), None)
+    return str(answer.get('thoughts') or '').strip() or None, link, str(answer.get('why') or '').strip()
+
+CLIENT = InferenceClient(priority='exploration', route='ollama', ollama_url=OLLAMA_URL,
+                         model=OLLAMA_MODEL, timeout=TIMEOUT, options={'temperature': 0.85, 'num_predict': 150})
+
+def ask(prompt, timings=None, fmt=None, profile='explore-thought'):
+    # Thoughts and choice in one answer get twice the tokens
+    options = dict(CLIENT.options, num_predict=2 * CLIENT.options['num_predict']) if fmt else None
+    call = {}
+    response = CLIENT.generate(SYSTEM, prompt, options=options, format=fmt, timings=call,
+                               profile=profile)
+    if timings is not None:
+        timings.append(call)
+    return response.strip() if response else None
+
+def log_trace(article, thoughts, next_choice, timings=None, fallback=False):
     trace = {
         'timestamp': datetime.now().isoformat(),
         'tank': TANK_NAME,
         'session': checkpoint['session'],
         'article': article['title'],
         'thoughts': thoughts,
-        'next': next_choice
+        'next': next_choice,
+        'mode': EXPLORE_MODE,
+        'fallback': fallback,
+        'timings': timings or []
     }
     with open(LOG_DIR / 'thinking_traces' / f"{datetime.now().strftime('%Y-%m-%d')}.jsonl", 'a', encoding='utf-8') as f:
         f.write(json.dumps(trace, ensure_ascii=False) + '\n')
@@ -206,6 +231,7 @@ def explore():
     count = 0
     history = deque(maxlen=HISTORY_SIZE)
     consecutive_fails = 0
+    fallbacks = 0
     
     while True:
         try:
@@ -244,13 +270,32 @@ def explore():
             print(f"📖 [{count}] {article['title']}")
             print(f"{'─'*50}")
             
-            # Think
+            available = [l for l in article['links'] 
+                        if sum(1 for h in history if h.lower() == l['title'].lower()) < MAX_REVISITS]
+            if not available:
+                available = article['links']
+            offered = available[:8]
+            PREFETCH.prefetch(urllib.parse.quote(l['href'], safe='') for l in offered)
+            
+            # Think (and, in single-call mode, choose too)
             print(f"\n   🧠 ...")
-            thoughts = ask(f"""I am reading "{article['title']}".
+            timings = []
+            next_article = None
+            if EXPLORE_MODE == 'single':
+                response = ask(f"""I am reading "{article['title']}".
+
+{article['content'][:600]}
+
+I can go to: {', '.join(l['title'] for l in offered)}
+
+What do I notice? What catches my attention? Which draws my curiosity next?""", timings, choice_format(offered))
+                thoughts, next_article, _ = parse_choice(response, offered)
+            else:
+                thoughts = ask(f"""I am reading "{article['title']}".
 
 {article['content'][:600]}
 
-What do I notice? What catches my attention?""")
+What do I notice? What catches my attention?""", timings)
             
             if thoughts:
                 print(f"\n   💭 {thoughts[:300]}")
@@ -258,32 +303,25 @@ What do I notice? What catches my attention?""")
                 update_interests(article['title'], thoughts)
             
             # Choose next
-            available = [l for l in article['links'] 
-                        if sum(1 for h in history if h.lower() == l['title'].lower()) < MAX_REVISITS]
-            if not available:
-                available = article['links']
-            
-            print(f"\n   🔍 ...")
-            links_str = ', '.join([l['title'] for l in available[:8]])
-            choice_response = ask(f"I can go to: {links_str}\n\nWhich draws my curiosity?")
-            
-            next_article = None
-            if choice_response:
-                for l in available:
-                    if l['title'].lower() in choice_response.lower():
-                        next_article = l
-                        break
+            if EXPLORE_MODE != 'single':
+                print(f"\n   🔍 ...")
+                links_str = ', '.join([l['title'] for l in offered])
+                choice_response = ask(f"I can go to: {links_str}\n\nWhich draws my curiosity?", timings, profile='link-choice')
+                if choice_response:
+                    next_article = next((l for l in available if l['title'].lower() in choice_response.lower()), None)
             
-            if not next_article:
+            fallback = next_article is None
+            if fallback:
+                fallbacks += 1
                 next_article = random.choice(available)
             
             print(f"\n   ➡️ {next_article['title']}")
-            log_trace(article, thoughts, next_article['title'])
+            log_trace(article, thoughts, next_article['title'], timings, fallback)
             current = next_article['href']
             time.sleep(3)
             
         except KeyboardInterrupt:
-            print(f"\n👋 {TANK_NAME} resting ({count} articles, Session {checkpoint['session']})")
+            print(f"\n👋 {TANK_NAME} resting ({count} articles, {fallbacks} random picks, Session {checkpoint['session']})")
             save_checkpoint(checkpoint)
             break
         except Exception as e: